@@ -11,9 +11,12 @@ Upgrades:
 - RandomForest tuned + probability calibration for better predict_proba
 - Rich evaluation (accuracy, macro-F1, log loss, per-class report)
 - Saves: model.pkl, label_encoder.pkl, symptom_columns.pkl, metadata.json, feature_importances.csv, confusion_matrix.csv
+- Exports a compiled (pure-NumPy) copy of the calibrated forest for serving, checked against sklearn
+- Publishes a versioned inference bundle (bundles/<version>/ + bundles/CURRENT) for the API
 """
 
 import os
+import sys
 import json
 import time
 import joblib
@@ -36,10 +39,17 @@ from sklearn.calibration import CalibratedClassifierCV
 BASE_DIR = os.getcwd()
 MODEL_DIR = os.path.join(BASE_DIR, "ML", "ML_TEST")
 os.makedirs(MODEL_DIR, exist_ok=True)
+sys.path.insert(0, BASE_DIR)  # run from Web/backend so `diagnosis` is importable
+
+from diagnosis.engine.compiled_forest import compile_calibrated_forest, check_parity
+from diagnosis.engine.bundle import build_bundle
+from diagnosis.engine.advice import build_auto_advice
 
 INPUT_DATA = os.path.join(MODEL_DIR, "magonjwa_ya_kuambukiza_dataset_swahili_full.csv")
 
 MODEL_PATH = os.path.join(MODEL_DIR, "magonjwa_model.pkl")
+COMPILED_MODEL_PATH = os.path.join(MODEL_DIR, "magonjwa_model_compiled.npz")
+BUNDLE_ROOT = os.path.join(MODEL_DIR, "bundles")
 SYMPTOMS_PATH = os.path.join(MODEL_DIR, "symptom_columns.pkl")
 LABEL_ENCODER_PATH = os.path.join(MODEL_DIR, "label_encoder.pkl")
 META_PATH = os.path.join(MODEL_DIR, "training_metadata.json")
@@ -196,8 +206,20 @@ joblib.dump(calibrated, MODEL_PATH)
 joblib.dump(feature_cols, SYMPTOMS_PATH)
 joblib.dump(le, LABEL_ENCODER_PATH)
 
+# ======================
+# Export compiled forest (serving path) + parity check against sklearn
+# ======================
+compiled = compile_calibrated_forest(calibrated)
+parity_diff = check_parity(compiled, calibrated, X_test.values, atol=1e-12)
+if parity_diff is None:
+    print("🧮 Compiled forest matches sklearn bit-for-bit on the test split")
+else:
+    print(f"🧮 Compiled forest max |diff| vs sklearn: {parity_diff:.3g}")
+compiled.save(COMPILED_MODEL_PATH)
+
 meta = {
     "model_path": MODEL_PATH,
+    "compiled_model_path": COMPILED_MODEL_PATH,
     "symptom_columns_path": SYMPTOMS_PATH,
     "label_encoder_path": LABEL_ENCODER_PATH,
     "data_path": INPUT_DATA,
@@ -218,7 +240,39 @@ meta = {
 with open(META_PATH, "w", encoding="utf-8") as f:
     json.dump(meta, f, ensure_ascii=False, indent=2)
 
+# ======================
+# Publish inference bundle (compiled forest + vocabulary + advice)
+# ======================
+sys.path.insert(0, MODEL_DIR)
+import ushauri  # noqa: E402
+
+class_labels = [str(c) for c in le.classes_]
+per_disease = X.groupby(y, sort=False).mean()
+bundle_version = build_bundle(
+    BUNDLE_ROOT,
+    forest=compiled,
+    symptom_columns=feature_cols,
+    class_labels=class_labels,
+    diseases=per_disease.index.tolist(),
+    disease_symptom_means=per_disease[feature_cols].to_numpy(),
+    advice={
+        "advice_db": ushauri.ADVICE_DB,
+        "default_advice": ushauri.DEFAULT_ADVICE,
+        "class_advice": {label: ushauri.advice_for(label) for label in class_labels},
+        # generated advice for every disease, so the API never rebuilds it per request
+        "auto_advice": build_auto_advice(per_disease.index.tolist(), feature_cols, per_disease[feature_cols].to_numpy()),
+    },
+    metadata={
+        "trained_at": meta["timestamp"],
+        "sklearn_version": sklearn.__version__,
+        "metrics": meta["metrics"],
+        "parity_max_diff": parity_diff,
+    },
+)
+
 print(f"✅ Model saved: {MODEL_PATH}")
+print(f"✅ Compiled model saved: {COMPILED_MODEL_PATH}")
+print(f"📦 Inference bundle published: {os.path.join(BUNDLE_ROOT, bundle_version)}")
 print(f"✅ Symptom columns saved: {SYMPTOMS_PATH}")
 print(f"✅ Label encoder saved: {LABEL_ENCODER_PATH}")
 print(f"🧾 Metadata saved: {META_PATH}")
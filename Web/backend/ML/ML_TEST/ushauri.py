@@ -14,6 +14,8 @@ Mtumiaji anapaswa kumwona mtaalamu wa afya kwa uchunguzi na tiba kamili, hasa
 ikiwa kuna DALILI ZA HATARI zilizoainishwa hapa.
 """
 from __future__ import annotations
+from copy import deepcopy
+from functools import lru_cache
 from typing import Dict, Any, List
 
 from rapidfuzz import process, fuzz
@@ -152,6 +154,19 @@ DEFAULT_ADVICE = {
 
 # build canonical lower->key map
 _CANONICAL = {k.lower(): k for k in ADVICE_DB.keys()}
+# lookup tables of the old per-call scans, built once (same first/last-wins order as the scans)
+_FIRST_BY_LOWER: Dict[str, str] = {}
+_SYNONYM_KEY: Dict[str, str] = {}
+_SYN_LIST: List[str] = []
+_SYN_MAP: Dict[str, str] = {}
+for _k, _v in ADVICE_DB.items():
+    _FIRST_BY_LOWER.setdefault(_k.strip().lower(), _k)
+    for _syn in _v.get("majina_mengine", []) or []:
+        _SYNONYM_KEY.setdefault((_syn or "").strip().lower(), _k)
+        if _syn:
+            _SYN_LIST.append(_syn)
+            _SYN_MAP[_syn] = _k
+_KEYS = list(ADVICE_DB.keys())
 
 
 def _normalize_str(s: str) -> str:
@@ -167,10 +182,16 @@ def normalize_disease_name(name: str) -> str:
       - underscore/space variants
       - synonyms listed under `majina_mengine`
       - fuzzy match against keys and synonyms (thresholds chosen to avoid false matches)
+
+    Answers are cached per name (ADVICE_DB is fixed once this module is imported).
     """
     if not name:
         return name
-    name_str = str(name).strip()
+    return _normalize_disease_name(str(name).strip())
+
+
+@lru_cache(maxsize=2048)
+def _normalize_disease_name(name_str: str) -> str:
     # exact key
     if name_str in ADVICE_DB:
         return name_str
@@ -186,32 +207,22 @@ def normalize_disease_name(name: str) -> str:
     if alt2 in ADVICE_DB:
         return alt2
     # synonyms
-    for k, v in ADVICE_DB.items():
-        for syn in v.get("majina_mengine", []) or []:
-            if _normalize_str(syn) == low:
-                return k
+    if low in _SYNONYM_KEY:
+        return _SYNONYM_KEY[low]
     # fuzzy match against keys
-    keys = list(ADVICE_DB.keys())
-    if keys:
-        best = process.extractOne(name_str, keys, scorer=fuzz.WRatio)
+    if _KEYS:
+        best = process.extractOne(name_str, _KEYS, scorer=fuzz.WRatio)
         if best:
             match_key, score, _ = best
             if score >= 86:
                 return match_key
     # fuzzy match against synonyms
-    syn_map = {}
-    syn_list = []
-    for k, v in ADVICE_DB.items():
-        for syn in v.get("majina_mengine", []) or []:
-            if syn:
-                syn_list.append(syn)
-                syn_map[syn] = k
-    if syn_list:
-        best = process.extractOne(name_str, syn_list, scorer=fuzz.WRatio)
+    if _SYN_LIST:
+        best = process.extractOne(name_str, _SYN_LIST, scorer=fuzz.WRatio)
         if best:
             match_syn, score, _ = best
             if score >= 88:
-                return syn_map.get(match_syn)
+                return _SYN_MAP.get(match_syn)
     # fallback to original name
     return name_str
 
@@ -224,19 +235,19 @@ def advice_for(disease: str) -> Dict[str, Any]:
     dnorm = normalize_disease_name(disease)
     data = ADVICE_DB.get(dnorm)
     if data:
-        # return a copy to avoid accidental modification
+        # return a deep copy so callers can edit the lists without touching ADVICE_DB
         out = {"ugonjwa": dnorm}
-        out.update(data)
+        out.update(deepcopy(data))
         return out
     # fallback: try case-insensitive match
-    for k, v in ADVICE_DB.items():
-        if _normalize_str(k) == _normalize_str(disease):
-            out = {"ugonjwa": k}
-            out.update(v)
-            return out
+    k = _FIRST_BY_LOWER.get(_normalize_str(disease))
+    if k is not None:
+        out = {"ugonjwa": k}
+        out.update(deepcopy(ADVICE_DB[k]))
+        return out
     # final fallback: DEFAULT_ADVICE
     out = {"ugonjwa": disease}
-    out.update(DEFAULT_ADVICE)
+    out.update(deepcopy(DEFAULT_ADVICE))
     return out
 
 
@@ -0,0 +1,42 @@
+"""
+JWT authentication for WebSocket connections.
+
+Browsers and the mobile apps cannot set an Authorization header on a
+WebSocket handshake, so the access token travels in the query string:
+`ws://host/ws/notifications/?token=<access token>`. A valid token sets
+`scope["user"]`; otherwise the session user (or AnonymousUser) from
+`AuthMiddlewareStack` is kept.
+"""
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+
+
+@database_sync_to_async
+def _user_for_token(raw_token: str):
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    async def __call__(self, scope, receive, send):
+        params = parse_qs(scope.get("query_string", b"").decode())
+        token = (params.get("token") or [None])[0]
+        if token:
+            user = await _user_for_token(token)
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
+
+
+def JWTAuthMiddlewareStack(inner):
+    """Session auth first, then a `?token=` JWT overrides the user when present."""
+    return AuthMiddlewareStack(JWTAuthMiddleware(inner))
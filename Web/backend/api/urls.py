@@ -20,6 +20,7 @@ urlpatterns = [
     path('sessions/device/', list_sessions, name='list_sessions_by_device'),
     path('sessions/user/', get_chat_sessions, name='list_sessions_by_user'),
     path('sessions/<str:session_id>/messages/', get_session_messages, name='get_session_messages'),
+    path('smart-doctor/metrics/', diagnosis_metrics, name='diagnosis_metrics'),
 
     # Pharmacy
     path('pharmacies/', pharmacy_list, name='pharmacy_list'),
@@ -46,6 +47,7 @@ urlpatterns = [
     path('availability/', doctor_availability_list_create, name='availability-list-create'),
     path('availability/<int:pk>/', doctor_availability_detail, name='availability-detail'),
     path('availability/available-doctors/', available_doctors, name='available-doctors'),
+    path('availability/free-slots/', free_slots, name='free-slots'),
 
 
     path('appointments/check-reminder/', check_upcoming_appointment, name='check_appointment_reminder'),
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from appointment.models import Appointment, DoctorAvailability, DoctorReport
+from appointment.models import Appointment, AppointmentReminder, DoctorAvailability, DoctorReport
 
 # Register your models here.
 admin.site.register(Appointment)
 admin.site.register(DoctorAvailability)
 admin.site.register(DoctorReport)
+admin.site.register(AppointmentReminder)
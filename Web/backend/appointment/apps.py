@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppointmentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointment'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (free-slot cache invalidation)
@@ -0,0 +1,42 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .notifications import no_upcoming_payload, upcoming_for, upcoming_payload, user_group
+
+
+class NotificationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    One socket per logged-in user (ws/notifications/?token=<JWT access token>).
+
+    Sends {"event": ..., "payload": ...} messages: the current upcoming
+    appointment right after connecting, then pushes from the scheduler and
+    the appointment signals (see appointment.notifications).
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.group_name = user_group(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        await self.send_json({"event": "appointment.upcoming", "payload": await self._snapshot(user)})
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'group_name', None):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # clients may ask again, e.g. after resuming from background
+        if content.get('action') == 'check_upcoming':
+            await self.send_json({"event": "appointment.upcoming", "payload": await self._snapshot(self.scope['user'])})
+
+    # Receive event from group
+    async def notify(self, event):
+        await self.send_json({"event": event['event'], "payload": event['payload']})
+
+    @database_sync_to_async
+    def _snapshot(self, user):
+        appointment = upcoming_for(user)
+        return upcoming_payload(appointment, user.id) if appointment else no_upcoming_payload()
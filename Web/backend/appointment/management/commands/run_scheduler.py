@@ -0,0 +1,89 @@
+# appointment/management/commands/run_scheduler.py
+
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from appointment import reminders
+from appointment.scheduler import OFFSETS, RESYNC_SECONDS, SCHEDULER_GROUP, ReminderScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the appointment reminder scheduler: keeps upcoming confirmed appointments in a timer '
+        'wheel and e-mails each reminder at its offset (replaces the per-minute cron job).'
+    )
+    # system checks import the URLconf (and with it the whole diagnosis stack); not needed here
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offsets', type=int, nargs='+', default=OFFSETS,
+                            help='Reminder offsets in minutes before the appointment (default APPOINTMENT_REMINDER_OFFSETS).')
+        parser.add_argument('--resync', type=float, default=RESYNC_SECONDS,
+                            help='Seconds between full reloads from the database.')
+        parser.add_argument('--tick', type=float, default=1.0, help='Timer resolution in seconds.')
+        parser.add_argument('--backend', default=None,
+                            help='Mail backend: smtp, console, file, locmem or a dotted path.')
+        parser.add_argument('--file-path', default=None, help='Directory for --backend file.')
+        parser.add_argument('--workers', type=int, default=reminders.WORKERS, help='Parallel mail connections.')
+
+    def handle(self, *args, **options):
+        dispatch_options = {'backend': options['backend'], 'workers': options['workers']}
+        if options['file_path']:
+            dispatch_options['file_path'] = options['file_path']
+        scheduler = ReminderScheduler(
+            offsets=options['offsets'], resync_seconds=options['resync'], tick=options['tick'], **dispatch_options,
+        )
+        offsets = ", ".join(f"{o} min" for o in scheduler.offsets)
+        self.stdout.write(f"⏰ Reminder scheduler started (offsets: {offsets}).")
+        try:
+            asyncio.run(self._run(scheduler))
+        except KeyboardInterrupt:
+            self.stdout.write("👋 Reminder scheduler stopped.")
+
+    async def _run(self, scheduler: ReminderScheduler):
+        layer = get_channel_layer()
+        channel = await layer.new_channel() if layer is not None else None
+        if channel is None:
+            self.stdout.write(self.style.WARNING(
+                "⚠️ No channel layer configured; changes are only picked up by the periodic resync."))
+
+        next_resync = 0.0
+        while True:
+            now = time.time()
+            if now >= next_resync:
+                if channel is not None:
+                    # (re)join every resync: group membership expires in the channel layer
+                    try:
+                        await layer.group_add(SCHEDULER_GROUP, channel)
+                    except Exception as e:
+                        self.stderr.write(f"❌ Channel layer error: {e}")
+                count = await sync_to_async(scheduler.resync)()
+                self.stdout.write(f"🔄 Resynced: {count} reminder(s) scheduled.")
+                next_resync = now + scheduler.resync_seconds
+
+            for result in await sync_to_async(scheduler.fire)():
+                if result.sent:
+                    self.stdout.write(self.style.SUCCESS(f"✅ Sent {result.sent} reminder(s)."))
+                if result.failed:
+                    self.stdout.write(self.style.WARNING(f"⚠️ {result.failed} reminder(s) failed; retrying."))
+
+            # sleep until the next tick, waking early for appointment changes
+            timeout = scheduler.wheel.tick - (time.time() % scheduler.wheel.tick)
+            if channel is None:
+                await asyncio.sleep(timeout)
+                continue
+            try:
+                message = await asyncio.wait_for(layer.receive(channel), timeout)
+            except asyncio.TimeoutError:
+                continue
+            except Exception as e:
+                # channel layer unreachable: keep firing timers, the resync catches up on changes
+                self.stderr.write(f"❌ Channel layer error: {e}")
+                await asyncio.sleep(timeout)
+                continue
+            if message.get("type") == "appointment.changed":
+                await sync_to_async(scheduler.refresh)(message["id"], message.get("deleted", False))
@@ -1,54 +1,53 @@
 # appointments/management/commands/send_appointment_reminders.py
 
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from datetime import timedelta
-from appointment.models import Appointment
-from django.core.mail import send_mail
+
+from appointment import reminders
+
 
 class Command(BaseCommand):
-    help = 'Send email reminders for upcoming appointments 10 minutes before they start.'
-
-    def handle(self, *args, **kwargs):
-        now = timezone.localtime()
-        ten_minutes_later = now + timedelta(minutes=10)
-
-        # Match appointments that start exactly in 10 minutes
-        appointments = Appointment.objects.filter(
-            date=ten_minutes_later.date(),
-            time__hour=ten_minutes_later.hour,
-            time__minute=ten_minutes_later.minute,
-            is_confirmed=True,
-            status='Pending'
+    help = (
+        'Send email reminders for confirmed appointments starting within the next N minutes '
+        '(default 10) that have not been reminded yet. Safe to run late or repeatedly.'
+    )
+    # system checks import the URLconf (and with it the whole diagnosis stack); not needed here
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=10,
+                            help='Reminder offset: remind appointments starting within this many minutes.')
+        parser.add_argument('--backend', default=None,
+                            help='Mail backend: smtp, console, file, locmem or a dotted path '
+                                 '(default APPOINTMENT_REMINDER_EMAIL_BACKEND / EMAIL_BACKEND).')
+        parser.add_argument('--file-path', default=None,
+                            help='Directory for --backend file (default EMAIL_FILE_PATH or ./sent_emails).')
+        parser.add_argument('--workers', type=int, default=reminders.WORKERS,
+                            help='Parallel mail connections.')
+        parser.add_argument('--batch-size', type=int, default=reminders.BATCH_SIZE,
+                            help='Appointments sent per connection.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count due reminders; send and record nothing.')
+
+    def handle(self, *args, **options):
+        minutes = options['minutes']
+        backend_options = {'file_path': options['file_path']} if options['file_path'] else {}
+
+        self.stdout.write(f"🔍 Checking for appointments starting within {minutes} minutes...")
+        result = reminders.dispatch(
+            minutes,
+            backend=options['backend'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+            **backend_options,
         )
 
-        self.stdout.write("🔍 Checking for upcoming appointments 10 minutes ahead...")
-
-        if not appointments.exists():
+        if not result.due:
             self.stdout.write("✅ No matching appointments found.")
-            return
-
-        for appt in appointments:
-            user_email = appt.user.email
-            doctor_email = appt.doctor.email
-            time_str = appt.time.strftime('%H:%M')
-
-            # Send email to user
-            send_mail(
-                subject="⏰ Appointment Reminder",
-                message=f"Hi {appt.user.full_name},\n\nThis is a reminder of your appointment with Dr. {appt.doctor.full_name} at {time_str} today.",
-                from_email="noreply@yourdomain.com",
-                recipient_list=[user_email],
-                fail_silently=False,
-            )
-
-            # Send email to doctor
-            send_mail(
-                subject="⏰ Appointment Reminder",
-                message=f"Dear Dr. {appt.doctor.full_name},\n\nYou have an upcoming appointment with {appt.user.full_name} at {time_str} today.",
-                from_email="noreply@gmail.com",
-                recipient_list=[doctor_email],
-                fail_silently=False,
-            )
-
-        self.stdout.write(self.style.SUCCESS(f"✅ Sent {appointments.count()} reminder(s)."))
+        elif options['dry_run']:
+            self.stdout.write(f"📝 {result.due} reminder(s) due (dry run, nothing sent).")
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✅ Sent {result.sent} reminder(s)."))
+            if result.failed:
+                self.stdout.write(self.style.WARNING(
+                    f"⚠️ {result.failed} reminder(s) failed and will be retried on the next run."))
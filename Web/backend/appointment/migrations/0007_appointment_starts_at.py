@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-17 12:00
+
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_starts_at(apps, schema_editor):
+    Appointment = apps.get_model('appointment', 'Appointment')
+    tz = timezone.get_default_timezone()
+    length = timedelta(minutes=getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 30))
+    batch = []
+    for appt in Appointment.objects.filter(starts_at__isnull=True).only('id', 'date', 'time').iterator(chunk_size=2000):
+        appt.starts_at = timezone.make_aware(datetime.combine(appt.date, appt.time), tz)
+        appt.ends_at = appt.starts_at + length
+        batch.append(appt)
+        if len(batch) >= 1000:
+            Appointment.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ['starts_at', 'ends_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0006_appointmentreminder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='ends_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_starts_at, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='appointment',
+            options={'ordering': ['-starts_at']},
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'starts_at'], name='appt_doctor_starts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['user', 'starts_at'], name='appt_user_starts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['starts_at'], name='appt_starts_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-18 09:00
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_reminder_starts_at(apps, schema_editor):
+    Appointment = apps.get_model('appointment', 'Appointment')
+    AppointmentReminder = apps.get_model('appointment', 'AppointmentReminder')
+    AppointmentReminder.objects.filter(starts_at__isnull=True).update(
+        starts_at=Subquery(Appointment.objects.filter(pk=OuterRef('appointment_id')).values('starts_at')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointment', '0007_appointment_starts_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentreminder',
+            name='starts_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_reminder_starts_at, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='appointmentreminder',
+            unique_together={('appointment', 'offset_minutes', 'starts_at')},
+        ),
+    ]
@@ -9,6 +9,21 @@ from account.models import Doctor
 
 from django.db import models
 from django.conf import settings
+from datetime import date as dt_date, datetime, time as dt_time, timedelta
+from django.utils.dateparse import parse_date, parse_time
+
+
+def appointment_bounds(date, time):
+    """Aware (starts_at, ends_at) of an appointment booked for local `date` at `time`."""
+    if date is None or time is None:
+        return None, None
+    if not isinstance(date, dt_date):
+        date = parse_date(str(date))
+    if not isinstance(time, dt_time):
+        time = parse_time(str(time))
+    starts_at = timezone.make_aware(datetime.combine(date, time), timezone.get_default_timezone())
+    return starts_at, starts_at + timedelta(minutes=getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 30))
+
 
 class Appointment(models.Model):
     STATUS_CHOICES = [
@@ -43,6 +58,10 @@ class Appointment(models.Model):
         default=False
     )
     notes = models.TextField(blank=True)
+
+    # ✅ date + time as one aware timestamp (kept in sync in save()) for indexed range queries
+    starts_at = models.DateTimeField(null=True, blank=True, editable=False)
+    ends_at = models.DateTimeField(null=True, blank=True, editable=False)
     
     # ✅ New status field
     status = models.CharField(
@@ -54,14 +73,45 @@ class Appointment(models.Model):
 
     class Meta:
         unique_together = ['doctor', 'date', 'time']  # Avoid double bookings
-        ordering = ['-date', '-time']  # Latest appointment first
+        ordering = ['-starts_at']  # Latest appointment first
+        indexes = [
+            models.Index(fields=['doctor', 'starts_at'], name='appt_doctor_starts_idx'),
+            models.Index(fields=['user', 'starts_at'], name='appt_user_starts_idx'),
+            models.Index(fields=['starts_at'], name='appt_starts_idx'),  # reminder / scheduler windows
+        ]
 
     def __str__(self):
         return f"Appointment: {self.user.full_name} with Dr. {self.doctor.full_name} on {self.date} at {self.time}"
+
+    def save(self, *args, **kwargs):
+        self.starts_at, self.ends_at = appointment_bounds(self.date, self.time)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'date', 'time'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'starts_at', 'ends_at'}
+        super().save(*args, **kwargs)
     
 
 
 
+class AppointmentReminder(models.Model):
+    """Marks that the reminder `offset_minutes` before an appointment went out (one row per offset and start time)."""
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name='reminders'
+    )
+    offset_minutes = models.PositiveIntegerField()
+    # the appointment start this reminder was for; a rescheduled appointment is reminded again
+    starts_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['appointment', 'offset_minutes', 'starts_at']  # each reminder is sent once
+
+    def __str__(self):
+        return f"Reminder {self.offset_minutes} min before appointment {self.appointment_id} (sent {self.sent_at})"
+
+
 class DoctorAvailability(models.Model):
     class Status(models.TextChoices):
         AVAILABLE = 'available', _('Available')
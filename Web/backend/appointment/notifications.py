@@ -0,0 +1,97 @@
+"""
+Per-user appointment notifications over Channels.
+
+Every connected user's `NotificationConsumer` joins `user_group(user id)`.
+Two kinds of events are pushed to the patient and the doctor:
+
+- "appointment.upcoming": the appointment starts within UPCOMING_MINUTES,
+  sent by the reminder scheduler when that moment comes (and once on connect);
+- "appointment.status": its status or confirmation changed (post_save signal).
+
+The payload of "appointment.upcoming" matches the `check_upcoming_appointment`
+response, which clients used to poll for.
+"""
+import logging
+from datetime import timedelta
+from typing import Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Appointment
+
+logger = logging.getLogger(__name__)
+
+UPCOMING_MINUTES = getattr(settings, "APPOINTMENT_UPCOMING_MINUTES", 40)
+
+
+def user_group(user_id: int) -> str:
+    return f"notifications_user_{user_id}"
+
+
+# -------------------------
+# Payloads
+# -------------------------
+def upcoming_for(user, now=None) -> Optional[Appointment]:
+    """The user's next confirmed, pending appointment (as patient or doctor) within UPCOMING_MINUTES."""
+    now = now or timezone.now()
+    window = Appointment.objects.filter(
+        starts_at__gte=now,
+        starts_at__lte=now + timedelta(minutes=UPCOMING_MINUTES),
+        is_confirmed=True,
+        status='Pending'
+    ).select_related('user', 'doctor').order_by('starts_at')
+    # one range scan per (user, starts_at) / (doctor, starts_at) index instead of an OR
+    found = [a for a in (window.filter(user=user).first(), window.filter(doctor=user).first()) if a]
+    return min(found, key=lambda a: a.starts_at) if found else None
+
+
+def upcoming_payload(appointment: Appointment, user_id: int) -> dict:
+    time_str = appointment.time.strftime('%H:%M')
+    day = "today" if appointment.date == timezone.localdate() else "tomorrow"   # the window can cross midnight
+    if appointment.doctor_id == user_id:
+        message = f"You have an appointment with patient {appointment.user.full_name} at {time_str} {day}."
+    else:
+        message = f"You have an appointment with Dr. {appointment.doctor.full_name} at {time_str} {day}."
+    return {"upcoming": True, "id": appointment.id, "message": message}
+
+
+def no_upcoming_payload() -> dict:
+    return {"upcoming": False, "message": f"No upcoming appointment in the next {UPCOMING_MINUTES} minutes."}
+
+
+def status_payload(appointment: Appointment) -> dict:
+    return {
+        "id": appointment.id,
+        "status": appointment.status,
+        "is_confirmed": appointment.is_confirmed,
+        "date": str(appointment.date),
+        "time": str(appointment.time)[:5],
+    }
+
+
+# -------------------------
+# Publishing
+# -------------------------
+def push(user_id: int, event: str, payload: dict):
+    """Send one event to every open notification socket of a user."""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(user_group(user_id), {"type": "notify", "event": event, "payload": payload})
+    except Exception:
+        logger.warning("Could not push %s to user %s", event, user_id, exc_info=True)
+
+
+def notify_upcoming(appointment: Appointment):
+    for user_id in (appointment.user_id, appointment.doctor_id):
+        push(user_id, "appointment.upcoming", upcoming_payload(appointment, user_id))
+
+
+def notify_status(appointment: Appointment):
+    payload = status_payload(appointment)
+    for user_id in (appointment.user_id, appointment.doctor_id):
+        push(user_id, "appointment.status", payload)
@@ -0,0 +1,219 @@
+"""
+Appointment reminder e-mails.
+
+`dispatch(offset_minutes)` sends the reminder for every confirmed, pending
+appointment that starts within the next `offset_minutes` and has no
+`AppointmentReminder` row for that offset and its current start time yet
+(moving an appointment re-arms its reminders). Because the query is a
+window rather than an exact minute, a late or skipped run still catches
+up.
+
+Reminders are claimed in the database before anything is sent: the due
+appointments are locked with `SELECT ... FOR UPDATE SKIP LOCKED` and their
+`AppointmentReminder` rows are inserted in the same short transaction
+(conflicting rows are ignored and only the rows stamped by this run are
+kept), so concurrent runs in other processes never send the same reminder
+twice.
+
+Messages are sent in chunks by a small thread pool. Each worker opens one
+mail connection and sends its whole chunk with `send_messages`. Both
+messages of an appointment (patient and doctor) are in the same chunk. The
+claims of a chunk that failed are deleted again, so the next run retries
+it; a process killed between claim and send loses those reminders (at most
+once, never twice).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Appointment, AppointmentReminder
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, "APPOINTMENT_REMINDER_BATCH_SIZE", 50)
+WORKERS = getattr(settings, "APPOINTMENT_REMINDER_WORKERS", 4)
+EMAIL_BACKEND = getattr(settings, "APPOINTMENT_REMINDER_EMAIL_BACKEND", None)
+FILE_PATH = "sent_emails"   # file backend directory when EMAIL_FILE_PATH is not set
+
+# short aliases accepted by --backend / APPOINTMENT_REMINDER_EMAIL_BACKEND
+BACKENDS = {
+    "smtp": "django.core.mail.backends.smtp.EmailBackend",
+    "console": "django.core.mail.backends.console.EmailBackend",
+    "file": "django.core.mail.backends.filebased.EmailBackend",
+    "locmem": "django.core.mail.backends.locmem.EmailBackend",
+}
+
+
+class DispatchResult:
+    def __init__(self, due: int = 0, sent: int = 0, failed: int = 0,
+                 sent_ids: Optional[List[int]] = None, failed_ids: Optional[List[int]] = None):
+        self.due = due
+        self.sent = sent
+        self.failed = failed
+        self.sent_ids = sent_ids or []
+        self.failed_ids = failed_ids or []
+
+    def __repr__(self):
+        return f"DispatchResult(due={self.due}, sent={self.sent}, failed={self.failed})"
+
+
+# -------------------------
+# Query
+# -------------------------
+def due_appointments(offset_minutes: int, now: Optional[datetime] = None):
+    """Confirmed, pending appointments starting within `offset_minutes` that were not reminded yet."""
+    now = now or timezone.now()
+    already_sent = AppointmentReminder.objects.filter(
+        appointment=OuterRef("pk"), offset_minutes=offset_minutes, starts_at=OuterRef("starts_at"))
+    return (
+        Appointment.objects
+        .filter(starts_at__gt=now, starts_at__lte=now + timedelta(minutes=offset_minutes),
+                is_confirmed=True, status='Pending')
+        .filter(~Exists(already_sent))
+        .select_related("user", "doctor")
+        .order_by("starts_at")
+    )
+
+
+# -------------------------
+# Messages
+# -------------------------
+def _when(appt: Appointment, today) -> str:
+    time_str = appt.time.strftime('%H:%M')
+    if appt.date == today:
+        return f"at {time_str} today"
+    if appt.date == today + timedelta(days=1):
+        return f"at {time_str} tomorrow"
+    return f"on {appt.date:%d %b %Y} at {time_str}"
+
+
+def build_messages(appt: Appointment, today, from_email: Optional[str] = None) -> List[EmailMessage]:
+    from_email = from_email or settings.DEFAULT_FROM_EMAIL
+    when = _when(appt, today)
+    return [
+        EmailMessage(
+            subject="⏰ Appointment Reminder",
+            body=f"Hi {appt.user.full_name},\n\nThis is a reminder of your appointment with Dr. {appt.doctor.full_name} {when}.",
+            from_email=from_email,
+            to=[appt.user.email],
+        ),
+        EmailMessage(
+            subject="⏰ Appointment Reminder",
+            body=f"Dear Dr. {appt.doctor.full_name},\n\nYou have an upcoming appointment with {appt.user.full_name} {when}.",
+            from_email=from_email,
+            to=[appt.doctor.email],
+        ),
+    ]
+
+
+def open_connection(backend: Optional[str] = None, **kwargs):
+    """Mail connection for `backend` (alias or dotted path); default: the reminder / project setting."""
+    backend = BACKENDS.get(backend or EMAIL_BACKEND, backend or EMAIL_BACKEND)
+    if backend == BACKENDS["file"] and not kwargs.get("file_path"):
+        kwargs["file_path"] = getattr(settings, "EMAIL_FILE_PATH", None) or FILE_PATH
+    return get_connection(backend, **kwargs)
+
+
+# -------------------------
+# Sending
+# -------------------------
+def _send_chunk(chunk: Sequence[Appointment], today, backend: Optional[str], backend_options: dict) -> List[int]:
+    """Send one chunk over one connection; returns the ids of the appointments that went out."""
+    messages = [m for appt in chunk for m in build_messages(appt, today)]
+    connection = open_connection(backend, **backend_options)
+    try:
+        connection.send_messages(messages)
+    except Exception:
+        logger.exception("Sending %d appointment reminder(s) failed", len(chunk))
+        return []
+    finally:
+        connection.close()
+    return [appt.pk for appt in chunk]
+
+
+def _chunks(items: Sequence, size: int) -> Iterable[Sequence]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def claim(offset_minutes: int, now: datetime, appointment_ids: Optional[Iterable[int]] = None) -> List[Appointment]:
+    """Lock the due appointments and write their reminder rows; returns the ones this run owns.
+
+    Rows another run is claiming right now are skipped (`skip_locked`). A row
+    another run already claimed is left alone by the unique (appointment,
+    offset, starts_at) constraint (`ignore_conflicts`), and only the rows
+    stamped with this run's `now` are kept, so two overlapping runs (cron +
+    scheduler, two cron ticks) never send the same reminder and one conflict
+    does not hold back the rest.
+    """
+    qs = due_appointments(offset_minutes, now)
+    if appointment_ids is not None:
+        qs = qs.filter(pk__in=list(appointment_ids))
+    with transaction.atomic():
+        appointments = list(qs.select_for_update(skip_locked=True, of=("self",)))
+        if not appointments:
+            return []
+        AppointmentReminder.objects.bulk_create([
+            AppointmentReminder(appointment_id=appt.pk, offset_minutes=offset_minutes,
+                                starts_at=appt.starts_at, sent_at=now)
+            for appt in appointments
+        ], ignore_conflicts=True)
+        owned = set(AppointmentReminder.objects.filter(
+            appointment_id__in=[appt.pk for appt in appointments], offset_minutes=offset_minutes, sent_at=now,
+        ).values_list("appointment_id", "starts_at"))
+    skipped = len(appointments) - len(owned)
+    if skipped:
+        logger.info("%d reminder(s) %d min ahead were claimed by another run", skipped, offset_minutes)
+    return [appt for appt in appointments if (appt.pk, appt.starts_at) in owned]
+
+
+def dispatch(offset_minutes: int, now: Optional[datetime] = None, backend: Optional[str] = None,
+             batch_size: int = BATCH_SIZE, workers: int = WORKERS, dry_run: bool = False,
+             appointment_ids: Optional[Iterable[int]] = None, **backend_options) -> DispatchResult:
+    """Send every due reminder for `offset_minutes` and record the ones that went out.
+
+    `appointment_ids` limits the run to those appointments (the scheduler fires known timers).
+    """
+    now = timezone.localtime(now)
+    if dry_run:
+        qs = due_appointments(offset_minutes, now)
+        if appointment_ids is not None:
+            qs = qs.filter(pk__in=list(appointment_ids))
+        return DispatchResult(due=qs.count())
+
+    appointments = claim(offset_minutes, now, appointment_ids)
+    result = DispatchResult(due=len(appointments))
+    if not appointments:
+        return result
+
+    chunks = list(_chunks(appointments, max(1, batch_size)))
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks))),
+                            thread_name_prefix="appointment-reminder") as pool:
+        sent_ids = [
+            pk
+            for ids in pool.map(lambda c: _send_chunk(c, now.date(), backend, backend_options), chunks)
+            for pk in ids
+        ]
+
+    sent = set(sent_ids)
+    result.sent_ids = sent_ids
+    result.failed_ids = [appt.pk for appt in appointments if appt.pk not in sent]
+    result.sent = len(sent_ids)
+    result.failed = len(result.failed_ids)
+    if sent_ids:
+        AppointmentReminder.objects.filter(
+            appointment_id__in=sent_ids, offset_minutes=offset_minutes, sent_at=now,
+        ).update(sent_at=timezone.now())
+    if result.failed_ids:
+        # release the claims so the next run (or the scheduler's retry) sends them
+        AppointmentReminder.objects.filter(
+            appointment_id__in=result.failed_ids, offset_minutes=offset_minutes, sent_at=now,
+        ).delete()
+    return result
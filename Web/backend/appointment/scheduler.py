@@ -0,0 +1,170 @@
+"""
+In-process reminder scheduler (see the `run_scheduler` command).
+
+Every upcoming confirmed appointment gets one timer per reminder offset
+(APPOINTMENT_REMINDER_OFFSETS, e.g. 24h / 1h / 10m before it starts) in a
+hashed timer wheel. When a timer fires, the reminder goes out through
+`reminders.dispatch`, which re-checks the appointment and records the
+send, so the cron command and the scheduler never double-send.
+
+The wheel is refreshed incrementally: saving or deleting an Appointment
+publishes its id to the SCHEDULER_GROUP channel-layer group (see
+`appointment.signals`), and the scheduler re-plans just that appointment.
+A periodic full resync covers messages lost while it was down and pulls in
+appointments as they come within the horizon.
+
+Offsets that are already past when an appointment is planned (booked late)
+collapse into one reminder: only the smallest past offset is sent, right
+away, and only if no smaller offset has been sent before.
+
+The same wheel carries one more timer per appointment, UPCOMING_MINUTES
+before it starts, which pushes "appointment.upcoming" to the patient's and
+doctor's notification sockets (`appointment.notifications`).
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import notifications, reminders
+from .models import Appointment, AppointmentReminder
+from .timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+OFFSETS = getattr(settings, "APPOINTMENT_REMINDER_OFFSETS", [24 * 60, 60, 10])
+RESYNC_SECONDS = getattr(settings, "APPOINTMENT_SCHEDULER_RESYNC_SECONDS", 5 * 60)
+RETRY_SECONDS = 60
+SCHEDULER_GROUP = "appointment-scheduler"
+UPCOMING = "upcoming"   # timer key of the socket push, next to the integer reminder offsets
+
+
+def plan(start: float, sent: Set[int], offsets: Sequence[int], now: float) -> List[Tuple[int, float]]:
+    """`(offset, fire_at)` timers for an appointment starting at `start` (epoch seconds)."""
+    if start <= now:
+        return []
+    timers = []
+    late = None
+    for offset in sorted(offsets, reverse=True):
+        fire_at = start - offset * 60
+        if fire_at > now:
+            if offset not in sent:
+                timers.append((offset, fire_at))
+        else:
+            late = offset   # smallest offset whose moment has passed
+    if late is not None and late not in sent and not any(o < late for o in sent):
+        timers.append((late, now))
+    return timers
+
+
+class ReminderScheduler:
+    """Timer wheel of `(appointment id, offset)` reminders plus the bookkeeping to refresh it."""
+
+    def __init__(self, offsets: Iterable[int] = OFFSETS, resync_seconds: float = RESYNC_SECONDS,
+                 tick: float = 1.0, upcoming_minutes: Optional[int] = notifications.UPCOMING_MINUTES,
+                 **dispatch_options):
+        self.offsets = sorted({int(o) for o in offsets}, reverse=True)
+        self.upcoming_minutes = upcoming_minutes or 0
+        self.resync_seconds = resync_seconds
+        self.wheel = TimerWheel(tick=tick, now=time.time())
+        self.dispatch_options = dispatch_options
+        self._timers: Dict[int, List[Tuple[int, object]]] = {}
+        self._pushed: Dict[int, float] = {}   # appointment id -> start time its "upcoming" push was for
+
+    # -------------------------
+    # Planning
+    # -------------------------
+    def _upcoming(self, now: datetime):
+        # one resync of slack so nothing crosses into the horizon unseen
+        ahead = timedelta(minutes=max(self.offsets + [self.upcoming_minutes]), seconds=self.resync_seconds)
+        return Appointment.objects.filter(
+            starts_at__gt=now, starts_at__lte=now + ahead, is_confirmed=True, status='Pending',
+        ).only("id", "starts_at")
+
+    def _add(self, appointments: List[Appointment], now: float):
+        starts = {a.pk: a.starts_at for a in appointments}
+        sent: Dict[int, Set[int]] = {}
+        for appointment_id, offset, reminded_start in AppointmentReminder.objects.filter(
+                appointment_id__in=list(starts)).values_list("appointment_id", "offset_minutes", "starts_at"):
+            # reminders sent for an earlier start time do not count after a reschedule
+            if reminded_start == starts[appointment_id]:
+                sent.setdefault(appointment_id, set()).add(offset)
+        for appt in appointments:
+            start = appt.starts_at.timestamp()
+            timers = plan(start, sent.get(appt.pk, set()), self.offsets, now)
+            if self.upcoming_minutes and start > now and self._pushed.get(appt.pk) != start:
+                timers.append((UPCOMING, max(start - self.upcoming_minutes * 60, now)))
+            for offset, fire_at in timers:
+                key = (appt.pk, offset)
+                self.wheel.schedule(key, fire_at)
+                self._timers.setdefault(appt.pk, []).append(key)
+
+    def forget(self, appointment_id: int):
+        for key in self._timers.pop(appointment_id, ()):
+            self.wheel.cancel(key)
+
+    def resync(self) -> int:
+        """Rebuild the wheel from the database; returns the number of timers."""
+        now = timezone.now()
+        appointments = list(self._upcoming(now))
+        self.wheel.clear()
+        self._timers.clear()
+        self._pushed = {a.pk: self._pushed[a.pk] for a in appointments if a.pk in self._pushed}
+        self._add(appointments, now.timestamp())
+        return len(self.wheel)
+
+    def refresh(self, appointment_id: int, deleted: bool = False):
+        """Re-plan one appointment after it was saved or deleted."""
+        self.forget(appointment_id)
+        if deleted:
+            self._pushed.pop(appointment_id, None)
+            return
+        now = timezone.now()
+        self._add(list(self._upcoming(now).filter(pk=appointment_id)), now.timestamp())
+
+    # -------------------------
+    # Firing
+    # -------------------------
+    def fire(self, now: Optional[float] = None) -> List[reminders.DispatchResult]:
+        """Send the reminders whose timers are due; failed ones are retried after RETRY_SECONDS."""
+        now = time.time() if now is None else now
+        due = self.wheel.advance(now)
+        if not due:
+            return []
+        by_offset: Dict[object, List[int]] = {}
+        for (appointment_id, offset), _ in due:
+            by_offset.setdefault(offset, []).append(appointment_id)
+            keys = self._timers.get(appointment_id)
+            if keys:
+                keys.remove((appointment_id, offset))
+                if not keys:
+                    del self._timers[appointment_id]
+
+        upcoming = by_offset.pop(UPCOMING, None)
+        if upcoming:
+            self._push_upcoming(upcoming)
+
+        results = []
+        for offset, ids in by_offset.items():
+            try:
+                result = reminders.dispatch(offset, appointment_ids=ids, **self.dispatch_options)
+            except Exception:
+                logger.exception("Dispatching %d reminder(s) %d min ahead failed", len(ids), offset)
+                result = reminders.DispatchResult(failed=len(ids), failed_ids=ids)
+            for appointment_id in result.failed_ids:
+                key = (appointment_id, offset)
+                self.wheel.schedule(key, now + RETRY_SECONDS)
+                self._timers.setdefault(appointment_id, []).append(key)
+            results.append(result)
+        return results
+
+    def _push_upcoming(self, appointment_ids: List[int]):
+        appointments = Appointment.objects.filter(
+            pk__in=appointment_ids, is_confirmed=True, status='Pending',
+        ).select_related("user", "doctor")
+        for appt in appointments:
+            notifications.notify_upcoming(appt)
+            self._pushed[appt.pk] = appt.starts_at.timestamp()   # a rescheduled appointment is pushed again
@@ -0,0 +1,72 @@
+"""
+Appointment side effects of saves and deletes:
+
+- keep the free-slot availability cache (`appointment.slots`) in step with DoctorAvailability;
+- tell a running reminder scheduler (`run_scheduler`) which appointment to re-plan;
+- push status / confirmation changes to the patient's and doctor's notification sockets.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from account.models import Doctor
+from .models import Appointment, DoctorAvailability
+from .notifications import notify_status
+from .scheduler import SCHEDULER_GROUP
+from .slots import invalidate_doctor
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_NOTIFY = getattr(settings, "APPOINTMENT_SCHEDULER_NOTIFY", True)
+
+
+def notify_scheduler(appointment_id: int, deleted: bool = False):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(
+            SCHEDULER_GROUP, {"type": "appointment.changed", "id": appointment_id, "deleted": deleted})
+    except Exception:
+        # the scheduler's periodic resync picks the change up anyway
+        logger.warning("Could not notify the reminder scheduler about appointment %s", appointment_id, exc_info=True)
+
+
+@receiver(post_save, sender=Appointment, dispatch_uid="appointment_scheduler_saved")
+def appointment_saved(sender, instance, **kwargs):
+    if SCHEDULER_NOTIFY:
+        appointment_id = instance.pk
+        transaction.on_commit(lambda: notify_scheduler(appointment_id))
+
+
+@receiver(post_init, sender=Appointment, dispatch_uid="appointment_track_status")
+def appointment_loaded(sender, instance, **kwargs):
+    # __dict__ so rows loaded with .only() do not fetch the deferred fields
+    instance._notified_state = (instance.__dict__.get("status"), instance.__dict__.get("is_confirmed"))
+
+
+@receiver(post_save, sender=Appointment, dispatch_uid="appointment_status_push")
+def appointment_status_changed(sender, instance, created, **kwargs):
+    state = (instance.__dict__.get("status"), instance.__dict__.get("is_confirmed"))
+    previous, instance._notified_state = instance._notified_state, state
+    if created or state == previous or None in state:
+        return
+    transaction.on_commit(lambda: notify_status(instance))
+
+
+@receiver(post_delete, sender=Appointment, dispatch_uid="appointment_scheduler_deleted")
+def appointment_deleted(sender, instance, **kwargs):
+    if SCHEDULER_NOTIFY:
+        appointment_id = instance.pk   # Django clears pk once delete() returns
+        transaction.on_commit(lambda: notify_scheduler(appointment_id, deleted=True))
+
+
+@receiver([post_save, post_delete], sender=DoctorAvailability, dispatch_uid="availability_free_slots")
+def availability_changed(sender, instance, **kwargs):
+    user_id = Doctor.objects.filter(pk=instance.doctor_id).values_list("user_id", flat=True).first()
+    invalidate_doctor(user_id)
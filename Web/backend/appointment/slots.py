@@ -0,0 +1,232 @@
+"""
+Free (bookable) appointment slots.
+
+A doctor's availability is a set of windows: recurring rows (`day_of_week`,
+no `date`) repeat every week, dated rows apply to that date only. A dated
+row that is not `available` (booked / cancelled) blocks its window on that
+date, e.g. to take one Monday off a recurring Monday schedule.
+
+`free_slots` expands the windows over a horizon into fixed-length slots and
+drops the ones that overlap an `Appointment`. Bookings of a doctor on a
+date are kept as sorted start minutes, so the overlap test per slot is one
+bisect.
+
+Only the expanded availability of each doctor is cached (the
+"appointment_slots" cache alias, Redis in production) under a per-doctor
+generation number, which the signals in `appointment.signals` bump whenever
+that doctor's availability changes. Bookings are read fresh on every call (one range scan
+of the (doctor, starts_at) index), so a slot disappears the moment it is
+booked, whichever worker served the booking.
+"""
+from bisect import bisect_right
+from datetime import date as dt_date, datetime, time as dt_time, timedelta
+from heapq import merge
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils import timezone
+
+from account.models import Doctor
+from .models import Appointment, DoctorAvailability, appointment_bounds
+
+SLOT_MINUTES = getattr(settings, "APPOINTMENT_SLOT_MINUTES", 30)
+HORIZON_DAYS = getattr(settings, "APPOINTMENT_SLOT_HORIZON_DAYS", 14)
+MAX_HORIZON_DAYS = getattr(settings, "APPOINTMENT_SLOT_MAX_HORIZON_DAYS", 60)
+CACHE_TTL = getattr(settings, "APPOINTMENT_SLOT_CACHE_TTL", 5 * 60)
+CACHE_ALIAS = "appointment_slots" if "appointment_slots" in settings.CACHES else "default"
+
+WEEKDAYS = [d.value for d in DoctorAvailability.DayOfWeek]   # Monday first, like date.weekday()
+_KEY_PREFIX = "appointment:free_slots"
+
+# a slot: (date, start minute of the day, doctor user id)
+Slot = Tuple[dt_date, int, int]
+
+
+def _minutes(t: dt_time) -> int:
+    return t.hour * 60 + t.minute
+
+
+def _clock(minutes: int) -> dt_time:
+    return dt_time(minutes // 60, minutes % 60)
+
+
+# -------------------------
+# Expansion
+# -------------------------
+def _window_starts(start: dt_time, end: dt_time, slot_minutes: int) -> range:
+    """Slot start minutes that fit completely inside [start, end)."""
+    return range(_minutes(start), _minutes(end) - slot_minutes + 1, slot_minutes)
+
+
+def expand_availability(rows: Iterable[DoctorAvailability], start: dt_date, days: int,
+                        slot_minutes: int = SLOT_MINUTES) -> Dict[dt_date, List[int]]:
+    """Sorted slot start minutes per date in [start, start + days) for one doctor's rows."""
+    recurring: Dict[int, set] = {}
+    dated: Dict[dt_date, set] = {}
+    blocked: Dict[dt_date, List[Tuple[int, int]]] = {}
+    end = start + timedelta(days=days)
+    for row in rows:
+        if row.date is not None:
+            if not (start <= row.date < end):
+                continue
+            if row.status == DoctorAvailability.Status.AVAILABLE:
+                dated.setdefault(row.date, set()).update(_window_starts(row.start_time, row.end_time, slot_minutes))
+            else:
+                blocked.setdefault(row.date, []).append((_minutes(row.start_time), _minutes(row.end_time)))
+        elif row.status == DoctorAvailability.Status.AVAILABLE and row.day_of_week in WEEKDAYS:
+            weekday = WEEKDAYS.index(row.day_of_week)
+            recurring.setdefault(weekday, set()).update(_window_starts(row.start_time, row.end_time, slot_minutes))
+
+    out: Dict[dt_date, List[int]] = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        starts = recurring.get(day.weekday(), set()) | dated.get(day, set())
+        for lo, hi in blocked.get(day, ()):
+            starts = {m for m in starts if m + slot_minutes <= lo or m >= hi}
+        if starts:
+            out[day] = sorted(starts)
+    return out
+
+
+def subtract_booked(starts: Sequence[int], booked: Sequence[int], slot_minutes: int = SLOT_MINUTES) -> List[int]:
+    """Slot starts that do not overlap any booking; `booked` is sorted start minutes.
+
+    A booking at minute b occupies [b, b + slot_minutes), so it overlaps the slot
+    starting at s exactly when s - slot_minutes < b < s + slot_minutes.
+    """
+    if not booked:
+        return list(starts)
+    free = []
+    for s in starts:
+        i = bisect_right(booked, s - slot_minutes)
+        if i == len(booked) or booked[i] >= s + slot_minutes:
+            free.append(s)
+    return free
+
+
+# -------------------------
+# Cache
+# -------------------------
+def _generation_key(doctor_user_id: int) -> str:
+    return f"{_KEY_PREFIX}:gen:{doctor_user_id}"
+
+
+def _slots_key(doctor_user_id: int, generation: int, start: dt_date, days: int) -> str:
+    return f"{_KEY_PREFIX}:{doctor_user_id}:{generation}:{start.isoformat()}:{days}:{SLOT_MINUTES}"
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def invalidate_doctor(doctor_user_id: Optional[int]):
+    """Drop every cached availability horizon of this doctor (bumps the doctor's generation)."""
+    if doctor_user_id is None:
+        return
+    key = _generation_key(doctor_user_id)
+    cache = _cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def _expand(doctor_pks: Dict[int, int], start: dt_date, days: int) -> Dict[int, Dict[dt_date, List[int]]]:
+    """Expanded availability keyed by doctor user id; one query for all doctors."""
+    end = start + timedelta(days=days - 1)
+    rows_by_doctor: Dict[int, List[DoctorAvailability]] = {}
+    availability = DoctorAvailability.objects.filter(doctor_id__in=list(doctor_pks)).filter(
+        Q(date__isnull=True) | Q(date__range=(start, end))
+    ).only("doctor_id", "day_of_week", "date", "start_time", "end_time", "status")
+    for row in availability:
+        rows_by_doctor.setdefault(doctor_pks[row.doctor_id], []).append(row)
+    return {
+        doctor_user_id: expand_availability(rows_by_doctor.get(doctor_user_id, ()), start, days)
+        for doctor_user_id in doctor_pks.values()
+    }
+
+
+def doctor_availability(doctor_pks: Dict[int, int], start: dt_date, days: int) -> Dict[int, Dict[dt_date, List[int]]]:
+    """Cached expanded availability for `{Doctor pk: doctor user id}`; only cache misses touch the database."""
+    cache = _cache()
+    user_ids = list(doctor_pks.values())
+    generations = cache.get_many([_generation_key(u) for u in user_ids])
+    keys = {u: _slots_key(u, generations.get(_generation_key(u), 0), start, days) for u in user_ids}
+    cached = cache.get_many(list(keys.values()))
+
+    out = {u: cached[keys[u]] for u in user_ids if keys[u] in cached}
+    missing = {pk: u for pk, u in doctor_pks.items() if u not in out}
+    if missing:
+        fresh = _expand(missing, start, days)
+        cache.set_many({keys[u]: per_day for u, per_day in fresh.items()}, CACHE_TTL)
+        out.update(fresh)
+    return out
+
+
+def booked_minutes(doctor_user_ids: Sequence[int], start: dt_date, days: int) -> Dict[Tuple[int, dt_date], List[int]]:
+    """Sorted booked start minutes per (doctor user id, date); one (doctor, starts_at) index range scan."""
+    first, _ = appointment_bounds(start, dt_time.min)
+    last, _ = appointment_bounds(start + timedelta(days=days), dt_time.min)
+    booked: Dict[Tuple[int, dt_date], List[int]] = {}
+    bookings = Appointment.objects.filter(
+        doctor_id__in=list(doctor_user_ids), starts_at__gte=first, starts_at__lt=last,
+    ).order_by().values_list("doctor_id", "date", "time")
+    for doctor_user_id, day, t in bookings:
+        booked.setdefault((doctor_user_id, day), []).append(_minutes(t))
+    for minutes in booked.values():
+        minutes.sort()
+    return booked
+
+
+# -------------------------
+# Public entry point
+# -------------------------
+def free_slots(start: Optional[dt_date] = None, days: int = HORIZON_DAYS, doctors=None,
+               now: Optional[datetime] = None) -> List[Slot]:
+    """Bookable `(date, minute, doctor user id)` slots, in time order, from `start` for `days` days.
+
+    `doctors` optionally narrows the Doctor queryset. Slots that already
+    started (relative to `now`, local time) are left out.
+    """
+    now = timezone.localtime(now)
+    start = max(start or now.date(), now.date())
+    days = max(1, min(int(days), MAX_HORIZON_DAYS))
+    qs = doctors if doctors is not None else Doctor.objects.all()
+    doctor_pks = dict(qs.filter(availabilities__isnull=False).distinct().values_list("pk", "user_id"))
+    if not doctor_pks:
+        return []
+
+    today, current = now.date(), _minutes(now.time())
+    per_doctor = doctor_availability(doctor_pks, start, days)
+    booked = booked_minutes(list(per_doctor), start, days)
+    streams = [
+        [
+            (day, m, u)
+            for day in sorted(per_day)
+            for m in subtract_booked(per_day[day], booked.get((u, day), ()))
+            if day > today or m >= current
+        ]
+        for u, per_day in per_doctor.items()
+    ]
+    return list(merge(*streams))
+
+
+def slot_datetime(slot: Slot) -> datetime:
+    """Naive local start of a slot (also its pagination key)."""
+    return datetime.combine(slot[0], _clock(slot[1]))
+
+
+def slot_payload(slot: Slot, doctor: Doctor, slot_minutes: int = SLOT_MINUTES) -> dict:
+    day, minute, _ = slot
+    return {
+        "doctor_id": doctor.user_id,
+        "doctor_email": doctor.user.email,
+        "doctor_name": doctor.user.full_name,
+        "specialization": doctor.specialization,
+        "date": day.isoformat(),
+        "day_of_week": WEEKDAYS[day.weekday()],
+        "start_time": _clock(minute).strftime("%H:%M"),
+        "end_time": _clock(min(minute + slot_minutes, 24 * 60 - 1)).strftime("%H:%M"),
+    }
@@ -1,3 +1,224 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from account.models import CustomUser, Doctor
+from .consumers import NotificationConsumer
+from .models import Appointment, AppointmentReminder, DoctorAvailability
+from .notifications import user_group
+from .reminders import dispatch
+from .scheduler import plan
+from .slots import CACHE_ALIAS, expand_availability, free_slots, subtract_booked
+from .timer_wheel import TimerWheel
+
+IN_MEMORY_LAYER = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+def make_user(email, role="User"):
+    return CustomUser.objects.create_user(
+        email=email, password="secret", full_name=email.split("@")[0].title(), phone="0700000000", role=role,
+    )
+
+
+# ========================================
+# Timer wheel / reminder planning
+# ========================================
+class TimerWheelTests(SimpleTestCase):
+    def test_fires_each_timer_once_when_due(self):
+        wheel = TimerWheel(tick=1, size=8, now=0)
+        wheel.schedule("a", 3)
+        wheel.schedule("b", 11)   # same bucket as "a", one revolution later
+        self.assertEqual(wheel.advance(5), [("a", None)])
+        self.assertEqual(wheel.advance(10), [])
+        self.assertEqual(wheel.advance(11), [("b", None)])
+        self.assertEqual(len(wheel), 0)
+
+    def test_gap_longer_than_one_revolution(self):
+        wheel = TimerWheel(tick=1, size=8, now=0)
+        for key, when in (("a", 2), ("b", 7), ("c", 30), ("d", 150)):
+            wheel.schedule(key, when)
+        self.assertCountEqual([k for k, _ in wheel.advance(100)], ["a", "b", "c"])
+        self.assertIn("d", wheel)
+        self.assertEqual(wheel.advance(150), [("d", None)])
+
+    def test_cancel_and_reschedule(self):
+        wheel = TimerWheel(tick=1, size=8, now=0)
+        wheel.schedule("a", 3, payload=1)
+        wheel.schedule("a", 6, payload=2)
+        self.assertEqual(wheel.advance(4), [])
+        self.assertTrue(wheel.cancel("a"))
+        self.assertEqual(wheel.advance(10), [])
+
+
+class PlanTests(SimpleTestCase):
+    OFFSETS = [24 * 60, 60, 10]
+    START = 1_000_000.0
+
+    def test_future_offsets_get_their_own_timer(self):
+        now = self.START - 2 * 24 * 3600
+        self.assertEqual(plan(self.START, set(), self.OFFSETS, now),
+                         [(24 * 60, self.START - 24 * 3600), (60, self.START - 3600), (10, self.START - 600)])
+
+    def test_late_offsets_collapse_into_the_smallest_one_now(self):
+        now = self.START - 30 * 60   # the 24 h and 1 h moments have passed
+        self.assertEqual(plan(self.START, set(), self.OFFSETS, now), [(10, self.START - 600), (60, now)])
+
+    def test_late_offset_skipped_once_a_smaller_one_was_sent(self):
+        now = self.START - 5 * 60
+        self.assertEqual(plan(self.START, {10}, self.OFFSETS, now), [])
+        self.assertEqual(plan(self.START, {24 * 60}, self.OFFSETS, now), [(10, now)])
+
+    def test_started_appointment_has_no_timers(self):
+        self.assertEqual(plan(self.START, set(), self.OFFSETS, self.START), [])
+
+
+# ========================================
+# Free slots
+# ========================================
+class SubtractBookedTests(SimpleTestCase):
+    def test_subtract_booked_drops_overlapping_slots(self):
+        self.assertEqual(subtract_booked([540, 570, 600, 630], [575], slot_minutes=30), [540, 630])
+        self.assertEqual(subtract_booked([540, 570], [], slot_minutes=30), [540, 570])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class FreeSlotsTests(TestCase):
+    MONDAY = date(2030, 1, 7)
+
+    def setUp(self):
+        caches[CACHE_ALIAS].clear()
+        self.patient = make_user("patient@example.com")
+        self.doctor_user = make_user("doctor@example.com", role="Doctor")
+        self.doctor = Doctor.objects.create(user=self.doctor_user)
+        DoctorAvailability.objects.create(doctor=self.doctor, day_of_week="Monday",
+                                          start_time=time(9, 0), end_time=time(11, 0))
+        self.now = timezone.make_aware(datetime(2030, 1, 6, 12, 0))
+
+    def _minutes(self, slots):
+        return [(s[0], s[1]) for s in slots]
+
+    def test_recurring_window_is_split_into_slots(self):
+        slots = free_slots(self.MONDAY, days=1, now=self.now)
+        self.assertEqual(self._minutes(slots), [(self.MONDAY, m) for m in (540, 570, 600, 630)])
+        self.assertEqual({s[2] for s in slots}, {self.doctor_user.id})
+
+    def test_booked_slot_is_excluded_right_away(self):
+        free_slots(self.MONDAY, days=1, now=self.now)   # fills the availability cache
+        Appointment.objects.create(user=self.patient, doctor=self.doctor_user, date=self.MONDAY, time=time(9, 30))
+        slots = free_slots(self.MONDAY, days=1, now=self.now)
+        self.assertEqual(self._minutes(slots), [(self.MONDAY, m) for m in (540, 600, 630)])
+
+    def test_blocked_date_invalidates_the_cache(self):
+        free_slots(self.MONDAY, days=1, now=self.now)   # fills the availability cache
+        DoctorAvailability.objects.create(doctor=self.doctor, day_of_week="Monday", date=self.MONDAY,
+                                          start_time=time(10, 0), end_time=time(11, 0),
+                                          status=DoctorAvailability.Status.CANCELLED)
+        self.assertEqual(self._minutes(free_slots(self.MONDAY, days=1, now=self.now)),
+                         [(self.MONDAY, 540), (self.MONDAY, 570)])
+        rows = DoctorAvailability.objects.filter(doctor=self.doctor)
+        self.assertEqual(expand_availability(rows, self.MONDAY + timedelta(days=7), 1),
+                         {self.MONDAY + timedelta(days=7): [540, 570, 600, 630]})
+
+    def test_past_slots_are_left_out(self):
+        now = timezone.make_aware(datetime.combine(self.MONDAY, time(9, 45)))
+        self.assertEqual(self._minutes(free_slots(self.MONDAY, days=1, now=now)),
+                         [(self.MONDAY, 600), (self.MONDAY, 630)])
+
+
+# ========================================
+# Reminder e-mails
+# ========================================
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER,
+                   EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class DispatchTests(TestCase):
+    def setUp(self):
+        self.patient = make_user("patient@example.com")
+        self.doctor = make_user("doctor@example.com", role="Doctor")
+        self.now = timezone.now()
+
+    def _book(self, minutes_ahead, confirmed=True):
+        local = timezone.localtime(self.now + timedelta(minutes=minutes_ahead)).replace(second=0, microsecond=0)
+        return Appointment.objects.create(user=self.patient, doctor=self.doctor, date=local.date(),
+                                          time=local.time(), is_confirmed=confirmed)
+
+    def test_sends_each_due_reminder_once(self):
+        due = self._book(30)
+        self._book(30 + 24 * 60)           # outside the 1 h window
+        self._book(40, confirmed=False)
+
+        result = dispatch(60, now=self.now, workers=1)
+        self.assertEqual((result.due, result.sent, result.failed), (1, 1, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ["doctor@example.com", "patient@example.com"])
+        self.assertTrue(AppointmentReminder.objects.filter(
+            appointment=due, offset_minutes=60, starts_at=due.starts_at).exists())
+
+        self.assertEqual(dispatch(60, now=self.now, workers=1).due, 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_rescheduling_rearms_the_reminder(self):
+        appt = self._book(30)
+        dispatch(60, now=self.now, workers=1)
+        later = timezone.localtime(appt.starts_at + timedelta(minutes=15))
+        appt.time = later.time()
+        appt.date = later.date()
+        appt.save()
+        self.assertEqual(dispatch(60, now=self.now, workers=1).sent, 1)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_dry_run_claims_nothing(self):
+        self._book(30)
+        self.assertEqual(dispatch(60, now=self.now, dry_run=True).due, 1)
+        self.assertFalse(AppointmentReminder.objects.exists())
+        self.assertEqual(mail.outbox, [])
+
+
+# ========================================
+# Notification socket
+# ========================================
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYER)
+class NotificationConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.patient = make_user("patient@example.com")
+        self.doctor = make_user("doctor@example.com", role="Doctor")
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), "/ws/notifications/")
+        communicator.scope["user"] = user
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    async def test_anonymous_socket_is_closed(self):
+        communicator, connected, code = await self._connect(AnonymousUser())
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    async def test_sends_upcoming_snapshot_then_pushes(self):
+        local = timezone.localtime(timezone.now() + timedelta(minutes=20))
+        appt = await database_sync_to_async(Appointment.objects.create)(
+            user=self.patient, doctor=self.doctor, date=local.date(), time=local.time(), is_confirmed=True)
+
+        communicator, connected, _ = await self._connect(self.patient)
+        self.assertTrue(connected)
+        first = await communicator.receive_json_from()
+        self.assertEqual(first["event"], "appointment.upcoming")
+        self.assertEqual((first["payload"]["upcoming"], first["payload"]["id"]), (True, appt.id))
+
+        payload = {"id": appt.id, "status": "Ongoing"}
+        await get_channel_layer().group_send(
+            user_group(self.patient.id), {"type": "notify", "event": "appointment.status", "payload": payload})
+        self.assertEqual(await communicator.receive_json_from(), {"event": "appointment.status", "payload": payload})
+        await communicator.disconnect()
+
+    async def test_no_upcoming_appointment(self):
+        communicator, connected, _ = await self._connect(self.doctor)
+        self.assertTrue(connected)
+        first = await communicator.receive_json_from()
+        self.assertFalse(first["payload"]["upcoming"])
+        await communicator.disconnect()
@@ -0,0 +1,71 @@
+"""
+Hashed timer wheel.
+
+Timers are hashed by their deadline tick into `size` buckets, so scheduling
+and cancelling are O(1) and advancing the clock only looks at the buckets
+of the ticks that passed. A bucket can hold timers from several revolutions
+ahead; they stay put until their own tick comes round.
+"""
+import math
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class TimerWheel:
+    """Timers keyed by any hashable; `advance(now)` returns the ones that are due."""
+
+    def __init__(self, tick: float = 1.0, size: int = 4096, now: float = 0.0):
+        self.tick = float(tick)
+        self.size = int(size)
+        self._buckets: List[Dict[Hashable, Tuple[int, Any]]] = [{} for _ in range(self.size)]
+        self._where: Dict[Hashable, int] = {}
+        self._current = int(now // self.tick)   # last tick already processed
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def schedule(self, key: Hashable, when: float, payload: Any = None):
+        """(Re)schedule `key` for time `when`; a deadline in the past fires on the next advance."""
+        self.cancel(key)
+        due_tick = max(int(math.ceil(when / self.tick)), self._current + 1)
+        slot = due_tick % self.size
+        self._buckets[slot][key] = (due_tick, payload)
+        self._where[key] = slot
+
+    def cancel(self, key: Hashable) -> bool:
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        self._buckets[slot].pop(key, None)
+        return True
+
+    def clear(self):
+        for bucket in self._buckets:
+            bucket.clear()
+        self._where.clear()
+
+    def next_deadline(self) -> Optional[float]:
+        """Time of the earliest timer (a full scan; for diagnostics, not the hot path)."""
+        ticks = [due for bucket in self._buckets for due, _ in bucket.values()]
+        return min(ticks) * self.tick if ticks else None
+
+    def advance(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """Move the clock to `now` and pop every timer whose deadline passed."""
+        now_tick = int(now // self.tick)
+        if now_tick <= self._current:
+            return []
+        fired = []
+        # a gap longer than one revolution still only needs every bucket once
+        last = min(now_tick, self._current + self.size)
+        for t in range(self._current + 1, last + 1):
+            bucket = self._buckets[t % self.size]
+            if not bucket:
+                continue
+            for key in [k for k, (due, _) in bucket.items() if due <= now_tick]:
+                _, payload = bucket.pop(key)
+                del self._where[key]
+                fired.append((key, payload))
+        self._current = now_tick
+        return fired
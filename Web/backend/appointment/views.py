@@ -39,7 +39,7 @@ def book_appointment(request):
 @permission_classes([IsAuthenticated])
 def list_user_appointments(request):
     """Get all appointments for the logged-in patient"""
-    appointments = Appointment.objects.filter(user=request.user).order_by('-date', '-time')
+    appointments = Appointment.objects.filter(user=request.user).order_by('-starts_at')
     serializer = AppointmentSerializer(appointments, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -64,7 +64,7 @@ def list_doctor_appointments(request):
     if request.user.role != 'Doctor':
         return Response({'detail': 'You are not a doctor'}, status=status.HTTP_403_FORBIDDEN)
     
-    appointments = Appointment.objects.filter(doctor=request.user).order_by('-date', '-time')
+    appointments = Appointment.objects.filter(doctor=request.user).order_by('-starts_at')
     serializer = AppointmentSerializer(appointments, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -183,6 +183,10 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
 from django.shortcuts import get_object_or_404
+from bisect import bisect_right
+from django.db.models import F, Q
+from backend.pagination import InvalidCursor, decode_cursor, encode_cursor, page_size
+from . import slots
 from .models import DoctorAvailability, Doctor
 from .serializers import DoctorAvailabilitySerializer
 
@@ -253,67 +257,84 @@ def available_doctors(request):
 
     today = dt_date.today()
 
-    # ✅ Start with only today & future dates
-    queryset = DoctorAvailability.objects.filter(date__gte=today)
+    # ✅ Today & future dates, plus recurring (day_of_week only) schedules
+    queryset = DoctorAvailability.objects.filter(Q(date__gte=today) | Q(date__isnull=True))
 
     # ✅ Apply filters if provided
     if date_param:
-        queryset = queryset.filter(date=date_param)
+        try:
+            wanted = dt_date.fromisoformat(date_param)
+        except ValueError:
+            return Response({'error': 'date must be YYYY-MM-DD.'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = queryset.filter(
+            Q(date=wanted) | Q(date__isnull=True, day_of_week=wanted.strftime('%A'))
+        )
     if day_of_week:
         queryset = queryset.filter(day_of_week__iexact=day_of_week)
 
-    # ✅ Sort results: earliest date first, then by start_time
-    queryset = queryset.order_by('date', 'start_time')
+    # ✅ Sort results: earliest date first (recurring rows last), then by start_time
+    queryset = queryset.select_related('doctor__user').order_by(F('date').asc(nulls_last=True), 'start_time')
 
     serializer = DoctorAvailabilitySerializer(queryset, many=True)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def free_slots(request):
+    """
+    Bookable appointment slots (availability minus existing bookings), earliest first.
+    Optional query params:
+    - date=YYYY-MM-DD  first day of the horizon (default today)
+    - days=N           horizon length (default APPOINTMENT_SLOT_HORIZON_DAYS)
+    - doctor=<email>   only this doctor
+    - limit, cursor    keyset pagination (`next_cursor` of the previous page)
+    """
+    try:
+        start = dt_date.fromisoformat(request.GET['date']) if request.GET.get('date') else None
+        days = int(request.GET.get('days', slots.HORIZON_DAYS))
+    except ValueError:
+        return Response({'error': 'date must be YYYY-MM-DD and days a number.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    doctors = Doctor.objects.select_related('user')
+    if request.GET.get('doctor'):
+        doctors = doctors.filter(user__email=request.GET['doctor'])
+
+    found = slots.free_slots(start=start, days=days, doctors=doctors)
+    if request.GET.get('cursor'):
+        try:
+            after, after_doctor = decode_cursor(request.GET['cursor'], 2)
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        key = (after.date(), after.hour * 60 + after.minute, after_doctor)
+        found = found[bisect_right(found, key):]
+
+    limit = page_size(request.GET.get('limit'), default=50, maximum=200)
+    page, has_more = found[:limit], len(found) > limit
+    by_user = {d.user_id: d for d in doctors.filter(user_id__in={s[2] for s in page})}
+    return Response({
+        'results': [slots.slot_payload(s, by_user[s[2]]) for s in page],
+        'next_cursor': encode_cursor([slots.slot_datetime(page[-1]), page[-1][2]]) if has_more else None,
+    })
+
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.utils import timezone
-from datetime import timedelta
 from appointment.models import Appointment
-from django.db import models
+from appointment.notifications import no_upcoming_payload, upcoming_for, upcoming_payload
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_upcoming_appointment(request):
-    now = timezone.localtime()
-    time_limit = now + timedelta(minutes=40)
-
-    user = request.user
-
-    # Check if the user is a doctor or patient in appointments within next 40 minutes
-    appointment = Appointment.objects.filter(
-        date=now.date(),
-        time__gte=now.time(),
-        time__lte=time_limit.time(),
-        is_confirmed=True,
-        status='Pending'
-    ).filter(
-        models.Q(user=user) | models.Q(doctor=user)
-    ).order_by('time').first()
-
+    """
+    Upcoming appointment of the user (as patient or doctor) within the next 40 minutes.
+    Kept for older clients; the ws/notifications/ socket pushes the same payload.
+    """
+    appointment = upcoming_for(request.user)
     if appointment:
-        if appointment.doctor == user:
-            # User is the doctor
-            message = f"You have an appointment with patient {appointment.user.full_name} at {appointment.time.strftime('%H:%M')} today."
-        else:
-            # User is the patient
-            message = f"You have an appointment with Dr. {appointment.doctor.full_name} at {appointment.time.strftime('%H:%M')} today."
-
-        return Response({
-            "upcoming": True,
-            "id": appointment.id,
-            "message": message
-        })
-
-    return Response({
-        "upcoming": False,
-        "message": "No upcoming appointment in the next 40 minutes."
-    })
+        return Response(upcoming_payload(appointment, request.user.id))
+    return Response(no_upcoming_payload())
 
 
 
@@ -9,17 +9,23 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import videocall.routing  # 👈 Make sure this file exists in your app
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
+# set up Django before the routing modules import models
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from account.ws_auth import JWTAuthMiddlewareStack  # noqa: E402
+import appointment.routing  # noqa: E402
+import videocall.routing  # 👈 Make sure this file exists in your app  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app,
+    "websocket": JWTAuthMiddlewareStack(
         URLRouter(
             videocall.routing.websocket_urlpatterns
+            + appointment.routing.websocket_urlpatterns
         )
     ),
 })
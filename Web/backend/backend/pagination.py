@@ -0,0 +1,94 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is the opaque, URL-safe encoding of the sort key of the last row a
+client has seen, e.g. `(created_at, id)`. The next page is "rows strictly
+after that key", which the database answers from an index no matter how deep
+the client has scrolled (unlike OFFSET).
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from django.db.models import Q, QuerySet
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_ID = 2 ** 63 - 1   # bigint; larger ids cannot come from a row
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: str, n_fields: int) -> Tuple[Any, ...]:
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise InvalidCursor("Malformed cursor.")
+    if not isinstance(raw, list) or len(raw) != n_fields:
+        raise InvalidCursor("Malformed cursor.")
+    # datetimes travel as ISO strings; ids as ints (anything else is a forged cursor)
+    values = []
+    for v in raw:
+        if isinstance(v, str):
+            try:
+                v = parse_datetime(v)
+            except ValueError:   # well formed but out of range, e.g. month 13
+                v = None
+            if v is None:
+                raise InvalidCursor("Malformed cursor.")
+        elif isinstance(v, bool) or not isinstance(v, int) or not -MAX_ID <= v <= MAX_ID:
+            raise InvalidCursor("Malformed cursor.")
+        values.append(v)
+    return tuple(values)
+
+
+def page_size(raw, default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    try:
+        n = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(n, maximum))
+
+
+def after_key(fields: Sequence[str], values: Sequence[Any], descending: bool) -> Q:
+    """Q for rows that sort strictly after `values` on `fields` (row-value comparison)."""
+    op = "lt" if descending else "gt"
+    q = Q()
+    for i, field in enumerate(fields):
+        clause = Q(**{f"{field}__{op}": values[i]})
+        for prev, value in zip(fields[:i], values[:i]):
+            clause &= Q(**{prev: value})
+        q |= clause
+    return q
+
+
+def cursor_for(obj: Any, fields: Sequence[str]) -> str:
+    """Cursor pointing just after `obj`."""
+    return encode_cursor([getattr(obj, f) for f in fields])
+
+
+def keyset_page(qs: QuerySet, fields: Sequence[str], cursor: Optional[str] = None,
+                limit: int = DEFAULT_PAGE_SIZE, descending: bool = False) -> Tuple[List[Any], Optional[str]]:
+    """Return `(rows, next_cursor)`; `next_cursor` is None on the last page.
+
+    Raises InvalidCursor for a cursor that cannot be decoded.
+    """
+    order = [f"-{f}" if descending else f for f in fields]
+    qs = qs.order_by(*order)
+    if cursor:
+        qs = qs.filter(after_key(fields, decode_cursor(cursor, len(fields)), descending))
+    rows = list(qs[: limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = cursor_for(rows[-1], fields) if has_more else None
+    return rows, next_cursor
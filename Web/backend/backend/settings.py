@@ -194,4 +194,74 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Free-slot availability cache (appointment.slots) has its own alias. Per process by default;
+# set a Redis URL (e.g. "redis://127.0.0.1:6379/2") so every worker sees the per-doctor invalidations
+APPOINTMENT_SLOT_CACHE_REDIS_URL = None
 
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "appointment_slots": (
+        {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": APPOINTMENT_SLOT_CACHE_REDIS_URL}
+        if APPOINTMENT_SLOT_CACHE_REDIS_URL else
+        {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "appointment-slots"}
+    ),
+}
+
+
+
+# Smart doctor model bundle: seconds between checks of ML/ML_TEST/bundles/CURRENT (0 disables hot reload)
+DIAGNOSIS_MODEL_POLL_SECONDS = 30
+
+# Smart doctor live session state: None (Postgres only), "redis" or "memory" (single process / tests)
+DIAGNOSIS_STATE_BACKEND = None
+DIAGNOSIS_STATE_REDIS_URL = "redis://127.0.0.1:6379/1"
+DIAGNOSIS_STATE_TTL = 60 * 60            # seconds a live session stays in the store
+DIAGNOSIS_STATE_FLUSH_SECONDS = 30       # write-behind interval to ChatSession
+
+# Smart doctor prediction cache (per process; set the Redis URL to share it between workers)
+DIAGNOSIS_PREDICTION_CACHE_SIZE = 2048
+DIAGNOSIS_PREDICTION_CACHE_TTL = 60 * 60
+DIAGNOSIS_PREDICTION_CACHE_REDIS_URL = None
+
+# Smart doctor micro-batched inference (helps when one process serves concurrent requests)
+DIAGNOSIS_BATCH_INFERENCE = False
+DIAGNOSIS_BATCH_MAX_SIZE = 32
+DIAGNOSIS_BATCH_MAX_WAIT_MS = 2
+
+# Smart doctor NLP: "auto" (regex tokens for short messages), "spacy" or "regex" (never load spaCy)
+DIAGNOSIS_NLP_MODE = "auto"
+DIAGNOSIS_NLP_MODELS = ["sw_core_news_sm", "en_core_web_sm"]   # first installed one is used
+DIAGNOSIS_NLP_FAST_PATH_CHARS = 80
+
+# Smart doctor session topics: labeled by a background thread in batches (False: inline in create_session)
+DIAGNOSIS_TOPIC_LABELER = True
+DIAGNOSIS_TOPIC_BATCH_SIZE = 32
+DIAGNOSIS_TOPIC_BATCH_WAIT_MS = 500
+
+# Smart doctor latency metrics endpoint (/api/smart-doctor/metrics/): disabled (404) until a token is set;
+# scrapers send "Authorization: Bearer <token>". The optional address list (None: any) is not enough on its
+# own, since behind a local reverse proxy every request comes from 127.0.0.1.
+DIAGNOSIS_METRICS_TOKEN = None
+DIAGNOSIS_METRICS_ALLOWED_IPS = None
+
+# Appointment free slots (/api/availability/free-slots/): slot length, default / max horizon, per-doctor cache TTL
+APPOINTMENT_SLOT_MINUTES = 30
+APPOINTMENT_SLOT_HORIZON_DAYS = 14
+APPOINTMENT_SLOT_MAX_HORIZON_DAYS = 60
+APPOINTMENT_SLOT_CACHE_TTL = 5 * 60      # seconds; availability changes invalidate the doctor's entries right away
+
+# Appointment reminder e-mails (send_appointments_reminders): None uses EMAIL_BACKEND;
+# "console" / "file" (writes to EMAIL_FILE_PATH) are handy for local testing
+APPOINTMENT_REMINDER_EMAIL_BACKEND = None
+APPOINTMENT_REMINDER_WORKERS = 4         # parallel mail connections
+APPOINTMENT_REMINDER_BATCH_SIZE = 50     # appointments per connection (two messages each)
+
+# Appointment reminder scheduler (manage.py run_scheduler): minutes before the appointment, full reload interval
+APPOINTMENT_REMINDER_OFFSETS = [24 * 60, 60, 10]
+APPOINTMENT_SCHEDULER_RESYNC_SECONDS = 5 * 60
+APPOINTMENT_SCHEDULER_NOTIFY = True      # publish appointment changes to the scheduler via the channel layer
+
+# Appointment notification socket (ws/notifications/?token=<JWT>): "upcoming" is pushed this many minutes ahead
+APPOINTMENT_UPCOMING_MINUTES = 40
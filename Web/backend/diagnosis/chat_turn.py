@@ -0,0 +1,79 @@
+"""
+Unit of work for one `chat_with_doctor` turn.
+
+The chat flow mutates the `ChatSession` freely and queues its messages here;
+`commit()` then writes only the session fields that actually changed (one
+UPDATE with `update_fields`) and inserts the turn's messages with one
+`bulk_create`, both inside a single transaction.
+
+With a state store (see session_state.py) the session fields go to the store
+instead and reach Postgres through write-behind; only the messages are
+inserted right away.
+"""
+import copy
+import logging
+from typing import List
+
+from django.db import transaction
+
+from .models import ChatSession, Message
+from .session_state import session_to_state
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTurn:
+    """Tracks dirty `ChatSession` fields and pending messages for one turn."""
+
+    TRACKED_FIELDS = ("user", "symptoms", "pending_questions", "confirmed_diseases", "eliminated_diseases", "meta")
+
+    def __init__(self, session: ChatSession, store=None):
+        self.session = session
+        self.store = store
+        self._snapshot = {f: self._value(f) for f in self.TRACKED_FIELDS}
+        self._messages: List[Message] = []
+        self.committed = False
+
+    def _value(self, field: str):
+        if field == "user":
+            return self.session.user_id
+        # deep copy so in-place edits (list.pop, meta[...] = ...) show up as changes
+        return copy.deepcopy(getattr(self.session, field))
+
+    def add_message(self, text: str, is_user: bool = False):
+        self._messages.append(Message(session=self.session, is_user=is_user, text=text))
+
+    def dirty_fields(self) -> List[str]:
+        return [f for f in self.TRACKED_FIELDS if self._value(f) != self._snapshot[f]]
+
+    def commit(self, final: bool = False):
+        """Flush the session changes and queued messages (no-op after the first call).
+
+        `final` marks the end of a conversation: with a state store the
+        session row is written through immediately instead of later.
+        """
+        if self.committed:
+            return
+        dirty = self.dirty_fields()
+        with transaction.atomic():
+            if self.store is None:
+                if dirty:
+                    self.session.save(update_fields=dirty)
+            elif final:
+                # earlier turns may have left changes only in the store
+                self.session.save(update_fields=list(self.TRACKED_FIELDS))
+            if self._messages:
+                Message.objects.bulk_create(self._messages)
+
+        if self.store is not None:
+            sid = str(self.session.session_id)
+            try:
+                self.store.put(sid, session_to_state(self.session), dirty=bool(dirty) and not final)
+                if final:
+                    self.store.mark_clean(sid)
+            except Exception:
+                # the row is the fallback: write it now rather than lose the turn
+                logger.exception("Chat state store unavailable; saving session %s directly", sid)
+                if not final:
+                    self.session.save(update_fields=list(self.TRACKED_FIELDS))
+        self.committed = True
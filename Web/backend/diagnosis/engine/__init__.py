@@ -0,0 +1,27 @@
+"""
+Framework-independent diagnosis engine (model, advice, symptom matching, question flow).
+
+Nothing here imports Django. The views build a `DiagnosisEngine` from
+settings; other callers (Rasa actions, batch scripts) can use
+`get_engine()`, which reads the model from `ML/ML_TEST` next to the app.
+"""
+import threading
+from typing import Optional
+
+from .core import Conversation, DiagnosisEngine, TurnResult
+
+_default_engine: Optional[DiagnosisEngine] = None
+_default_lock = threading.Lock()
+
+
+def get_engine() -> DiagnosisEngine:
+    """Process-wide engine with default paths (loaded on first use)."""
+    global _default_engine
+    if _default_engine is None:
+        with _default_lock:
+            if _default_engine is None:
+                _default_engine = DiagnosisEngine()
+    return _default_engine
+
+
+__all__ = ["Conversation", "DiagnosisEngine", "TurnResult", "get_engine"]
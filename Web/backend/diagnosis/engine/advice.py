@@ -0,0 +1,353 @@
+"""
+Advice lookup for predicted diseases.
+
+Advice comes from (in order of preference) the advice compiled into the
+inference bundle, the external `ML/ML_TEST/ushauri.py` module, or entries
+generated from the reference dataset when neither has one. `AdviceBook`
+wraps all three and normalizes disease names between them.
+
+Generated advice only depends on the per-disease symptom means, so the whole
+table is built in one pass (`build_auto_advice`) when the bundle is written
+and stored in its advice.json; older bundles and the legacy artifacts build
+it once at load time.
+"""
+import copy
+import importlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+logger = logging.getLogger(__name__)
+
+Advice = Dict[str, Any]
+
+
+def load_ushauri(model_dir: str) -> Dict[str, Any]:
+    """ADVICE_DB, DEFAULT_ADVICE, advice_for and enrich_predictions_with_advice from ushauri.py.
+
+    Tries the importable module names first and executes the file directly
+    when none of them imports. Missing pieces come back empty / None.
+    """
+    found: Dict[str, Any] = {"advice_db": {}, "default_advice": {}, "advice_for": None, "enrich": None}
+    try:
+        ushauri_mod = None
+        try:
+            ushauri_mod = importlib.import_module("ML.ML_TEST.ushauri")
+        except Exception:
+            for p in ("ml.ML_TEST.ushauri", "ML.ushauri", "ushauri", "ML.advice_sw", "advice_sw"):
+                try:
+                    ushauri_mod = importlib.import_module(p)
+                    break
+                except Exception:
+                    continue
+        if ushauri_mod:
+            found["advice_db"] = getattr(ushauri_mod, "ADVICE_DB", {}) or {}
+            found["advice_for"] = getattr(ushauri_mod, "advice_for", None)
+            found["enrich"] = getattr(ushauri_mod, "enrich_predictions_with_advice", None)
+            found["default_advice"] = getattr(ushauri_mod, "DEFAULT_ADVICE", {}) or {}
+    except Exception:
+        found["advice_for"] = None
+        found["enrich"] = None
+
+    # exec ushauri.py if available but import failed
+    path = os.path.join(model_dir, "ushauri.py")
+    if (not found["advice_db"]) and os.path.exists(path):
+        try:
+            g: Dict[str, Any] = {}
+            with open(path, "r", encoding="utf-8") as f:
+                code = compile(f.read(), path, "exec")
+                exec(code, g)
+            found["advice_db"] = g.get("ADVICE_DB", {}) or {}
+            found["advice_for"] = g.get("advice_for") or found["advice_for"]
+            found["enrich"] = g.get("enrich_predictions_with_advice") or found["enrich"]
+            found["default_advice"] = g.get("DEFAULT_ADVICE", {}) or {}
+        except Exception:
+            logger.exception("Failed to exec ushauri.py")
+    return found
+
+
+def _human_symptom_name(sym: str) -> str:
+    return sym.replace("_", " ").strip()
+
+
+def _auto_advice_entry(dname: str, readable_top: List[str]) -> Advice:
+    readable_top = readable_top or ["Dalili mbalimbali"]
+    return {
+        "majina_mengine": [],
+        "maelezo_fupi": f"Ugonjwa '{dname}' umeonekana kwenye dataset. Dalili muhimu zinajumuisha: {', '.join(readable_top)}. (Hii ni taarifa ya msaada tu.)",
+        "dalili_za_kuangalia": list(readable_top),
+        "vipimo": ["Fanya vipimo vya msingi vinavyofaa kulingana na dalili; muone daktari kwa ushauri wa kitaalamu."],
+        "tiba": ["Tiba hutegemea utambuzi wa daktari; fuata ushauri wa mtaalamu."],
+        "kinga": ["Fuatilia usafi na hatua za kinga zinazofaa kulingana na ugonjwa."],
+        "ushauri_wa_nyumbani": ["Pumzika, kunywa maji, andika dalili (muda/ukali), na muone daktari ikiwa dalili zinaendelea au zinaongezeka."],
+        "dalili_za_hatari": [],
+        "tafadhali_kumbuka": "Huu ni mwongozo wa msaada. Si badala ya uchunguzi wa daktari."
+    }
+
+
+def disease_symptom_means(df, target_col: str, symptom_columns: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    """Per-disease mean of every symptom column in one groupby pass (non-numeric cells count as 0)."""
+    import pandas as pd
+
+    cols = list(symptom_columns)
+    present = [c for c in cols if c in df.columns]
+    values = df[present].apply(pd.to_numeric, errors="coerce").fillna(0)
+    means = values.groupby(df[target_col], sort=False).mean().reindex(columns=cols, fill_value=0.0)
+    return [str(d) for d in means.index], means.to_numpy(dtype=np.float64)
+
+
+def build_auto_advice(diseases: Sequence[str], symptom_columns: Sequence[str], means: np.ndarray,
+                      top_k: int = 6) -> Dict[str, Advice]:
+    """Generated advice for every disease: its `top_k` most frequent symptoms."""
+    cols = list(symptom_columns)
+    means = np.asarray(means, dtype=np.float64)
+    # stable sort on the negated means keeps column order between equal means, like sorted(reverse=True)
+    order = np.argsort(-means, axis=1, kind="stable")[:, :top_k]
+    table = {}
+    for d, row, idx in zip(diseases, means, order):
+        table[d] = _auto_advice_entry(d, [_human_symptom_name(cols[j]) for j in idx if row[j] > 0])
+    return table
+
+
+def _clean_name(s: Optional[str]) -> str:
+    if not s: return ""
+    return str(s).strip()
+
+
+class DiseaseNameIndex:
+    """Maps disease names to ADVICE_DB keys: one dict lookup, then a memoised fuzzy match.
+
+    The dict holds every exact key, its casefolded and underscore/space forms
+    and the casefolded synonyms (`majina_mengine`); when two entries produce
+    the same form the earlier kind wins (key, casefold, variant, synonym). Names
+    it does not know are fuzzy-matched against the keys and then the synonyms,
+    and the answer is kept in a bounded memo.
+    """
+
+    def __init__(self, advice_db: Dict[str, Advice], key_threshold: float = 80, synonym_threshold: float = 85,
+                 memo_size: int = 2048):
+        self.key_threshold = key_threshold
+        self.synonym_threshold = synonym_threshold
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        keys = list(advice_db.keys())
+        index: Dict[str, str] = {}
+        for k in keys:
+            index.setdefault(k, k)
+        for k in keys:
+            index.setdefault(k.strip().lower(), k)
+        for k in keys:
+            for form in (k.replace("_", " "), k.replace(" ", "_")):
+                index.setdefault(form, k)
+                index.setdefault(form.lower(), k)
+        self._syn_list: List[str] = []
+        self._syn_to_key: Dict[str, str] = {}
+        for k, v in advice_db.items():
+            for syn in v.get("majina_mengine", []) or []:
+                if syn:
+                    index.setdefault(syn.strip().lower(), k)
+                    self._syn_list.append(syn)
+                    self._syn_to_key[syn] = k
+        self.index = index
+        self._keys = keys
+
+    def normalize(self, name: str) -> str:
+        name = _clean_name(name)
+        if not name:
+            return name
+        found = self.index.get(name)
+        if found is None:
+            found = self.index.get(name.lower())
+        if found is not None:
+            return found
+        with self._lock:
+            found = self._memo.get(name)
+            if found is not None:
+                self._memo.move_to_end(name)
+                return found
+        found = self._fuzzy(name)
+        with self._lock:
+            self._memo[name] = found
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return found
+
+    def _fuzzy(self, name: str) -> str:
+        if self._keys:
+            best = process.extractOne(name, self._keys, scorer=fuzz.WRatio)
+            if best:
+                match_key, score, _ = best
+                if score >= self.key_threshold:
+                    return match_key
+        if self._syn_list:
+            best = process.extractOne(name, self._syn_list, scorer=fuzz.WRatio)
+            if best:
+                match_syn, score, _ = best
+                if score >= self.synonym_threshold:
+                    return self._syn_to_key.get(match_syn, name)
+        return name
+
+
+class AdviceBook:
+    """Advice for disease names, with the same fallbacks the chat view always used.
+
+    `auto_advice` is the generated table (see `build_auto_advice`); it stands in
+    for ADVICE_DB when no advice was written, and names outside it get generic
+    advice from a bounded memo. With `use_class_advice` the advice compiled into
+    the bundle (`class_advice`, keyed by class label) is preferred, otherwise
+    `external_advice_for` / `external_enrich` from ushauri.py when present.
+    """
+
+    def __init__(self, advice_db: Dict[str, Advice], auto_advice: Dict[str, Advice],
+                 default_advice: Optional[Advice] = None, use_class_advice: bool = False,
+                 external_advice_for: Optional[Callable] = None, external_enrich: Optional[Callable] = None,
+                 memo_size: int = 1024):
+        self.auto_table = auto_advice or {}
+        self.default_advice = default_advice or {}
+        self.use_class_advice = use_class_advice
+        self.external_advice_for = external_advice_for if callable(external_advice_for) else None
+        self.external_enrich = external_enrich if callable(external_enrich) else None
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[str, Advice]" = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+        self.advice_db = advice_db or {}
+        if not self.advice_db:
+            # If still empty: use the advice generated from the dataset (useful fallback)
+            logger.info("ADVICE_DB empty — using auto-generated advice entries from the dataset as fallback.")
+            self.advice_db = {d: self.auto_table[d] for d in sorted(self.auto_table)}
+
+        self.names = DiseaseNameIndex(self.advice_db)
+
+    # -------------------------
+    # Generated advice
+    # -------------------------
+    def auto_advice(self, dname: str) -> Advice:
+        """Generated advice for `dname`; names outside the dataset get the generic entry (memoised).
+
+        Callers get their own copy, lists included, so editing one answer never
+        leaks into the table or the memo.
+        """
+        found = self.auto_table.get(dname)
+        if found is not None:
+            return copy.deepcopy(found)
+        with self._memo_lock:
+            found = self._memo.get(dname)
+            if found is not None:
+                self._memo.move_to_end(dname)
+                return copy.deepcopy(found)
+        found = _auto_advice_entry(dname, [])
+        with self._memo_lock:
+            self._memo[dname] = found
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+        return copy.deepcopy(found)
+
+    # -------------------------
+    # Name normalization
+    # -------------------------
+    def normalize(self, name: str) -> str:
+        return self.names.normalize(name)
+
+    # -------------------------
+    # Lookup
+    # -------------------------
+    def local_advice_for(self, disease: str) -> Advice:
+        dnorm = self.normalize(disease)
+        data = self.advice_db.get(dnorm)
+        if data:
+            return {"ugonjwa": dnorm, **copy.deepcopy(data)}
+        return self.auto_advice(disease)
+
+    def local_enrich(self, predictions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [{**p, "advice": self.local_advice_for(p.get("disease"))} for p in predictions]
+
+    def advice_for(self, disease: str, class_advice: Optional[Dict[str, Advice]] = None) -> Advice:
+        """Advice for one class label (`class_advice` is the active bundle's compiled advice)."""
+        if self.use_class_advice:
+            adv = (class_advice or {}).get(disease)
+            if adv:
+                return copy.deepcopy(adv)
+            dnorm = self.normalize(disease)
+            data = self.advice_db.get(dnorm)
+            if data:
+                return {"ugonjwa": dnorm, **copy.deepcopy(data)}
+            return {"ugonjwa": disease, **copy.deepcopy(self.default_advice)}
+        if self.external_advice_for is not None:
+            return self.external_advice_for(disease)
+        return self.local_advice_for(disease)
+
+    def enrich(self, predictions: List[Dict[str, Any]],
+               class_advice: Optional[Dict[str, Advice]] = None) -> List[Dict[str, Any]]:
+        if self.use_class_advice:
+            return [{**p, "advice": self.advice_for(p.get("disease") or p.get("ugonjwa"), class_advice)}
+                    for p in predictions]
+        if self.external_enrich is not None:
+            return self.external_enrich(predictions)
+        return self.local_enrich(predictions)
+
+    def normalize_enriched(self, preds: List[Dict[str, Any]], enriched_raw: List[Dict[str, Any]],
+                           class_advice: Optional[Dict[str, Advice]] = None) -> List[Dict[str, Any]]:
+        """
+        preds: original predictions list (disease/probability)
+        enriched_raw: result of enrich(preds) -- external enrichers may return any shape
+        Returns: list same length as preds of dicts with 'disease','probability','advice'
+        """
+        normalized = []
+        # Build lookup by normalized disease name for enriched_raw items
+        lookup = {}
+        for e in enriched_raw or []:
+            # try to find canonical disease name inside e
+            cand = e.get("disease") or e.get("ugonjwa") or e.get("name") or ""
+            cand_norm = self.normalize(str(cand)) if cand else ""
+            # store original entry under normalized key (multiple entries possible; keep first)
+            if cand_norm:
+                lookup.setdefault(cand_norm, e)
+        for p in preds:
+            d = p.get("disease")
+            dnorm = self.normalize(str(d))
+            e = lookup.get(dnorm)
+            advice_obj = None
+            if e:
+                # If entry already has 'advice' key, use it
+                if isinstance(e.get("advice"), dict):
+                    advice_obj = e.get("advice")
+                else:
+                    # If the enrich entry seems to have advice merged at top-level
+                    # Extract advice-related keys by excluding known prediction keys
+                    advice_keys = {k: v for k, v in e.items() if k not in ("disease", "probability", "ugonjwa", "name")}
+                    # If advisory content found, ensure 'ugonjwa' present
+                    if advice_keys:
+                        if "ugonjwa" not in advice_keys:
+                            advice_keys["ugonjwa"] = dnorm
+                        advice_obj = advice_keys
+            # If we didn't extract advice yet, look it up directly
+            if advice_obj is None:
+                try:
+                    advice_obj = self.advice_for(d, class_advice)
+                except Exception:
+                    advice_obj = self.local_advice_for(d)
+            # ensure advice is a dict
+            if not isinstance(advice_obj, dict):
+                advice_obj = {"ugonjwa": dnorm, "maelezo_fupi": str(advice_obj)}
+            normalized.append({"disease": d, "probability": p.get("probability"), "advice": advice_obj})
+        return normalized
+
+    def danger_signs(self) -> List[str]:
+        """Every danger sign (dalili_za_hatari) of the advice entries and the default advice."""
+        sources = list(self.advice_db.values())
+        if self.default_advice:
+            sources.append(self.default_advice)
+        signs = []
+        for adv in sources:
+            for item in (adv or {}).get("dalili_za_hatari", []) or []:
+                if isinstance(item, str):
+                    signs.append(item)
+        return signs
@@ -0,0 +1,90 @@
+"""
+Aho-Corasick matcher for symptom aliases.
+
+Compiles an alias -> canonical symptom map into a single automaton so a chat
+message is scanned once, whatever the size of the alias vocabulary.
+Matches must sit on word boundaries and overlapping matches are resolved
+leftmost-longest ("homa kali" wins over "homa").
+"""
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class AliasMatcher:
+    """Immutable automaton built from `{alias: canonical}`; rebuild to change it."""
+
+    def __init__(self, aliases: Dict[str, str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # per state: (alias length, canonical) for every alias ending here, longest first
+        self._out: List[List[Tuple[int, str]]] = [[]]
+
+        for alias, canonical in aliases.items():
+            key = (alias or "").lower().strip()
+            if key:
+                self._add(key, canonical)
+        self._link()
+        self.size = len(aliases)
+
+    def _add(self, key: str, canonical: str):
+        state = 0
+        for ch in key:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        if not any(length == len(key) for length, _ in self._out[state]):
+            self._out[state].append((len(key), canonical))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        for out in self._out:
+            out.sort(key=lambda item: item[0], reverse=True)
+
+    def matches(self, text: str) -> List[Tuple[int, int, str]]:
+        """Return non-overlapping `(start, end, canonical)` matches, leftmost-longest."""
+        lt = (text or "").lower()
+        n = len(lt)
+        found = []
+        state = 0
+        for end, ch in enumerate(lt, start=1):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            if not self._out[state] or (end < n and _is_word_char(lt[end])):
+                continue
+            for length, canonical in self._out[state]:
+                start = end - length
+                if start == 0 or not _is_word_char(lt[start - 1]):
+                    found.append((start, end, canonical))
+                    break  # longest alias ending here on a word boundary
+
+        found.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        result = []
+        last_end = 0
+        for start, end, canonical in found:
+            if start >= last_end:
+                result.append((start, end, canonical))
+                last_end = end
+        return result
+
+    def find(self, text: str) -> Set[str]:
+        """Canonical symptoms mentioned in `text`."""
+        return {canonical for _, _, canonical in self.matches(text)}
@@ -0,0 +1,112 @@
+"""
+Micro-batching for model inference.
+
+Concurrent chat requests in one process (threaded gunicorn workers / ASGI)
+each need `predict_proba` for a single row. `BatchPredictor` queues those
+rows, lets a dispatcher thread collect them for at most `max_wait_ms` (or
+until `max_batch` rows are waiting), runs one `predict_proba` per model on
+the stacked rows and hands every caller its own row back.
+
+With one request at a time per process (sync workers) a batch is a single
+row and only the wait is added, so this is off unless
+`DIAGNOSIS_BATCH_INFERENCE` is enabled.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPredictor:
+    """Collects single-row `predict_proba` calls into batches."""
+
+    def __init__(self, max_batch: int = 32, max_wait_ms: float = 2.0):
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[Tuple[object, np.ndarray, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        # metrics
+        self.batches = 0
+        self.rows = 0
+        self.fill = Counter()          # batch size -> number of batches
+
+    def predict_proba(self, model, row: np.ndarray, timeout: Optional[float] = 5.0) -> np.ndarray:
+        """Probabilities for one row (1-D or shape (1, n_features)) via the next batch."""
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((model, np.asarray(row).reshape(-1), fut))
+        return fut.result(timeout=timeout)
+
+    # -------------------------
+    # Dispatcher
+    # -------------------------
+    def _ensure_started(self):
+        # the thread does not survive a fork, so every worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="inference-batcher", daemon=True).start()
+
+    def _collect(self) -> List[Tuple[object, np.ndarray, Future]]:
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            # a model swap can put rows for two versions in one batch
+            groups: Dict[int, List[Tuple[object, np.ndarray, Future]]] = {}
+            for item in items:
+                groups.setdefault(id(item[0]), []).append(item)
+            for group in groups.values():
+                self._predict_group(group)
+            with self._lock:
+                self.batches += 1
+                self.rows += len(items)
+                self.fill[len(items)] += 1
+
+    @staticmethod
+    def _predict_group(group):
+        model = group[0][0]
+        try:
+            probs = model.predict_proba(np.vstack([row for _, row, _ in group]))
+        except Exception as e:
+            logger.exception("Batched predict_proba failed")
+            for _, _, fut in group:
+                fut.set_exception(e)
+            return
+        for i, (_, _, fut) in enumerate(group):
+            fut.set_result(probs[i:i + 1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            mean = (self.rows / self.batches) if self.batches else 0.0
+            return {
+                "batches": self.batches,
+                "rows": self.rows,
+                "mean_batch_size": mean,
+                "fill_ratio": mean / self.max_batch,
+                "batch_size_histogram": dict(sorted(self.fill.items())),
+            }
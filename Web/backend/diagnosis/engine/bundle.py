@@ -0,0 +1,251 @@
+"""
+Versioned inference bundle for the smart doctor.
+
+A bundle is a directory written by the training script that holds
+everything the chat flow needs to serve predictions:
+
+    manifest.json              schema version, content hash, vocabulary, class labels
+    forest/<name>.npy          compiled forest arrays (see compiled_forest.py)
+    disease_symptom.npy        per-disease symptom means from the reference dataset
+    advice.json                compiled advice (ADVICE_DB, defaults, advice per class label, generated advice)
+    question_tree.json         precomputed follow-up questions (see question_tree.py)
+
+Bundles live under `<root>/<version>/` and `<root>/CURRENT` names the active
+one. Arrays are plain `.npy` files so they can be opened with `mmap_mode="r"`
+and their pages shared by every worker process on the host.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .compiled_forest import CompiledForest
+from .question_tree import QuestionTree
+from .symptom_index import SymptomIndex
+
+BUNDLE_SCHEMA_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+CURRENT_NAME = "CURRENT"
+
+
+class BundleError(Exception):
+    """Raised when a bundle is missing, incomplete or of an unknown schema."""
+
+
+# what partly written or corrupt files raise (json, npy headers, truncated arrays, manifest fields)
+_CORRUPT_ERRORS = (OSError, ValueError, KeyError, TypeError, EOFError, pickle.UnpicklingError)
+
+
+def _sha256_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _content_hash(files: Dict[str, str]) -> str:
+    h = hashlib.sha256()
+    for name in sorted(files):
+        h.update(name.encode("utf-8"))
+        h.update(files[name].encode("ascii"))
+    return h.hexdigest()
+
+
+def presence_index(diseases: Sequence[str], symptom_columns: Sequence[str], means: np.ndarray) -> SymptomIndex:
+    """Symptom index of the diseases whose mean for a symptom is non-zero."""
+    cols = list(symptom_columns)
+    rows = ([cols[j] for j in np.flatnonzero(row)] for row in np.asarray(means) > 0)
+    return SymptomIndex(diseases, cols, rows)
+
+
+def _write_pointer(root: str, version: str):
+    """Atomically point `<root>/CURRENT` at `version`."""
+    fd, tmp = tempfile.mkstemp(dir=root, prefix=".current-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(root, CURRENT_NAME))
+
+
+def build_bundle(
+    root: str,
+    *,
+    forest: CompiledForest,
+    symptom_columns: Sequence[str],
+    class_labels: Sequence[str],
+    diseases: Sequence[str],
+    disease_symptom_means: np.ndarray,
+    advice: Dict[str, Any],
+    metadata: Optional[Dict[str, Any]] = None,
+    activate: bool = True,
+) -> str:
+    """Write a new bundle under `root` and return its version.
+
+    The bundle is staged in a temporary directory and renamed into place, so
+    readers never observe a half-written version.
+    """
+    os.makedirs(root, exist_ok=True)
+    stage = tempfile.mkdtemp(dir=root, prefix=".stage-")
+    try:
+        os.makedirs(os.path.join(stage, "forest"))
+        for name, arr in forest.arrays.items():
+            np.save(os.path.join(stage, "forest", f"{name}.npy"), np.ascontiguousarray(arr), allow_pickle=False)
+        np.save(os.path.join(stage, "disease_symptom.npy"),
+                np.ascontiguousarray(disease_symptom_means, dtype=np.float64), allow_pickle=False)
+        with open(os.path.join(stage, "advice.json"), "w", encoding="utf-8") as f:
+            json.dump(advice, f, ensure_ascii=False, sort_keys=True)
+        tree = QuestionTree.build(presence_index(diseases, symptom_columns, disease_symptom_means))
+        with open(os.path.join(stage, "question_tree.json"), "w", encoding="utf-8") as f:
+            json.dump(tree.to_dict(), f, ensure_ascii=False, sort_keys=True)
+
+        files = {}
+        for dirpath, _, filenames in os.walk(stage):
+            for fn in filenames:
+                full = os.path.join(dirpath, fn)
+                files[os.path.relpath(full, stage).replace(os.sep, "/")] = _sha256_file(full)
+
+        vocab = {
+            "symptom_columns": list(symptom_columns),
+            "class_labels": [str(c) for c in class_labels],
+            "diseases": [str(d) for d in diseases],
+        }
+        vocab_hash = hashlib.sha256(json.dumps(vocab, sort_keys=True).encode("utf-8")).hexdigest()
+        content_hash = _content_hash({**files, MANIFEST_NAME: vocab_hash})
+        version = f"v{BUNDLE_SCHEMA_VERSION}-{content_hash[:12]}"
+
+        manifest = {
+            "schema_version": BUNDLE_SCHEMA_VERSION,
+            "version": version,
+            "content_hash": content_hash,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "forest_depth": forest.depth,
+            "files": files,
+            "metadata": metadata or {},
+            **vocab,
+        }
+        with open(os.path.join(stage, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        target = os.path.join(root, version)
+        if os.path.isdir(target):
+            shutil.rmtree(stage)  # identical content already published
+        else:
+            os.replace(stage, target)
+    except Exception:
+        shutil.rmtree(stage, ignore_errors=True)
+        raise
+
+    if activate:
+        _write_pointer(root, version)
+    return version
+
+
+def current_version(root: str) -> Optional[str]:
+    """Version named by `<root>/CURRENT`, or None when no bundle was published."""
+    try:
+        with open(os.path.join(root, CURRENT_NAME), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def list_versions(root: str) -> List[str]:
+    """Published bundle versions under `root`, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    found = [d for d in os.listdir(root)
+             if not d.startswith(".") and os.path.exists(os.path.join(root, d, MANIFEST_NAME))]
+    return sorted(found, key=lambda d: os.path.getmtime(os.path.join(root, d, MANIFEST_NAME)))
+
+
+def activate_version(root: str, version: str):
+    """Point CURRENT at an already published version (checksums are verified first)."""
+    load_bundle(os.path.join(root, version), mmap=True, verify=True)
+    _write_pointer(root, version)
+
+
+class InferenceBundle:
+    """A loaded bundle; arrays stay memory-mapped when loaded with mmap."""
+
+    def __init__(self, path: str, manifest: Dict[str, Any], model: CompiledForest,
+                 disease_symptom_means: np.ndarray, advice: Dict[str, Any]):
+        self.path = path
+        self.manifest = manifest
+        self.version: str = manifest["version"]
+        self.content_hash: str = manifest["content_hash"]
+        self.symptom_columns: List[str] = list(manifest["symptom_columns"])
+        self.class_labels: List[str] = list(manifest["class_labels"])
+        self.diseases: List[str] = list(manifest["diseases"])
+        self.model = model
+        self.disease_symptom_means = disease_symptom_means
+        self.advice = advice
+
+    def symptom_index(self) -> SymptomIndex:
+        return presence_index(self.diseases, self.symptom_columns, self.disease_symptom_means)
+
+    def question_tree(self, index: SymptomIndex) -> QuestionTree:
+        """Load the precomputed tree (bundles written before it existed build it here)."""
+        path = os.path.join(self.path, "question_tree.json")
+        if not os.path.exists(path):
+            return QuestionTree.build(index)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return QuestionTree.from_dict(index, json.load(f))
+        except _CORRUPT_ERRORS as e:
+            raise BundleError(f"Bundle {self.version}: unreadable question tree: {e!r}") from e
+
+    def verify(self):
+        """Re-hash every file against the manifest (reads the whole bundle)."""
+        for name, digest in self.manifest["files"].items():
+            if _sha256_file(os.path.join(self.path, name)) != digest:
+                raise BundleError(f"Bundle {self.version}: checksum mismatch for {name}")
+
+
+def load_bundle(path: str, mmap: bool = True, verify: bool = False) -> InferenceBundle:
+    """Load the bundle at `path`; anything missing, truncated or malformed raises BundleError."""
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        raise BundleError(f"No bundle manifest at {manifest_path}")
+    try:
+        bundle = _read_bundle(path, manifest_path, mmap)
+        if verify:
+            bundle.verify()
+    except BundleError:
+        raise
+    except _CORRUPT_ERRORS as e:
+        raise BundleError(f"Bundle at {path} is unreadable: {e!r}") from e
+    return bundle
+
+
+def _read_bundle(path: str, manifest_path: str, mmap: bool) -> InferenceBundle:
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or manifest.get("schema_version") != BUNDLE_SCHEMA_VERSION:
+        schema = manifest.get("schema_version") if isinstance(manifest, dict) else None
+        raise BundleError(f"Unsupported bundle schema {schema} at {path}")
+
+    mode = "r" if mmap else None
+    forest_dir = os.path.join(path, "forest")
+    arrays = {
+        name[:-4]: np.load(os.path.join(forest_dir, name), mmap_mode=mode, allow_pickle=False)
+        for name in os.listdir(forest_dir) if name.endswith(".npy")
+    }
+    model = CompiledForest(arrays, depth=manifest.get("forest_depth"))
+    means = np.load(os.path.join(path, "disease_symptom.npy"), mmap_mode=mode, allow_pickle=False)
+    with open(os.path.join(path, "advice.json"), encoding="utf-8") as f:
+        advice = json.load(f)
+    return InferenceBundle(path, manifest, model, means, advice)
+
+
+def load_current_bundle(root: str, mmap: bool = True, verify: bool = False) -> Optional[InferenceBundle]:
+    """Load the bundle named by `<root>/CURRENT`, or None if there is none."""
+    version = current_version(root)
+    if not version:
+        return None
+    return load_bundle(os.path.join(root, version), mmap=mmap, verify=verify)
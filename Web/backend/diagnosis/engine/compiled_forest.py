@@ -0,0 +1,225 @@
+"""
+Compiled, pure-NumPy evaluator for the calibrated random forest.
+
+`ML/ML_TEST/model_training1.py` saves a `CalibratedClassifierCV(RandomForest)`
+(one fitted forest + sigmoid calibrators per CV fold). Calling its
+`predict_proba` for a single chat row goes through sklearn/joblib for every
+tree. `compile_calibrated_forest` flattens all trees of all folds into
+contiguous node arrays and keeps the sigmoid coefficients, and
+`CompiledForest.predict_proba` walks every tree at once with vectorised
+NumPy, repeating sklearn's arithmetic in the same order.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+try:
+    from scipy.special import expit as _expit
+except Exception:  # scipy is optional at serving time
+    def _expit(x):
+        return 1.0 / (1.0 + np.exp(-x))
+
+COMPILED_FOREST_VERSION = 1
+
+_ARRAY_KEYS = (
+    "feature", "threshold", "left", "right", "leaf_id", "leaf_value",
+    "roots", "fold_offsets", "calib_a", "calib_b", "calib_mask", "classes",
+)
+
+
+def _sklearn_version():
+    import sklearn
+    return tuple(int(p) for p in sklearn.__version__.split(".")[:2])
+
+
+def _tree_leaf_proba(tree, values_normalized: bool) -> np.ndarray:
+    """Per-node class probabilities exactly as `DecisionTreeClassifier.predict_proba` returns them."""
+    proba = np.array(tree.tree_.value[:, 0, : tree.n_classes_], dtype=np.float64)
+    if not values_normalized:
+        # sklearn < 1.4 stores weighted counts and normalises at predict time
+        normalizer = proba.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        proba /= normalizer
+    return proba
+
+
+def compile_calibrated_forest(calibrated) -> "CompiledForest":
+    """Flatten a fitted `CalibratedClassifierCV(RandomForestClassifier, method="sigmoid")`."""
+    if getattr(calibrated, "method", "sigmoid") != "sigmoid":
+        raise ValueError("Only sigmoid calibration can be compiled.")
+
+    classes = np.asarray(calibrated.classes_)
+    n_classes = len(classes)
+    values_normalized = _sklearn_version() >= (1, 4)
+
+    feature, threshold, left, right, leaf_id = [], [], [], [], []
+    leaf_value, roots, fold_offsets = [], [], [0]
+    calib_a = np.zeros((len(calibrated.calibrated_classifiers_), n_classes))
+    calib_b = np.zeros_like(calib_a)
+    calib_mask = np.zeros(calib_a.shape, dtype=bool)
+    n_nodes = n_leaves = 0
+
+    for fold, cc in enumerate(calibrated.calibrated_classifiers_):
+        forest = getattr(cc, "estimator", None) or getattr(cc, "base_estimator")
+        calibrators = getattr(cc, "calibrators", None) or getattr(cc, "calibrators_")
+        # column of every fold class inside `calibrated.classes_`
+        positions = np.searchsorted(classes, forest.classes_)
+        if n_classes == 2:
+            positions = positions[1:]
+
+        for pos, calibrator in zip(positions, calibrators):
+            calib_a[fold, pos] = calibrator.a_
+            calib_b[fold, pos] = calibrator.b_
+            calib_mask[fold, pos] = True
+
+        for tree in forest.estimators_:
+            t = tree.tree_
+            is_leaf = t.children_left == -1
+            node_ids = np.arange(t.node_count)
+            proba = _tree_leaf_proba(tree, values_normalized)[is_leaf]
+            # spread fold columns over the full class list (missing classes stay 0)
+            full = np.zeros((len(proba), n_classes))
+            full[:, np.searchsorted(classes, forest.classes_)] = proba
+
+            roots.append(n_nodes)
+            feature.append(np.where(is_leaf, 0, t.feature).astype(np.int32))
+            threshold.append(t.threshold.astype(np.float64))
+            # leaves point to themselves so every row can take the same number of steps
+            left.append(np.where(is_leaf, node_ids, t.children_left).astype(np.int32) + n_nodes)
+            right.append(np.where(is_leaf, node_ids, t.children_right).astype(np.int32) + n_nodes)
+            ids = np.full(t.node_count, -1, dtype=np.int32)
+            ids[is_leaf] = np.arange(n_leaves, n_leaves + len(proba), dtype=np.int32)
+            leaf_id.append(ids)
+            leaf_value.append(full)
+            n_nodes += t.node_count
+            n_leaves += len(proba)
+        fold_offsets.append(len(roots))
+
+    return CompiledForest({
+        "feature": np.concatenate(feature),
+        "threshold": np.concatenate(threshold),
+        "left": np.concatenate(left),
+        "right": np.concatenate(right),
+        "leaf_id": np.concatenate(leaf_id),
+        "leaf_value": np.concatenate(leaf_value),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "fold_offsets": np.asarray(fold_offsets, dtype=np.int32),
+        "calib_a": calib_a,
+        "calib_b": calib_b,
+        "calib_mask": calib_mask,
+        "classes": classes,
+    })
+
+
+class CompiledForest:
+    """Drop-in `predict_proba` replacement for the calibrated forest."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], depth: Optional[int] = None):
+        missing = [k for k in _ARRAY_KEYS if k not in arrays]
+        if missing:
+            raise ValueError(f"Compiled forest is missing arrays: {missing}")
+        self.arrays = {k: arrays[k] for k in _ARRAY_KEYS}
+        for k, v in self.arrays.items():
+            setattr(self, k, v)
+        self.classes_ = self.classes
+        # number of traversal steps that brings every tree to a leaf
+        self.depth = int(depth) if depth is not None else self._max_depth()
+
+    def _max_depth(self) -> int:
+        depth = 0
+        nodes = self.roots.astype(np.int64)
+        while True:
+            nxt = np.concatenate([self.left[nodes], self.right[nodes]])
+            nxt = nxt[self.leaf_id[nxt] == -1]
+            depth += 1
+            if not len(nxt):
+                return depth
+            nodes = np.unique(nxt)
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def save(self, path: str):
+        np.savez(path, version=np.array(COMPILED_FOREST_VERSION), **self.arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "CompiledForest":
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data["version"]) if "version" in data else None
+            if version != COMPILED_FOREST_VERSION:
+                raise ValueError(f"Unsupported compiled forest version {version} in {path}")
+            return cls({k: data[k] for k in _ARRAY_KEYS})
+
+    # -------------------------
+    # Inference
+    # -------------------------
+    def _forest_sum(self, X: np.ndarray, start: int, stop: int) -> np.ndarray:
+        """Sum of per-tree probabilities for trees [start, stop), added tree by tree like sklearn."""
+        nodes = np.broadcast_to(self.roots[start:stop], (X.shape[0], stop - start)).astype(np.int64)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        for _ in range(self.depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        per_tree = self.leaf_value[self.leaf_id[nodes]]           # (n_samples, n_trees, n_classes)
+        # cumulative sum keeps sklearn's sequential `out += tree_proba` order
+        return np.cumsum(per_tree, axis=1)[:, -1, :]
+
+    def predict_proba(self, X) -> np.ndarray:
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        n_classes = len(self.classes)
+        n_folds = len(self.fold_offsets) - 1
+        mean_proba = np.zeros((X.shape[0], n_classes))
+
+        for fold in range(n_folds):
+            start, stop = int(self.fold_offsets[fold]), int(self.fold_offsets[fold + 1])
+            predictions = self._forest_sum(X, start, stop)
+            predictions /= stop - start
+
+            proba = np.zeros((X.shape[0], n_classes))
+            for class_idx in np.flatnonzero(self.calib_mask[fold]):
+                this_pred = predictions[:, class_idx]
+                proba[:, class_idx] = _expit(-(self.calib_a[fold, class_idx] * this_pred + self.calib_b[fold, class_idx]))
+            if n_classes == 2:
+                proba[:, 0] = 1.0 - proba[:, 1]
+            else:
+                denominator = np.sum(proba, axis=1)[:, np.newaxis]
+                uniform_proba = np.full_like(proba, 1 / n_classes)
+                proba = np.divide(proba, denominator, out=uniform_proba, where=denominator != 0)
+            proba[(1.0 < proba) & (proba <= 1.0 + 1e-5)] = 1.0
+            mean_proba += proba
+
+        mean_proba /= n_folds
+        return mean_proba
+
+    def predict(self, X) -> np.ndarray:
+        return self.classes[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def check_parity(compiled: CompiledForest, calibrated, X, atol: float = 0.0) -> Optional[float]:
+    """Compare compiled and sklearn probabilities on `X`.
+
+    Returns None when the outputs are bit-identical, otherwise the largest
+    absolute difference. Raises AssertionError when it exceeds `atol`.
+    Forest `n_jobs` is forced to 1 for the comparison because threaded
+    accumulation in sklearn does not add trees in a fixed order.
+    """
+    forests = [getattr(cc, "estimator", None) or getattr(cc, "base_estimator")
+               for cc in calibrated.calibrated_classifiers_]
+    saved_jobs = [f.n_jobs for f in forests]
+    try:
+        for f in forests:
+            f.n_jobs = 1
+        expected = calibrated.predict_proba(X)
+    finally:
+        for f, n in zip(forests, saved_jobs):
+            f.n_jobs = n
+    got = compiled.predict_proba(np.asarray(X))
+    if np.array_equal(expected, got):
+        return None
+    diff = float(np.max(np.abs(expected - got)))
+    if diff > atol:
+        raise AssertionError(f"Compiled forest differs from sklearn by {diff:g}")
+    return diff
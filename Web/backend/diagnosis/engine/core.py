@@ -0,0 +1,548 @@
+"""
+The smart-doctor diagnosis engine.
+
+`DiagnosisEngine` owns everything the chat flow needs (model registry,
+advice, symptom matchers, danger signs, prediction cache) and runs one chat
+turn as plain Python: `step(conversation, message)` updates the
+conversation state and returns the reply. It has no Django dependency, so
+the Django views, the Rasa action server and offline scripts all share it.
+
+Nothing is loaded at construction time. The bundle (or the legacy
+artifacts), pandas and the matchers are loaded on first use, by whichever
+thread gets there first.
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence
+
+import numpy as np
+
+from .advice import AdviceBook, build_auto_advice, disease_symptom_means, load_ushauri
+from .alias_matcher import AliasMatcher
+from .batching import BatchPredictor
+from .bundle import BundleError, InferenceBundle, load_current_bundle
+from .compiled_forest import CompiledForest
+from .fuzzy_matcher import FuzzySymptomMatcher, ngrams
+from .metrics import METRICS, Metrics
+from .model_registry import ModelRegistry, ServingState
+from .prediction_cache import PredictionCache, prediction_key
+from .symptom_index import SymptomIndex
+from .text import regex_tokenize, tokenize
+
+logger = logging.getLogger(__name__)
+
+# Web/backend/ML/ML_TEST, next to the diagnosis app
+DEFAULT_MODEL_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "ML", "ML_TEST")
+
+SYMPTOM_ALIASES = {
+    "fever": "homa", "high fever": "homa_kali", "homa kali": "homa_kali",
+    "chills": "baridi", "baridi": "baridi",
+    "headache": "maumivu_ya_kichwa", "kichwa kinauma": "maumivu_ya_kichwa",
+}
+
+# yes/no tokens
+YES_TOKENS = {"ndio", "ndiyo", "yes", "y", "naam", "sawa", "poa"}
+NO_TOKENS = {"hapana", "la", "no", "si", "sio", "siyo"}
+RESET_TOKENS = {"reset", "anzisha upya", "anza upya", "start over"}
+
+# symptoms after which the engine stops asking and predicts
+MAX_SYMPTOMS_BEFORE_PREDICT = 6
+DANGER_SIGN_MEMO_SIZE = 1024
+
+
+def _lower(s: str) -> str:
+    return (s or "").lower().strip()
+
+
+def normalize_yes_no(msg: str) -> Optional[str]:
+    m = _lower(msg)
+    if m in YES_TOKENS: return "YES"
+    if m in NO_TOKENS: return "NO"
+    return None
+
+
+def question_text(symptom: str) -> str:
+    return f"Je, una dalili ya '{symptom.replace('_', ' ')}'? (ndio/hapana)"
+
+
+class Conversation:
+    """Chat state for callers without a ChatSession (Rasa actions, scripts).
+
+    `step()` only needs `symptoms`, `pending_questions` and `meta`, so a
+    ChatSession can be passed directly as well.
+    """
+
+    def __init__(self, symptoms: Optional[List[str]] = None, pending_questions: Optional[List[str]] = None,
+                 meta: Optional[Dict[str, Any]] = None):
+        self.symptoms = list(symptoms or [])
+        self.pending_questions = list(pending_questions or [])
+        self.meta = dict(meta or {})
+
+
+class TurnResult:
+    """Outcome of one chat turn.
+
+    `payload` is the JSON response body. `bot_message` is the reply to store
+    in the history (None when a pending question is repeated), and `final`
+    marks a turn that ended with a prediction.
+    """
+
+    def __init__(self, payload: Dict[str, Any], bot_message: Optional[str] = None, final: bool = False):
+        self.payload = payload
+        self.bot_message = bot_message
+        self.final = final
+
+
+class DiagnosisEngine:
+    """Lazily loaded model + advice + symptom matching behind the smart-doctor chat."""
+
+    def __init__(self, model_dir: Optional[str] = None, bundle_root: Optional[str] = None,
+                 poll_interval: float = 30.0, prediction_cache: Optional[PredictionCache] = None,
+                 batch_predictor: Optional[BatchPredictor] = None, metrics: Optional[Metrics] = None):
+        self.model_dir = model_dir or DEFAULT_MODEL_DIR
+        self.bundle_root = bundle_root or os.path.join(self.model_dir, "bundles")
+        self.poll_interval = poll_interval
+        self.prediction_cache = prediction_cache or PredictionCache()
+        self.batch_predictor = batch_predictor
+        self.metrics = metrics or METRICS
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        # filled by _load(); advice and matchers live on each ServingState
+        self.registry: Optional[ModelRegistry] = None
+        self.aliases: Dict[str, str] = dict(SYMPTOM_ALIASES)
+
+    # -------------------------
+    # Loading
+    # -------------------------
+    def ensure_loaded(self) -> "DiagnosisEngine":
+        if self._loaded:
+            return self
+        with self._lock:
+            if not self._loaded:
+                with self.metrics.span("engine_load"):
+                    self._load()
+                self._loaded = True
+        return self
+
+    def current(self) -> ServingState:
+        """The serving snapshot to use for one whole request."""
+        return self.ensure_loaded().registry.current()
+
+    @property
+    def advice(self) -> AdviceBook:
+        """Advice book of the serving version."""
+        return self.current().advice
+
+    @property
+    def symptom_columns(self) -> List[str]:
+        return self.current().symptom_columns
+
+    def _load(self):
+        # Prefer the published inference bundle: one manifest + mmap-ed arrays per process
+        state: Optional[ServingState] = None
+        try:
+            bundle = load_current_bundle(self.bundle_root)
+            if bundle is not None:
+                state = self.state_from_bundle(bundle)
+        except (BundleError, OSError, ValueError):
+            logger.exception("Inference bundle at %s unusable — falling back to separate artifacts", self.bundle_root)
+
+        if state is None:
+            model, symptom_columns, class_labels, reference = self._load_legacy()
+            target_col = "ugonjwa" if "ugonjwa" in reference.columns else "Ugonjwa"
+            # Disease x symptom bitmask index, built once from the reference dataset
+            index = SymptomIndex.from_dataframe(reference, target_col, symptom_columns)
+            diseases, means = disease_symptom_means(reference, target_col, symptom_columns)
+            sources = load_ushauri(self.model_dir)
+            advice = AdviceBook(
+                sources["advice_db"], build_auto_advice(diseases, symptom_columns, means),
+                default_advice=sources["default_advice"], use_class_advice=False,
+                external_advice_for=sources["advice_for"], external_enrich=sources["enrich"],
+            )
+            state = self._equip(ServingState("unversioned", model, symptom_columns, class_labels, index), advice)
+
+        # new versions are built (advice and matchers included) and warmed in the watcher thread
+        self.registry = ModelRegistry(self.bundle_root, state, poll_interval=self.poll_interval,
+                                      build_state=self.state_from_bundle)
+        self.registry.add_listener(lambda old, new: self.prediction_cache.clear())
+
+    def state_from_bundle(self, bundle: InferenceBundle) -> ServingState:
+        """Serving state of a bundle, with the advice book and matchers of that version."""
+        state = ServingState.from_bundle(bundle)
+        # bundles written before the table was persisted build it from the stored means
+        auto_advice = bundle.advice.get("auto_advice") or build_auto_advice(
+            bundle.diseases, bundle.symptom_columns, bundle.disease_symptom_means)
+        advice_db = bundle.advice.get("advice_db", {}) or {}
+        advice = AdviceBook(
+            advice_db, auto_advice, default_advice=bundle.advice.get("default_advice", {}) or {},
+            use_class_advice=bool(advice_db),
+        )
+        return self._equip(state, advice)
+
+    def _load_legacy(self):
+        """Model, vocabulary, class labels and dataset from the separate training artifacts."""
+        import joblib
+        import pandas as pd
+
+        model_path = os.path.join(self.model_dir, "magonjwa_model.pkl")
+        compiled_path = os.path.join(self.model_dir, "magonjwa_model_compiled.npz")
+        symptoms_path = os.path.join(self.model_dir, "symptom_columns.pkl")
+        label_encoder_path = os.path.join(self.model_dir, "label_encoder.pkl")
+        dataset_path = os.path.join(self.model_dir, "magonjwa_ya_kuambukiza_dataset_swahili_full.csv")
+        for p, msg in [
+            (compiled_path if os.path.exists(compiled_path) else model_path, "Model"),
+            (symptoms_path, "Symptom columns"),
+            (label_encoder_path, "Label encoder"),
+            (dataset_path, "Dataset"),
+        ]:
+            if not os.path.exists(p):
+                raise FileNotFoundError(f"{msg} not found at {p} (expected at {p})")
+
+        # Prefer the compiled forest (same probabilities, no sklearn/joblib per call)
+        if os.path.exists(compiled_path):
+            model = CompiledForest.load(compiled_path)
+        else:
+            model = joblib.load(model_path)
+        symptom_columns = list(joblib.load(symptoms_path))
+        label_encoder = joblib.load(label_encoder_path)
+        class_labels = [str(c) for c in label_encoder.classes_]
+        return model, symptom_columns, class_labels, pd.read_csv(dataset_path)
+
+    # -------------------------
+    # Vocabulary (aliases, fuzzy matcher, danger signs)
+    # -------------------------
+    def _equip(self, state: ServingState, advice: AdviceBook) -> ServingState:
+        """Attach the advice book and everything built from it and the vocabulary, before publishing."""
+        state.advice = advice
+        state.alias_matcher = self._alias_matcher(state.symptom_columns)
+        # Batched WRatio matcher over the symptom vocabulary (with a token LRU)
+        state.fuzzy_matcher = FuzzySymptomMatcher(state.symptom_columns, max_k=8)
+        state.danger_sign_symptoms = self._danger_sign_index(state)
+        return state
+
+    def _alias_matcher(self, symptom_columns: Sequence[str]) -> AliasMatcher:
+        aliases = dict(self.aliases)
+        for sw in symptom_columns:
+            aliases.setdefault(sw, sw)
+            aliases.setdefault(sw.replace("_", " "), sw)
+        known = set(symptom_columns)
+        return AliasMatcher({k: v for k, v in aliases.items() if v in known})
+
+    def rebuild_alias_matcher(self) -> AliasMatcher:
+        """Recompile the serving version's alias automaton; call after changing `aliases`."""
+        state = self.current()
+        state.alias_matcher = self._alias_matcher(state.symptom_columns)
+        return state.alias_matcher
+
+    def _danger_sign_index(self, state: ServingState) -> Dict[str, FrozenSet[str]]:
+        """Resolve every danger sign of the version's advice to symptoms, once per version.
+
+        Danger signs are tokenized with the regex tokenizer, so loading or hot-swapping
+        a version never loads the spaCy pipeline (it stays lazy, see `text`).
+        """
+        index: Dict[str, FrozenSet[str]] = {}
+        for item in state.advice.danger_signs():
+            if item not in index:
+                index[item] = frozenset(self._extract_symptoms(item, state, regex_tokenize))
+        return index
+
+    # -------------------------
+    # Symptom extraction
+    # -------------------------
+    def extract_symptoms(self, user_text: str, state: Optional[ServingState] = None) -> List[str]:
+        if not user_text: return []
+        return self._extract_symptoms(user_text, state or self.current())
+
+    def _extract_symptoms(self, user_text: str, state: ServingState, tokenizer=tokenize) -> List[str]:
+        span = self.metrics.span
+        with span("tokenize"):
+            tokens = tokenizer(user_text)
+        with span("alias_match"):
+            s1 = state.alias_matcher.find(user_text)
+        with span("fuzzy_match"):
+            # one score matrix for every token and 2-3 token window plus the whole message
+            words = tokens + ngrams(tokens)
+            ranked = state.fuzzy_matcher.rank(words + [user_text])
+            s2 = state.fuzzy_matcher.select(ranked[:len(words)], top_k=5, threshold=87)
+            s3 = state.fuzzy_matcher.select(ranked[len(words):], top_k=8, threshold=90)
+        return sorted(set(s1) | set(s2) | set(s3))
+
+    def danger_sign_symptoms_for(self, item: str, state: Optional[ServingState] = None) -> FrozenSet[str]:
+        """Symptoms named by a danger sign (advice outside the advice DB is resolved once, then kept in a bounded memo)."""
+        state = state or self.current()
+        found = state.danger_sign_symptoms.get(item)
+        if found is not None:
+            return found
+        memo = state.danger_sign_memo
+        with state.memo_lock:
+            found = memo.get(item)
+            if found is not None:
+                memo.move_to_end(item)
+                return found
+        found = frozenset(self._extract_symptoms(item, state, regex_tokenize))
+        with state.memo_lock:
+            memo[item] = found
+            while len(memo) > DANGER_SIGN_MEMO_SIZE:
+                memo.popitem(last=False)
+        return found
+
+    # -------------------------
+    # Prediction
+    # -------------------------
+    def _predict_proba(self, clf, X, n_classes: int):
+        if hasattr(clf, "predict_proba"):
+            if self.batch_predictor is not None and len(X) == 1:
+                return self.batch_predictor.predict_proba(clf, X)
+            return clf.predict_proba(X)
+        pred = clf.predict(X)
+        probs = np.full((len(pred), n_classes), 1e-6, dtype=float)
+        for i, p in enumerate(pred):
+            probs[i, p] = 1.0
+        return probs
+
+    def _predict_uncached(self, symptoms_list, top_n, state: ServingState):
+        vec = state.vectorize(symptoms_list).reshape(1, -1)
+        with self.metrics.span("predict_proba"):
+            probs = self._predict_proba(state.model, vec, len(state.class_labels))[0]
+        top_idx = np.argsort(probs)[::-1][:top_n]
+        results = [{"disease": state.class_labels[i], "probability": float(probs[i])} for i in top_idx]
+        max_p = float(probs[top_idx[0]]) if len(top_idx) else 0.0
+        conf = "high" if max_p >= 0.75 else "medium" if max_p >= 0.55 else "low"
+        return results, conf
+
+    def predict(self, symptoms_list, top_n: int = 3, state: Optional[ServingState] = None):
+        """Top `top_n` `{"disease", "probability"}` dicts and a high/medium/low confidence."""
+        state = state or self.current()
+        # only vocabulary symptoms change the input row, so they alone form the key
+        known = [s for s in symptoms_list if s in state.column_pos]
+        key = prediction_key(state.version, known, top_n)
+        with self.metrics.span("predict"):
+            return self.prediction_cache.get_or_compute(key, lambda: self._predict_uncached(known, top_n, state))
+
+    # -------------------------
+    # Advice
+    # -------------------------
+    @staticmethod
+    def _class_advice(state: ServingState) -> Optional[Dict[str, Any]]:
+        return state.bundle.advice.get("class_advice") if state.bundle is not None else None
+
+    def advice_for(self, disease: str, state: Optional[ServingState] = None) -> Dict[str, Any]:
+        state = state or self.current()
+        return state.advice.advice_for(disease, self._class_advice(state))
+
+    def enrich(self, predictions: List[Dict[str, Any]], state: Optional[ServingState] = None) -> List[Dict[str, Any]]:
+        """Predictions as `{"disease", "probability", "advice"}`, whatever shape the advice source returns."""
+        state = state or self.current()
+        advice, class_advice = state.advice, self._class_advice(state)
+        with self.metrics.span("enrich"):
+            try:
+                raw = advice.enrich(predictions, class_advice)
+            except Exception as e:
+                logger.exception("Error enriching predictions: %s", e)
+                raw = [{**p, "advice": advice.local_advice_for(p.get("disease"))} for p in predictions]
+            return advice.normalize_enriched(predictions, raw, class_advice)
+
+    # -------------------------
+    # Question flow
+    # -------------------------
+    @staticmethod
+    def upgrade_meta(meta: Dict[str, Any], symptoms: Sequence[str], state: ServingState) -> Dict[str, Any]:
+        """Bring conversation meta in line with the serving model (in place).
+
+        Candidate name lists of older sessions become masks. Masks written under
+        another model version are positional over that version's vocabulary, so
+        they are rebuilt from the reported symptoms and the "no" answers.
+        Follow-up questions now come from the question tree, so the old
+        candidate-symptom queue is dropped.
+        """
+        index = state.symptom_index
+        if "candidates" in meta:
+            # name lists are version independent
+            meta["model_version"] = state.version
+            meta["candidates_mask"] = index.diseases_mask(meta.pop("candidates") or [])
+        meta.pop("candidate_symptoms", None)
+        meta.pop("candidate_symptoms_mask", None)
+        if meta.get("model_version") != state.version and meta.get("candidates_mask"):
+            mask = index.diseases_with_all(symptoms)
+            for q in meta.get("asked", []):
+                if q not in symptoms:
+                    mask = index.filter_by_presence(mask, q, present=False)
+            meta["candidates_mask"] = mask
+        meta["model_version"] = state.version
+        return meta
+
+    @staticmethod
+    def candidates_mask(meta: Dict[str, Any]) -> int:
+        return int(meta.get("candidates_mask") or 0)
+
+    def step(self, conv, message: str, top_n: int = 3, debug: bool = False) -> TurnResult:
+        """Run one chat turn on `conv` (a Conversation or ChatSession), updating it in place."""
+        message = (message or "").strip()
+        conv.symptoms = conv.symptoms or []
+        conv.pending_questions = conv.pending_questions or []
+        # one model snapshot for the whole turn, even if a new version is swapped in meanwhile
+        state = self.current()
+        index = state.symptom_index
+        conv.meta = self.upgrade_meta(conv.meta or {}, conv.symptoms, state)
+
+        if _lower(message) in RESET_TOKENS:
+            conv.symptoms = []
+            conv.pending_questions = []
+            conv.meta = {}
+            bot = "Tumerejea mwanzo. Tafadhali taja dalili zako - taja dalili mbili kwanza (mf. homa, maumivu ya kichwa)."
+            return TurnResult({"response": bot, "symptoms": conv.symptoms, "possible_diseases": []}, bot)
+
+        yn = normalize_yes_no(message)
+        if yn and conv.pending_questions:
+            q_sym = conv.pending_questions.pop(0)
+            asked = conv.meta.get('asked', [])
+            asked.append(q_sym)
+            conv.meta['asked'] = asked
+            conv.meta['candidates_mask'] = index.filter_by_presence(
+                self.candidates_mask(conv.meta), q_sym, present=(yn == "YES"))
+            if yn == "YES" and q_sym not in conv.symptoms:
+                conv.symptoms.append(q_sym)
+
+        with self.metrics.span("extract_symptoms"):
+            newly = self.extract_symptoms(message, state)
+        if newly:
+            valid_new = [s for s in newly if s in state.column_pos]
+            conv.symptoms = sorted(set(conv.symptoms) | set(valid_new))
+
+        if (not newly) and (not yn) and (not conv.pending_questions) and not conv.symptoms:
+            bot = "Tafadhali tu tuzungumzie tu dalili za magonjwa (taja dalili mbili kwanza)."
+            return TurnResult({"response": bot, "symptoms": conv.symptoms, "possible_diseases": []}, bot)
+
+        if len(conv.symptoms) < 2:
+            bot = "Asante. Tafadhali taja dalili nyingine (taja jumla ya dalili 2 ili nikupe maswali maalum)."
+            return TurnResult({"response": bot, "symptoms": conv.symptoms, "possible_diseases": []}, bot)
+
+        if not self.candidates_mask(conv.meta):
+            conv.meta['candidates_mask'] = index.diseases_with_all(conv.symptoms)
+
+        if conv.pending_questions:
+            q = conv.pending_questions[0]
+            return TurnResult({
+                "response": question_text(q),
+                "symptoms": conv.symptoms,
+                "possible_diseases": [],
+                "next_question": q,
+            })
+
+        # most informative question for the remaining candidates (None: one candidate left / nothing separates them)
+        with self.metrics.span("question_tree"):
+            next_sym = state.question_tree.next_question(
+                self.candidates_mask(conv.meta),
+                known=set(conv.symptoms) | set(conv.meta.get('asked', [])),
+            )
+
+        if next_sym and len(conv.symptoms) < MAX_SYMPTOMS_BEFORE_PREDICT:
+            conv.pending_questions.append(next_sym)
+            q_text = question_text(next_sym)
+            return TurnResult({
+                "response": q_text,
+                "symptoms": conv.symptoms,
+                "possible_diseases": index.disease_names(self.candidates_mask(conv.meta)),
+                "next_question": next_sym,
+            }, q_text)
+
+        result = self._final_prediction(conv, state, top_n)
+        if debug:
+            result.payload['debug_tokens'] = newly
+            result.payload['meta'] = conv.meta
+            result.payload['prediction_cache'] = self.prediction_cache.stats()
+            if self.batch_predictor is not None:
+                result.payload['inference_batches'] = self.batch_predictor.stats()
+            logger.info("PREDICTIONS: %s", result.payload['possible_diseases'])
+            logger.info("ENRICHED_NORMALIZED: %s", result.payload['enriched_predictions'])
+        return result
+
+    def _final_prediction(self, conv, state: ServingState, top_n: int) -> TurnResult:
+        predictions, conf = self.predict(conv.symptoms, top_n=top_n, state=state)
+        enriched_predictions = self.enrich(predictions, state)
+
+        # Construct response text and top_advice
+        lines = []
+        if predictions:
+            lines.append("Kulingana na dalili ulizotoa, magonjwa yanayowezekana zaidi ni:")
+            for p in predictions:
+                prob = p.get("probability")
+                try:
+                    pct = f"{prob:.0%}" if (isinstance(prob, float) or isinstance(prob, (int))) else "—"
+                except Exception:
+                    pct = "—"
+                lines.append(f"- {p.get('disease')} ({pct})")
+        else:
+            lines.append("Sijaweza kupata utabiri wowote kwa dalili hizi.")
+
+        top1 = predictions[0]["disease"] if predictions else None
+        top_advice = {}
+        red_flag = False
+        red_hits = []
+
+        if top1:
+            # find normalized enriched entry by matching disease ignoring case
+            top_en = next((e for e in enriched_predictions if str(e.get("disease")).strip().lower() == str(top1).strip().lower()), None)
+            if top_en:
+                top_advice = top_en.get("advice") or {}
+            else:
+                try:
+                    top_advice = self.advice_for(top1, state)
+                except Exception:
+                    top_advice = state.advice.local_advice_for(top1)
+
+            # append pieces of top_advice to bot message
+            if top_advice and isinstance(top_advice, dict):
+                if top_advice.get('maelezo_fupi'):
+                    lines.append("")
+                    lines.append(f"Maelezo: {top_advice['maelezo_fupi']}")
+                if top_advice.get('dalili_za_kuangalia'):
+                    lines.append("Dalili muhimu za kuangalia: " + "; ".join(top_advice['dalili_za_kuangalia']))
+                if top_advice.get('vipimo'):
+                    lines.append("Vipimo vinavyopendekezwa: " + "; ".join(top_advice['vipimo']))
+                if top_advice.get('tiba'):
+                    lines.append("Tiba ya kawaida (fuata ushauri wa daktari): " + "; ".join(top_advice['tiba']))
+                if top_advice.get('kinga'):
+                    lines.append("Kinga: " + "; ".join(top_advice['kinga']))
+                if top_advice.get('ushauri_wa_nyumbani'):
+                    lines.append("Ushauri wa nyumbani: " + "; ".join(top_advice['ushauri_wa_nyumbani']))
+
+                # danger signs detection
+                reported = set(conv.symptoms)
+                with self.metrics.span("danger_signs"):
+                    red_hits = [item for item in top_advice.get('dalili_za_hatari', [])
+                                if isinstance(item, str) and self.danger_sign_symptoms_for(item, state) & reported]
+                red_flag = bool(red_hits)
+
+        # add confidence sentence
+        if predictions:
+            p0 = predictions[0].get('probability') or 0.0
+            try:
+                p0 = float(p0)
+            except Exception:
+                p0 = 0.0
+            if p0 >= 0.75:
+                lines.append("\nUhakika: wa juu. Bado hakikisha kwa daktari kabla ya tiba.")
+            elif p0 >= 0.55:
+                lines.append("\nUhakika: wa kati. Pendekezo: fanya vipimo vilivyotajwa au muone daktari.")
+            else:
+                lines.append("\nUhakika: mdogo. Taja dalili zaidi au fanya vipimo vya awali.")
+
+        bot_reply = "\n".join(lines)
+        conv.pending_questions = []
+
+        payload = {
+            "response": bot_reply,
+            "symptoms": conv.symptoms,
+            "possible_diseases": predictions,
+            "enriched_predictions": enriched_predictions,
+            "top_advice": top_advice or {},
+            "confidence": conf,
+            "model_version": state.version,
+            "red_flags": red_flag,
+            "red_flag_details": red_hits,
+        }
+        return TurnResult(payload, bot_reply, final=True)
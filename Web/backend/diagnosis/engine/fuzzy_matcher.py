@@ -0,0 +1,100 @@
+"""
+Batched fuzzy symptom matching.
+
+All queries of a message (tokens, their 2- and 3-word windows joined like
+the vocabulary, e.g. "maumivu_ya_kichwa", and the whole text) are scored
+against the symptom vocabulary in one `rapidfuzz.process.cdist` call, so
+multi-word symptoms match as well as single words, and the ranked
+matches of every query are kept in a bounded LRU so frequent words
+("homa", "kichwa", ...) are never rescored.
+"""
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+Ranked = Tuple[Tuple[str, float], ...]
+
+
+def ngrams(tokens: Sequence[str], max_n: int = 3, joiner: str = "_") -> List[str]:
+    """The 2..max_n-token windows of `tokens`, joined like the symptom columns."""
+    return [joiner.join(tokens[i:i + n]) for n in range(2, max_n + 1) for i in range(len(tokens) - n + 1)]
+
+
+class FuzzySymptomMatcher:
+    """WRatio matcher over a fixed list of symptom names."""
+
+    def __init__(self, choices: Sequence[str], max_k: int = 8, cache_size: int = 4096, workers: int = -1):
+        self.choices = list(choices)
+        self.max_k = max_k
+        self.cache_size = cache_size
+        self.workers = workers
+        self._cache: "OrderedDict[str, Ranked]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _cached(self, query: str):
+        with self._lock:
+            ranked = self._cache.get(query)
+            if ranked is not None:
+                self._cache.move_to_end(query)
+                self.hits += 1
+            return ranked
+
+    def _store(self, items: Iterable[Tuple[str, Ranked]]):
+        with self._lock:
+            for query, ranked in items:
+                self._cache[query] = ranked
+                self._cache.move_to_end(query)
+                self.misses += 1
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rank(self, queries: Sequence[str]) -> List[Ranked]:
+        """Best `max_k` (symptom, score) pairs per query, highest score first."""
+        ranked: List[Ranked] = [()] * len(queries)
+        pending = {}
+        for i, q in enumerate(queries):
+            if not q:
+                continue
+            hit = self._cached(q)
+            if hit is None:
+                pending.setdefault(q, []).append(i)
+            else:
+                ranked[i] = hit
+
+        if pending and self.choices:
+            misses = list(pending)
+            scores = process.cdist(misses, self.choices, scorer=fuzz.WRatio,
+                                   dtype=np.float64, workers=self.workers)
+            # stable sort keeps vocabulary order on ties, like process.extract
+            order = np.argsort(-scores, axis=1, kind="stable")[:, : self.max_k]
+            fresh = []
+            for q, row, idx in zip(misses, scores, order):
+                result = tuple((self.choices[j], float(row[j])) for j in idx)
+                fresh.append((q, result))
+                for i in pending[q]:
+                    ranked[i] = result
+            self._store(fresh)
+        return ranked
+
+    @staticmethod
+    def select(ranked: Iterable[Ranked], top_k: int, threshold: float) -> Set[str]:
+        """Symptoms among the first `top_k` matches of each query scoring >= `threshold`."""
+        found = set()
+        for matches in ranked:
+            for match, score in matches[:top_k]:
+                if score >= threshold:
+                    found.add(match)
+        return found
+
+    def match(self, queries: Sequence[str], top_k: int = 6, threshold: float = 86) -> Set[str]:
+        return self.select(self.rank(queries), top_k, threshold)
+
+    def cache_clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
@@ -0,0 +1,158 @@
+"""
+Per-stage latency metrics for the smart-doctor pipeline.
+
+`METRICS.span("stage")` times a block with `perf_counter` and adds it to
+that stage's fixed-bucket histogram (a bisect and a few increments under a
+lock, so a span costs about a microsecond). Quantiles (p50/p95/p99) are
+estimated from the buckets, the same way Prometheus' `histogram_quantile`
+does. `render_prometheus()` writes everything in the Prometheus text format.
+
+`start_trace()` additionally records every span of the current thread until
+`stop_trace()`, which gives the per-request breakdown returned with
+`debug=true`.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# seconds; 50µs .. 10s
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)   # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> Tuple[List[int], int, float]:
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+    def quantile(self, q: float, counts: Optional[List[int]] = None) -> float:
+        """Estimate by linear interpolation inside the bucket holding rank q * count."""
+        if counts is None:
+            counts = self.snapshot()[0]
+        total = sum(counts)
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if seen + c >= rank and c:
+                if i == len(self.bounds):
+                    return self.bounds[-1]   # beyond the last bound; report the bound
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - seen) / c
+            seen += c
+        return self.bounds[-1]
+
+
+class _Span:
+    __slots__ = ("metrics", "stage", "start")
+
+    def __init__(self, metrics: "Metrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """Histograms per stage plus optional per-thread traces."""
+
+    def __init__(self, prefix: str = "shifaa_diagnosis", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(buckets)
+        self._stages: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, stage: str) -> _Span:
+        return _Span(self, stage)
+
+    def observe(self, stage: str, seconds: float):
+        hist = self._stages.get(stage)
+        if hist is None:
+            with self._lock:
+                hist = self._stages.setdefault(stage, Histogram(self.buckets))
+        hist.observe(seconds)
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.append((stage, seconds))
+
+    # -------------------------
+    # Per-request traces
+    # -------------------------
+    def start_trace(self):
+        self._local.trace = []
+
+    def stop_trace(self) -> List[Dict[str, float]]:
+        """Spans recorded since `start_trace` on this thread, in completion order (ms)."""
+        trace = getattr(self._local, "trace", None) or []
+        self._local.trace = None
+        return [{"stage": stage, "ms": round(seconds * 1000.0, 3)} for stage, seconds in trace]
+
+    # -------------------------
+    # Export
+    # -------------------------
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for stage, hist in sorted(self._stages.items()):
+            counts, count, total = hist.snapshot()
+            out[stage] = {
+                "count": count,
+                "mean_ms": (total / count * 1000.0) if count else 0.0,
+                **{f"p{int(q * 100)}_ms": hist.quantile(q, counts) * 1000.0 for q in QUANTILES},
+            }
+        return out
+
+    def render_prometheus(self) -> str:
+        name = f"{self.prefix}_stage_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each smart-doctor pipeline stage.",
+            f"# TYPE {name} histogram",
+        ]
+        quantile_lines = [
+            f"# HELP {name}_quantile Estimated stage latency quantiles (from the histogram buckets).",
+            f"# TYPE {name}_quantile gauge",
+        ]
+        for stage, hist in sorted(self._stages.items()):
+            counts, count, total = hist.snapshot()
+            cumulative = 0
+            for bound, c in zip(hist.bounds, counts):
+                cumulative += c
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {total:.9g}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+            for q in QUANTILES:
+                quantile_lines.append(
+                    f'{name}_quantile{{stage="{stage}",quantile="{q:g}"}} {hist.quantile(q, counts):.9g}')
+        return "\n".join(lines + quantile_lines) + "\n"
+
+
+# shared by the engine and the views
+METRICS = Metrics()
@@ -0,0 +1,154 @@
+"""
+Hot-reloadable model registry for the smart doctor.
+
+Everything a chat turn needs from the model (forest, vocabulary, class
+labels, symptom index, question tree, and the advice book and symptom
+matchers the engine builds for it) lives in one immutable `ServingState`. Requests take
+`MODEL_REGISTRY.current()` once and use that snapshot until they return, so a
+swap never changes the model under an in-flight request.
+
+A daemon thread per process polls `<bundle root>/CURRENT`; when it names a
+new version the bundle is loaded and warmed in that thread and then swapped
+in with a single reference assignment. `manage.py reload_model` rewrites the
+pointer, which is how an operator signals every worker.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence
+
+import numpy as np
+
+from .bundle import InferenceBundle, current_version, load_bundle
+from .question_tree import QuestionTree
+from .symptom_index import SymptomIndex
+
+logger = logging.getLogger(__name__)
+
+
+class ServingState:
+    """Immutable snapshot of one model version."""
+
+    def __init__(self, version: str, model, symptom_columns: Sequence[str], class_labels: Sequence[str],
+                 symptom_index: SymptomIndex, bundle: Optional[InferenceBundle] = None,
+                 question_tree: Optional[QuestionTree] = None):
+        self.version = version
+        self.model = model
+        self.symptom_columns = list(symptom_columns)
+        self.class_labels = list(class_labels)
+        self.symptom_index = symptom_index
+        self.bundle = bundle
+        self.question_tree = question_tree or QuestionTree.build(symptom_index)
+        self.column_pos = {s: i for i, s in enumerate(self.symptom_columns)}
+        # filled by the engine's state builder before the state is published
+        self.advice = None
+        self.alias_matcher = None
+        self.fuzzy_matcher = None
+        self.danger_sign_symptoms: Dict[str, FrozenSet[str]] = {}
+        # danger signs outside the prebuilt index (bounded LRU, see DiagnosisEngine.danger_sign_symptoms_for)
+        self.danger_sign_memo: "OrderedDict[str, FrozenSet[str]]" = OrderedDict()
+        self.memo_lock = threading.Lock()
+
+    @classmethod
+    def from_bundle(cls, bundle: InferenceBundle) -> "ServingState":
+        index = bundle.symptom_index()
+        return cls(bundle.version, bundle.model, bundle.symptom_columns, bundle.class_labels,
+                   index, bundle=bundle, question_tree=bundle.question_tree(index))
+
+    def vectorize(self, symptoms: Sequence[str]) -> np.ndarray:
+        v = np.zeros(len(self.symptom_columns), dtype=np.float32)
+        for s in symptoms:
+            i = self.column_pos.get(s)
+            if i is not None:
+                v[i] = 1.0
+        return v
+
+    def warm(self):
+        """Run canned predictions (empty row + one row per disease) and check their shape."""
+        index = self.symptom_index
+        rows = [[]] + [index.symptom_names(index.related_symptoms(1 << i)) for i in range(len(index.diseases))]
+        X = np.vstack([self.vectorize(r) for r in rows])
+        probs = self.model.predict_proba(X)
+        if probs.shape != (len(rows), len(self.class_labels)) or not np.all(np.isfinite(probs)):
+            raise ValueError(f"Model {self.version} returned unusable probabilities {probs.shape}")
+
+
+class ModelRegistry:
+    """Holds the active `ServingState` and swaps in new bundle versions."""
+
+    def __init__(self, root: str, initial: ServingState, poll_interval: float = 30.0,
+                 build_state: Callable[[InferenceBundle], ServingState] = ServingState.from_bundle):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.build_state = build_state
+        self._state = initial
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[ServingState, ServingState], None]] = []
+        self._failed_version: Optional[str] = None
+        self._watcher_pid: Optional[int] = None
+
+    def current(self) -> ServingState:
+        if self.poll_interval and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        return self._state
+
+    def add_listener(self, fn: Callable[[ServingState, ServingState], None]):
+        """`fn(old, new)` runs in the reloading thread right after every swap."""
+        self._listeners.append(fn)
+
+    # -------------------------
+    # Reloading
+    # -------------------------
+    def reload(self, version: Optional[str] = None) -> bool:
+        """Load, warm and activate `version` (default: the one named by CURRENT).
+
+        Returns True when a new version was swapped in. On failure the
+        current state is kept and the error is logged.
+        """
+        with self._lock:
+            version = version or current_version(self.root)
+            if not version or version == self._state.version:
+                return False
+            try:
+                bundle = load_bundle(os.path.join(self.root, version), mmap=True, verify=True)
+                new_state = self.build_state(bundle)
+                new_state.warm()
+            except Exception:
+                self._failed_version = version
+                logger.exception("Model %s failed to load; still serving %s", version, self._state.version)
+                return False
+
+            old_state, self._state = self._state, new_state
+            self._failed_version = None
+            logger.info("Model swapped %s -> %s", old_state.version, new_state.version)
+
+        for fn in list(self._listeners):
+            try:
+                fn(old_state, new_state)
+            except Exception:
+                logger.exception("Model swap listener %r failed", fn)
+        return True
+
+    def check(self) -> bool:
+        """Reload if CURRENT names a version that is neither active nor known to be broken."""
+        version = current_version(self.root)
+        if not version or version in (self._state.version, self._failed_version):
+            return False
+        return self.reload(version)
+
+    def _start_watcher(self):
+        # started lazily so every forked worker gets its own thread
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name="model-registry-watcher", daemon=True).start()
+
+    def _watch(self):
+        stop = threading.Event()
+        while not stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Model registry poll failed")
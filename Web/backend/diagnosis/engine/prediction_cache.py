@@ -0,0 +1,126 @@
+"""
+Bounded cache of final predictions.
+
+The model is deterministic, so a prediction depends only on the model
+version, the set of known symptoms and `top_n`. Results are kept in a
+per-process LRU with TTL, and optionally in Redis so every worker shares
+them. The model version is part of the key, and the local LRU is also
+cleared when the registry swaps models.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+try:
+    import redis
+except ImportError:  # optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, Tuple[str, ...], int]
+
+
+def prediction_key(model_version: str, symptoms: Iterable[str], top_n: int) -> CacheKey:
+    return (model_version, tuple(sorted(set(symptoms))), int(top_n))
+
+
+class PredictionCache:
+    """LRU + TTL cache of `(results, confidence)` with hit/miss counters."""
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 3600, redis_url: Optional[str] = None,
+                 prefix: str = "shifaa:pred"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.prefix = prefix
+        self._data: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.redis = None
+        if redis_url:
+            if redis is None:
+                raise ImportError("DIAGNOSIS_PREDICTION_CACHE_REDIS_URL needs the redis package (pip install redis)")
+            self.redis = redis.Redis.from_url(redis_url)
+
+    def _redis_key(self, key: CacheKey) -> str:
+        version, symptoms, top_n = key
+        return f"{self.prefix}:{version}:{top_n}:{','.join(symptoms)}"
+
+    def _get_local(self, key: CacheKey):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set_local(self, key: CacheKey, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _get_shared(self, key: CacheKey):
+        if self.redis is None:
+            return None
+        try:
+            raw = self.redis.get(self._redis_key(key))
+        except Exception:
+            logger.exception("Prediction cache: Redis unavailable")
+            return None
+        if not raw:
+            return None
+        results, conf = json.loads(raw)
+        return results, conf
+
+    def _set_shared(self, key: CacheKey, value):
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self._redis_key(key), json.dumps(value), ex=int(self.ttl))
+        except Exception:
+            logger.exception("Prediction cache: Redis unavailable")
+
+    def get_or_compute(self, key: CacheKey, compute: Callable[[], Tuple[list, str]]) -> Tuple[list, str]:
+        value = self._get_local(key)
+        if value is None:
+            value = self._get_shared(key)
+            if value is not None:
+                self._set_local(key, value)
+        # counters share the LRU lock; a bare += loses counts under concurrent requests
+        with self._lock:
+            if value is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if value is None:
+            value = compute()
+            self._set_local(key, value)
+            self._set_shared(key, value)
+        results, conf = value
+        # callers get their own dicts so they can't alter the cached entry
+        return [dict(r) for r in results], conf
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size, hits, misses = len(self._data), self.hits, self.misses
+        total = hits + misses
+        return {
+            "size": size,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / total) if total else 0.0,
+        }
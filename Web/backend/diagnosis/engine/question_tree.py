@@ -0,0 +1,106 @@
+"""
+Precomputed follow-up questions for the smart-doctor chat.
+
+For every candidate set the chat can reach (the disease x symptom data is
+split by "do you have symptom S?" answers), the best next question is the
+symptom with the highest information gain over the candidates, with a
+uniform prior. That is the symptom that splits the candidates most evenly.
+The table is built once per bundle and the chat does one dict lookup per
+turn. No question is returned when at most one candidate is left or when no
+symptom separates the remaining candidates, which is the signal to predict.
+"""
+import math
+from typing import Dict, Iterable, Optional
+
+from .symptom_index import SymptomIndex
+
+# safety net for much larger vocabularies: unreached masks are answered on the fly
+MAX_TREE_NODES = 200_000
+
+
+def _entropy_after(n_yes: int, n_no: int) -> float:
+    n = n_yes + n_no
+    h = 0.0
+    for k in (n_yes, n_no):
+        if k:
+            h += k / n * math.log2(k)
+    return h  # expected remaining entropy (log2 of set size, weighted)
+
+
+class QuestionTree:
+    """`{candidates_mask: symptom position}` plus the vocabulary to decode it."""
+
+    def __init__(self, index: SymptomIndex, nodes: Dict[int, int]):
+        self.index = index
+        self.nodes = nodes
+
+    # -------------------------
+    # Building
+    # -------------------------
+    @classmethod
+    def build(cls, index: SymptomIndex, max_nodes: int = MAX_TREE_NODES) -> "QuestionTree":
+        tree = cls(index, {})
+        start = index.all_diseases_mask
+        seen = {start}
+        stack = [start]
+        while stack and len(tree.nodes) < max_nodes:
+            mask = stack.pop()
+            pos = tree._best(mask, 0)
+            if pos is None:
+                continue
+            tree.nodes[mask] = pos
+            # every intersection with a symptom (initial candidate sets) and both answers
+            for s_mask in index.symptom_masks:
+                for child in (mask & s_mask, mask & ~s_mask):
+                    if child and child != mask and child not in seen:
+                        seen.add(child)
+                        stack.append(child)
+        return tree
+
+    def _best(self, mask: int, exclude: int) -> Optional[int]:
+        n = bin(mask).count("1")
+        if n <= 1:
+            return None
+        best, best_h = None, None
+        for pos, s_mask in enumerate(self.index.symptom_masks):
+            if exclude >> pos & 1:
+                continue
+            n_yes = bin(mask & s_mask).count("1")
+            if n_yes == 0 or n_yes == n:
+                continue  # does not separate the candidates
+            h = _entropy_after(n_yes, n - n_yes)
+            # ties go to the alphabetically first symptom, like the old sorted list
+            if best_h is None or h < best_h - 1e-12 or (
+                    abs(h - best_h) <= 1e-12 and self.index.symptoms[pos] < self.index.symptoms[best]):
+                best, best_h = pos, h
+        return best
+
+    # -------------------------
+    # Lookup
+    # -------------------------
+    def next_question(self, candidates_mask: int, known: Iterable[str] = ()) -> Optional[str]:
+        """Best symptom to ask about, or None when it is time to predict.
+
+        `known` (reported or already asked symptoms) is never returned; a
+        precomputed answer that is already known is recomputed without it.
+        """
+        mask = candidates_mask or 0
+        if bin(mask).count("1") <= 1:
+            return None
+        pos = self.nodes.get(mask)
+        known_mask = self.index.symptoms_mask(known)
+        if pos is None or known_mask >> pos & 1:
+            pos = self._best(mask, known_mask)
+        return self.index.symptoms[pos] if pos is not None else None
+
+    # -------------------------
+    # Persistence (JSON-friendly; masks can exceed 64 bits)
+    # -------------------------
+    def to_dict(self) -> Dict[str, object]:
+        return {"symptoms": list(self.index.symptoms), "nodes": {str(m): p for m, p in self.nodes.items()}}
+
+    @classmethod
+    def from_dict(cls, index: SymptomIndex, data: Dict[str, object]) -> "QuestionTree":
+        if list(data.get("symptoms") or []) != list(index.symptoms):
+            raise ValueError("Question tree was built for another symptom vocabulary")
+        return cls(index, {int(m): int(p) for m, p in (data.get("nodes") or {}).items()})
@@ -0,0 +1,122 @@
+"""
+Disease x symptom bitmask index for the smart-doctor question flow.
+
+The reference dataset is turned into plain Python ints once at load time:
+  - one mask per disease (bit i set -> disease shows symptom i)
+  - one mask per symptom (bit j set -> disease j shows the symptom)
+Candidate narrowing then becomes a handful of AND/OR operations instead of
+pandas filters over `df_full` on every chat turn.
+"""
+from typing import Iterable, List, Sequence
+
+
+def _iter_bits(mask: int):
+    """Yield the indices of the set bits in `mask`, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class SymptomIndex:
+    """Immutable disease x symptom index built from the reference dataset.
+
+    Several rows for the same disease are OR-ed together (the reference table
+    has one row per disease, so this matches the old row filters exactly).
+    """
+
+    def __init__(self, diseases: Sequence[str], symptoms: Sequence[str], rows: Iterable[Iterable[str]]):
+        self.diseases = tuple(diseases)
+        self.symptoms = tuple(symptoms)
+        self._disease_pos = {d: i for i, d in enumerate(self.diseases)}
+        self._symptom_pos = {s: i for i, s in enumerate(self.symptoms)}
+
+        disease_masks = [0] * len(self.diseases)
+        symptom_masks = [0] * len(self.symptoms)
+        for d_pos, present in enumerate(rows):
+            for s in present:
+                s_pos = self._symptom_pos.get(s)
+                if s_pos is None:
+                    continue
+                disease_masks[d_pos] |= 1 << s_pos
+                symptom_masks[s_pos] |= 1 << d_pos
+
+        self._disease_masks = tuple(disease_masks)
+        self._symptom_masks = tuple(symptom_masks)
+        self.all_diseases_mask = (1 << len(self.diseases)) - 1
+
+    @classmethod
+    def from_dataframe(cls, df: "pd.DataFrame", target_col: str, symptom_cols: Sequence[str]) -> "SymptomIndex":
+        """Build the index from the reference dataset (coerces cells to 0/1 once)."""
+        import pandas as pd  # only the legacy (non-bundle) path needs pandas
+
+        cols = [c for c in symptom_cols if c in df.columns]
+        values = df[cols].apply(pd.to_numeric, errors="coerce").fillna(0).astype(int) == 1
+        per_disease = values.groupby(df[target_col], sort=False).any()
+        diseases = df[target_col].dropna().unique().tolist()
+        rows = ([c for c in cols if per_disease.at[d, c]] for d in diseases)
+        return cls(diseases, cols, rows)
+
+    # -------------------------
+    # Encoding helpers
+    # -------------------------
+    def diseases_mask(self, diseases: Iterable[str]) -> int:
+        mask = 0
+        for d in diseases or []:
+            pos = self._disease_pos.get(d)
+            if pos is not None:
+                mask |= 1 << pos
+        return mask
+
+    def disease_names(self, mask: int) -> List[str]:
+        """Decode a disease mask (dataset order, like `Series.unique()`)."""
+        return [self.diseases[i] for i in _iter_bits(mask or 0)]
+
+    def symptoms_mask(self, symptoms: Iterable[str]) -> int:
+        mask = 0
+        for s in symptoms or []:
+            pos = self._symptom_pos.get(s)
+            if pos is not None:
+                mask |= 1 << pos
+        return mask
+
+    def symptom_names(self, mask: int) -> List[str]:
+        """Decode a symptom mask, sorted by name."""
+        return sorted(self.symptoms[i] for i in _iter_bits(mask or 0))
+
+    @property
+    def symptom_masks(self) -> tuple:
+        """Per symptom position, the mask of diseases showing it."""
+        return self._symptom_masks
+
+    def has_symptom(self, symptom: str) -> bool:
+        return symptom in self._symptom_pos
+
+    # -------------------------
+    # Set operations used by the chat flow
+    # -------------------------
+    def diseases_with_all(self, symptoms: Iterable[str]) -> int:
+        """Mask of diseases that show every symptom in `symptoms`."""
+        mask = self.all_diseases_mask
+        for s in symptoms:
+            pos = self._symptom_pos.get(s)
+            if pos is None:
+                return 0
+            mask &= self._symptom_masks[pos]
+        return mask
+
+    def related_symptoms(self, diseases_mask: int) -> int:
+        """Mask of symptoms shown by at least one of the candidate diseases."""
+        mask = 0
+        for i in _iter_bits(diseases_mask or 0):
+            mask |= self._disease_masks[i]
+        return mask
+
+    def filter_by_presence(self, diseases_mask: int, symptom: str, present: bool = True) -> int:
+        """Keep the candidates that do (or do not) show `symptom`."""
+        diseases_mask &= self.all_diseases_mask
+        pos = self._symptom_pos.get(symptom)
+        if pos is None:
+            return diseases_mask
+        with_symptom = self._symptom_masks[pos]
+        return diseases_mask & with_symptom if present else diseases_mask & ~with_symptom
@@ -0,0 +1,138 @@
+"""
+Text helpers for the diagnosis engine: tokenization and session topics.
+
+One spaCy pipeline per process serves both helpers. It is loaded on first
+use (not at import) with the components neither helper needs excluded, so
+only tok2vec/tagger/parser stay resident for noun chunks. Tokenization only
+runs the pipeline's tokenizer (`make_doc`).
+
+Modes (see `configure`):
+    "auto"   regex tokens for short messages, spaCy's tokenizer for longer ones
+    "spacy"  always use the spaCy tokenizer
+    "regex"  never load spaCy; topics fall back to the first words
+Both helpers fall back to plain string handling when spaCy or its models
+are not installed.
+"""
+import re
+import threading
+from typing import List, Optional, Sequence
+
+_TOKEN_RE = re.compile(r"[A-Za-zÀ-ÖØ-öø-ÿ_]+")
+
+MODES = ("auto", "spacy", "regex")
+DEFAULT_MODELS = ("sw_core_news_sm", "en_core_web_sm")
+# noun chunks need the tagger and parser only
+EXCLUDED_COMPONENTS = ["ner", "lemmatizer", "textcat", "textcat_multilabel", "entity_ruler", "entity_linker", "senter"]
+
+_config = {"mode": "auto", "models": DEFAULT_MODELS, "fast_path_chars": 80}
+_lock = threading.Lock()
+_nlp = None
+_loaded = False
+
+
+def configure(mode: Optional[str] = None, models: Optional[Sequence[str]] = None,
+              fast_path_chars: Optional[int] = None):
+    """Change the NLP settings; call before the first message is processed."""
+    global _nlp, _loaded
+    if mode is not None:
+        if mode not in MODES:
+            raise ValueError(f"Unknown NLP mode {mode!r}; expected one of {MODES}")
+        _config["mode"] = mode
+    if models is not None:
+        _config["models"] = tuple(models)
+    if fast_path_chars is not None:
+        _config["fast_path_chars"] = int(fast_path_chars)
+    with _lock:
+        _nlp, _loaded = None, False
+
+
+def get_nlp():
+    """The shared pipeline (loaded once), or None in regex mode / without spaCy."""
+    global _nlp, _loaded
+    if _loaded:
+        return _nlp
+    with _lock:
+        if _loaded:
+            return _nlp
+        nlp = None
+        if _config["mode"] != "regex":
+            try:
+                import spacy
+                for name in _config["models"]:
+                    try:
+                        nlp = spacy.load(name, exclude=EXCLUDED_COMPONENTS)
+                        break
+                    except Exception:
+                        continue
+                if nlp is None:
+                    nlp = spacy.blank("xx")
+            except Exception:
+                nlp = None
+        _nlp, _loaded = nlp, True
+        return nlp
+
+
+def regex_tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens without spaCy (the fast path of `tokenize`)."""
+    return _TOKEN_RE.findall(text.lower()) if text else []
+
+
+def tokenize(text: str) -> List[str]:
+    if not text:
+        return []
+    mode = _config["mode"]
+    if mode == "regex" or (mode == "auto" and len(text) <= _config["fast_path_chars"]):
+        return _TOKEN_RE.findall(text.lower())
+    nlp = get_nlp()
+    if not nlp:
+        return _TOKEN_RE.findall(text.lower())
+    doc = nlp.make_doc(text)
+    return [t.text.lower() for t in doc if not (t.is_space or t.is_punct)]
+
+
+def provisional_topic(text: str) -> str:
+    """Cheap topic (first words of the message), used until the spaCy topic is ready."""
+    if not text or not text.strip():
+        return "General Inquiry"
+    return " ".join(text.strip().split()[:3]).capitalize()
+
+
+def _topic_from_doc(doc, text: str) -> str:
+    keywords = [chunk.text for chunk in doc.noun_chunks if len(chunk.text.split()) <= 3]
+    return keywords[0].capitalize() if keywords else text.strip().split("\n")[0][:60].strip()
+
+
+def session_topic(text: str) -> str:
+    """Extract a short topic from the first user message."""
+    return session_topics([text])[0]
+
+
+def session_topics(texts: Sequence[str], batch_size: int = 32) -> List[str]:
+    """`session_topic` for many messages, parsed together with `nlp.pipe`."""
+    topics: List[Optional[str]] = [None] * len(texts)
+    todo = []
+    for i, text in enumerate(texts):
+        if not text:
+            topics[i] = "General Inquiry"
+        else:
+            todo.append(i)
+    if not todo:
+        return topics
+    nlp = get_nlp()
+    if not nlp:
+        # fallback: take first 3 words
+        for i in todo:
+            topics[i] = provisional_topic(texts[i])
+        return topics
+    try:
+        docs = nlp.pipe((texts[i].lower() for i in todo), batch_size=batch_size)
+        for i, doc in zip(todo, docs):
+            try:
+                topics[i] = _topic_from_doc(doc, texts[i])
+            except Exception:
+                topics[i] = texts[i].strip().split("\n")[0][:60].strip()
+    except Exception:
+        for i in todo:
+            if topics[i] is None:
+                topics[i] = texts[i].strip().split("\n")[0][:60].strip()
+    return topics
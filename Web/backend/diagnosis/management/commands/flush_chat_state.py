@@ -0,0 +1,28 @@
+# diagnosis/management/commands/flush_chat_state.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnosis.session_state import InMemoryStateStore, build_state_store, flush_dirty_sessions
+
+
+class Command(BaseCommand):
+    help = 'Write dirty smart-doctor session state from the state store back to ChatSession rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=500, help='Sessions written per round.')
+
+    def handle(self, *args, **options):
+        store = build_state_store()
+        if store is None:
+            self.stdout.write("ℹ️ DIAGNOSIS_STATE_BACKEND is not set; chat state already lives in Postgres.")
+            return
+        if isinstance(store, InMemoryStateStore):
+            raise CommandError("The 'memory' backend is per process; only the web process itself can flush it.")
+
+        total = 0
+        while True:
+            written = flush_dirty_sessions(store, limit=options['batch'])
+            total += written
+            if written < options['batch']:
+                break
+        self.stdout.write(self.style.SUCCESS(f"✅ Flushed {total} chat session(s) to Postgres."))
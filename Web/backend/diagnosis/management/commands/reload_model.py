@@ -0,0 +1,44 @@
+# diagnosis/management/commands/reload_model.py
+
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnosis.engine.bundle import BundleError, activate_version, current_version, list_versions
+
+
+class Command(BaseCommand):
+    help = 'Point the smart doctor at a published model bundle; running workers swap to it within their poll interval.'
+
+    def add_arguments(self, parser):
+        # not --version: BaseCommand already defines it (prints Django's version)
+        parser.add_argument('--bundle', help='Bundle version to activate (default: newest published bundle).')
+        parser.add_argument('--root', default=os.path.join(settings.BASE_DIR, 'ML', 'ML_TEST', 'bundles'),
+                            help='Bundle root directory.')
+        parser.add_argument('--list', action='store_true', help='List published versions and exit.')
+
+    def handle(self, *args, **options):
+        root = options['root']
+        versions = list_versions(root)
+        active = current_version(root)
+
+        if options['list']:
+            if not versions:
+                self.stdout.write(f"📭 No bundles published under {root}")
+            for v in versions:
+                self.stdout.write(f"{'*' if v == active else ' '} {v}")
+            return
+
+        version = options['bundle'] or (versions[-1] if versions else None)
+        if not version:
+            raise CommandError(f"No bundles published under {root}")
+        if version not in versions:
+            raise CommandError(f"Unknown bundle version {version!r} (see --list)")
+
+        try:
+            activate_version(root, version)
+        except (BundleError, OSError) as e:
+            raise CommandError(f"Bundle {version} is not loadable: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"✅ CURRENT -> {version} (was {active or 'none'})"))
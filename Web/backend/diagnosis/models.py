@@ -23,6 +23,13 @@ class ChatSession(models.Model):
     eliminated_diseases = models.JSONField(default=list)
     meta = models.JSONField(default=dict, blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination of session history lists (newest first)
+            models.Index(fields=['user', '-created_at', '-id'], name='chatsession_user_created_idx'),
+            models.Index(fields=['device_id', '-created_at', '-id'], name='chatsession_device_created_idx'),
+        ]
+
     def __str__(self):
         return f"Session {self.session_id} - {self.user.email}"
 
@@ -35,6 +42,12 @@ class Message(models.Model):
     text = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # keyset pagination / "since" sync of a session's history
+            models.Index(fields=['session', 'timestamp', 'id'], name='message_session_ts_idx'),
+        ]
+
     def __str__(self):
         return f"{'User' if self.is_user else 'Bot'}: {self.text[:30]}"
 
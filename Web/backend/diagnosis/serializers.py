@@ -21,6 +21,26 @@ class ChatSessionSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatSession
         fields = '__all__'
+
+class ChatSessionSummarySerializer(serializers.ModelSerializer):
+    """Session row for history lists: counts and a last-message preview instead of every message."""
+    user = serializers.SlugRelatedField(slug_field='email', read_only=True)
+    message_count = serializers.IntegerField(read_only=True)
+    last_message = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChatSession
+        fields = ['id', 'session_id', 'user', 'topic', 'created_at', 'device_id', 'symptoms',
+                  'message_count', 'last_message']
+
+    def get_last_message(self, obj):
+        if getattr(obj, 'last_message_at', None) is None:
+            return None
+        return {
+            'text': obj.last_message_text,
+            'is_user': obj.last_message_is_user,
+            'timestamp': obj.last_message_at,
+        }
 from rest_framework import serializers
 from .models import MedicalReport
 from rest_framework import serializers
@@ -0,0 +1,263 @@
+"""
+Live conversational state for smart-doctor sessions, with write-behind to Postgres.
+
+When `DIAGNOSIS_STATE_BACKEND` is set, `chat_with_doctor` reads and writes the
+session's working fields (symptoms, pending questions, meta, ...) in a state
+store instead of the `ChatSession` row:
+
+  - "redis":  shared by every worker (uses redis-py, already pulled in by channels_redis)
+  - "memory": per-process dict, for tests and single-process runs
+
+Changed sessions are marked dirty and copied back to `ChatSession` by
+`flush_dirty_sessions()` (background thread every `DIAGNOSIS_STATE_FLUSH_SECONDS`
+and `manage.py flush_chat_state`), and immediately when a conversation ends with
+a prediction. A dirty mark is only cleared after the row was written, and only
+if the state did not change meanwhile, so a crashed flush or a concurrent turn
+leaves the session dirty for the next round. Postgres stays the source of
+truth: a state that expired or was lost is reloaded from the row on the next
+turn.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import ChatSession
+
+try:
+    import redis
+except ImportError:  # optional
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# ChatSession fields the chat flow changes; they are what the store keeps and flushes
+STATE_FIELDS = ("user_id", "symptoms", "pending_questions", "confirmed_diseases", "eliminated_diseases", "meta")
+
+
+def session_to_state(session: ChatSession) -> Dict[str, Any]:
+    state = {f: getattr(session, f) for f in STATE_FIELDS}
+    state.update(pk=session.pk, session_id=str(session.session_id), device_id=session.device_id)
+    return state
+
+
+def session_from_state(state: Dict[str, Any]) -> ChatSession:
+    """Rebuild a detached `ChatSession` (no query) that saves back onto the existing row."""
+    session = ChatSession(pk=state["pk"], session_id=state["session_id"], device_id=state["device_id"],
+                          **{f: state.get(f) for f in STATE_FIELDS})
+    session._state.adding = False
+    session._state.db = "default"
+    return session
+
+
+# ========================================
+# Stores
+# ========================================
+class InMemoryStateStore:
+    """Process-local store with TTL; workers do not share it."""
+
+    def __init__(self, ttl: int = 3600):
+        self.ttl = ttl
+        self._data: Dict[str, tuple] = {}
+        self._dirty: set = set()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._data.get(session_id)
+            if item is None:
+                return None
+            expires, payload = item
+            if expires < time.monotonic():
+                del self._data[session_id]
+                return None
+            return json.loads(payload)
+
+    def put(self, session_id: str, state: Dict[str, Any], dirty: bool = False):
+        payload = json.dumps(state)
+        with self._lock:
+            self._data[session_id] = (time.monotonic() + self.ttl, payload)
+            if dirty:
+                self._dirty.add(session_id)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._data.pop(session_id, None)
+            self._dirty.discard(session_id)
+
+    def mark_clean(self, session_id: str):
+        with self._lock:
+            self._dirty.discard(session_id)
+
+    def mark_clean_if(self, session_id: str, state: Optional[Dict[str, Any]]) -> bool:
+        """Clear the dirty mark only if the stored state still equals `state` (None: no state)."""
+        with self._lock:
+            item = self._data.get(session_id)
+            current = json.loads(item[1]) if item is not None and item[0] >= time.monotonic() else None
+            if current != state:
+                return False
+            self._dirty.discard(session_id)
+            return True
+
+    def mark_dirty(self, session_ids: List[str]):
+        with self._lock:
+            self._dirty.update(session_ids)
+
+    def dirty_ids(self, limit: int = 500) -> List[str]:
+        """Up to `limit` dirty session ids; they stay dirty until `mark_clean_if`."""
+        with self._lock:
+            return list(islice(self._dirty, limit))
+
+
+class RedisStateStore:
+    """Shared store: one JSON value per session with TTL plus a set of dirty session ids."""
+
+    def __init__(self, url: str, ttl: int = 3600, prefix: str = "shifaa:chat"):
+        if redis is None:
+            raise ImportError("DIAGNOSIS_STATE_BACKEND='redis' needs the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.dirty_key = f"{prefix}:dirty"
+        # SREM the id only while the stored JSON is still the flushed one (a missing key reads as "")
+        self._clean_if = self.client.register_script(
+            "if (redis.call('GET', KEYS[1]) or '') == ARGV[1] then"
+            " return redis.call('SREM', KEYS[2], ARGV[2]) end return 0"
+        )
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.prefix}:{session_id}"
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(self._key(session_id))
+        return json.loads(raw) if raw else None
+
+    def put(self, session_id: str, state: Dict[str, Any], dirty: bool = False):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(session_id), json.dumps(state), ex=self.ttl)
+        if dirty:
+            pipe.sadd(self.dirty_key, session_id)
+        pipe.execute()
+
+    def delete(self, session_id: str):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(session_id))
+        pipe.srem(self.dirty_key, session_id)
+        pipe.execute()
+
+    def mark_clean(self, session_id: str):
+        self.client.srem(self.dirty_key, session_id)
+
+    def mark_clean_if(self, session_id: str, state: Optional[Dict[str, Any]]) -> bool:
+        """Clear the dirty mark only if the stored state still equals `state` (None: no state); atomic."""
+        expected = json.dumps(state) if state is not None else ""
+        return bool(self._clean_if(keys=[self._key(session_id), self.dirty_key], args=[expected, session_id]))
+
+    def mark_dirty(self, session_ids: List[str]):
+        if session_ids:
+            self.client.sadd(self.dirty_key, *session_ids)
+
+    def dirty_ids(self, limit: int = 500) -> List[str]:
+        """Up to `limit` dirty session ids; they stay dirty until `mark_clean_if`."""
+        ids = self.client.srandmember(self.dirty_key, limit) or []
+        return [i.decode() if isinstance(i, bytes) else i for i in ids]
+
+
+def build_state_store():
+    """Store configured in settings, or None when chat state lives in Postgres only."""
+    backend = getattr(settings, "DIAGNOSIS_STATE_BACKEND", None)
+    ttl = int(getattr(settings, "DIAGNOSIS_STATE_TTL", 3600))
+    if not backend:
+        return None
+    if backend == "memory":
+        return InMemoryStateStore(ttl=ttl)
+    if backend == "redis":
+        url = getattr(settings, "DIAGNOSIS_STATE_REDIS_URL", "redis://127.0.0.1:6379/1")
+        return RedisStateStore(url, ttl=ttl)
+    raise ValueError(f"Unknown DIAGNOSIS_STATE_BACKEND {backend!r}")
+
+
+# ========================================
+# Loading / write-behind
+# ========================================
+def load_chat_session(store, session_id: str, device_id: str) -> Optional[ChatSession]:
+    """Session from the store, falling back to (and re-seeding from) Postgres."""
+    if store is not None:
+        try:
+            state = store.get(str(session_id))
+        except Exception:
+            logger.exception("Chat state store unavailable; reading session %s from Postgres", session_id)
+            state = None
+        if state is not None:
+            return session_from_state(state) if state.get("device_id") == device_id else None
+
+    try:
+        session = ChatSession.objects.get(session_id=session_id, device_id=device_id)
+    except (ChatSession.DoesNotExist, ValueError):
+        return None
+    if store is not None:
+        try:
+            store.put(str(session.session_id), session_to_state(session))
+        except Exception:
+            logger.exception("Could not seed chat state for session %s", session_id)
+    return session
+
+
+def flush_dirty_sessions(store, limit: int = 500) -> int:
+    """Copy dirty session states back to their ChatSession rows; returns how many were written."""
+    if store is None:
+        return 0
+    written = 0
+    for sid in store.dirty_ids(limit):
+        state = store.get(sid)
+        if state is None:
+            # expired before it was flushed; the row keeps its last flushed value
+            store.mark_clean_if(sid, None)
+            continue
+        try:
+            with transaction.atomic():
+                ChatSession.objects.filter(pk=state["pk"]).update(**{f: state.get(f) for f in STATE_FIELDS})
+        except Exception:
+            logger.exception("Flushing chat state for session %s failed; will retry", sid)
+            continue  # still marked dirty
+        written += 1
+        # a turn that changed the state meanwhile keeps it dirty for the next round
+        store.mark_clean_if(sid, state)
+    return written
+
+
+class StateFlusher:
+    """Per-process daemon thread running `flush_dirty_sessions` every `interval` seconds."""
+
+    def __init__(self, store, interval: float):
+        self.store = store
+        self.interval = interval
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if not self.interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._run, name="chat-state-flusher", daemon=True).start()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.interval):
+            # long-lived thread: drop connections past CONN_MAX_AGE or broken by a DB restart
+            close_old_connections()
+            try:
+                flush_dirty_sessions(self.store)
+            except Exception:
+                logger.exception("Chat state flush failed")
+            finally:
+                close_old_connections()
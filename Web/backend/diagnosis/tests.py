@@ -1,3 +1,413 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.ensemble import RandomForestClassifier
+
+from account.models import CustomUser
+from backend.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+from .engine.advice import AdviceBook, build_auto_advice
+from .engine.alias_matcher import AliasMatcher
+from .engine.bundle import BundleError, build_bundle, current_version, load_bundle
+from .engine.compiled_forest import CompiledForest, compile_calibrated_forest
+from .engine.fuzzy_matcher import FuzzySymptomMatcher, ngrams
+from .engine.model_registry import ModelRegistry, ServingState
+from .engine.question_tree import QuestionTree, _entropy_after
+from .engine.symptom_index import SymptomIndex
+from .models import ChatSession
+from .session_state import InMemoryStateStore, flush_dirty_sessions, load_chat_session, session_to_state
+
+
+class SessionStateRoundTripTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            email="patient@example.com", password="secret", full_name="Test Patient", phone="0700000000", role="User",
+        )
+        self.session = ChatSession.objects.create(user=user, device_id="device-1", symptoms=["homa"])
+        self.sid = str(self.session.session_id)
+        self.store = InMemoryStateStore(ttl=60)
+
+    def test_load_seeds_store_from_postgres(self):
+        loaded = load_chat_session(self.store, self.sid, "device-1")
+        self.assertEqual(loaded.pk, self.session.pk)
+        self.assertEqual(self.store.get(self.sid)["symptoms"], ["homa"])
+        self.assertEqual(self.store.dirty_ids(), [])
+
+    def test_load_rejects_other_device(self):
+        load_chat_session(self.store, self.sid, "device-1")
+        self.assertIsNone(load_chat_session(self.store, self.sid, "device-2"))
+
+    def test_flush_writes_dirty_state_back(self):
+        session = load_chat_session(self.store, self.sid, "device-1")
+        session.symptoms = ["homa", "kikohozi"]
+        session.meta = {"turns": 2}
+        self.store.put(self.sid, session_to_state(session), dirty=True)
+
+        self.assertEqual(flush_dirty_sessions(self.store), 1)
+        row = ChatSession.objects.get(pk=self.session.pk)
+        self.assertEqual(row.symptoms, ["homa", "kikohozi"])
+        self.assertEqual(row.meta, {"turns": 2})
+        self.assertEqual(self.store.dirty_ids(), [])
+        self.assertEqual(load_chat_session(self.store, self.sid, "device-1").symptoms, ["homa", "kikohozi"])
+
+    def test_changed_state_stays_dirty(self):
+        session = load_chat_session(self.store, self.sid, "device-1")
+        state = session_to_state(session)
+        self.store.put(self.sid, state, dirty=True)
+        self.store.put(self.sid, dict(state, symptoms=["homa", "kuhara"]), dirty=True)
+
+        self.assertFalse(self.store.mark_clean_if(self.sid, state))
+        self.assertEqual(self.store.dirty_ids(), [self.sid])
+
+    def test_failed_flush_keeps_session_dirty(self):
+        session = load_chat_session(self.store, self.sid, "device-1")
+        self.store.put(self.sid, session_to_state(session), dirty=True)
+
+        with mock.patch.object(QuerySet, "update", side_effect=DatabaseError("down")):
+            self.assertEqual(flush_dirty_sessions(self.store), 0)
+        self.assertEqual(self.store.dirty_ids(), [self.sid])
+        self.assertEqual(flush_dirty_sessions(self.store), 1)
+
+
+def fit_small_forest(seed: int = 0):
+    """Binary symptom rows, four diseases, like the training data; returns (X, y, calibrated forest)."""
+    rng = np.random.RandomState(seed)
+    X = rng.randint(0, 2, size=(240, 12)).astype(np.float64)
+    labels = np.array(["malaria", "typhoid", "flu", "cholera"])
+    y = labels[(X[:, :4].argmax(axis=1) + rng.randint(0, 2, 240)) % 4]
+    forest = RandomForestClassifier(n_estimators=15, random_state=0)
+    clf = CalibratedClassifierCV(forest, method="sigmoid", cv=3)
+    clf.fit(X, y)
+    return X, y, clf
+
+
+def publish_small_bundle(root: str, seed: int = 0, activate: bool = True) -> str:
+    X, y, clf = fit_small_forest(seed)
+    columns = [f"dalili_{i}" for i in range(X.shape[1])]
+    diseases = sorted(set(y))
+    means = np.array([X[y == d].mean(axis=0) for d in diseases])
+    return build_bundle(
+        root, forest=compile_calibrated_forest(clf), symptom_columns=columns, class_labels=clf.classes_,
+        diseases=diseases, disease_symptom_means=means, advice={}, metadata={"seed": seed}, activate=activate,
+    )
+
+
+class CompiledForestParityTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.X, cls.y, cls.clf = fit_small_forest()
+
+    def test_predict_proba_matches_sklearn_exactly(self):
+        compiled = compile_calibrated_forest(self.clf)
+        self.assertTrue(np.array_equal(compiled.predict_proba(self.X), self.clf.predict_proba(self.X)))
+        self.assertTrue(np.array_equal(compiled.predict(self.X), self.clf.predict(self.X)))
+
+    def test_saved_forest_matches_sklearn_exactly(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "forest.npz")
+            compile_calibrated_forest(self.clf).save(path)
+            compiled = CompiledForest.load(path)
+        self.assertTrue(np.array_equal(compiled.predict_proba(self.X), self.clf.predict_proba(self.X)))
+
+
+class ReloadModelCommandTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+
+    def test_list_marks_the_active_bundle(self):
+        old = publish_small_bundle(self.root, seed=0)
+        new = publish_small_bundle(self.root, seed=1, activate=False)
+        out = StringIO()
+        call_command("reload_model", "--list", root=self.root, stdout=out)
+        self.assertCountEqual(out.getvalue().splitlines(), [f"* {old}", f"  {new}"])
+
+    def test_activates_the_named_bundle(self):
+        publish_small_bundle(self.root, seed=0)
+        new = publish_small_bundle(self.root, seed=1, activate=False)
+        call_command("reload_model", "--bundle", new, root=self.root, stdout=StringIO())
+        self.assertEqual(current_version(self.root), new)
+
+
+class CursorDecodingTests(SimpleTestCase):
+    def test_round_trip(self):
+        values = (datetime(2024, 5, 1, 8, 30, tzinfo=dt_timezone.utc), 42)
+        self.assertEqual(decode_cursor(encode_cursor(values), 2), values)
+
+    def test_rejects_forged_values(self):
+        for raw in ([None, 1], ["2024-05-01T08:30:00+00:00", 1.5], [[1], 1], [{}, 1], [True, 1],
+                    ["2024-13-45T00:00:00", 1], ["not a date", 1], [1, 2 ** 70]):
+            with self.subTest(raw=raw):
+                with self.assertRaises(InvalidCursor):
+                    decode_cursor(encode_cursor(raw), 2)
+
+    def test_rejects_garbage(self):
+        for token in ("", "%%%", encode_cursor([1])):
+            with self.subTest(token=token):
+                with self.assertRaises(InvalidCursor):
+                    decode_cursor(token, 2)
+
+
+# small disease x symptom table shared by the index and question tree tests
+DISEASE_SYMPTOMS = {
+    "malaria": ["homa", "baridi", "maumivu_ya_kichwa"],
+    "typhoid": ["homa", "maumivu_ya_tumbo", "maumivu_ya_kichwa"],
+    "flu": ["homa", "kikohozi", "mafua"],
+    "cholera": ["kuhara", "kutapika"],
+    "gastritis": ["maumivu_ya_tumbo", "kutapika"],
+}
+
+
+def small_index() -> SymptomIndex:
+    symptoms = sorted({s for row in DISEASE_SYMPTOMS.values() for s in row})
+    return SymptomIndex(list(DISEASE_SYMPTOMS), symptoms, DISEASE_SYMPTOMS.values())
+
+
+class SymptomIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = small_index()
+
+    def test_candidates_match_row_filters(self):
+        for symptoms in (["homa"], ["homa", "maumivu_ya_kichwa"], ["kutapika"], ["homa", "kuhara"], []):
+            with self.subTest(symptoms=symptoms):
+                expected = [d for d, row in DISEASE_SYMPTOMS.items() if set(symptoms) <= set(row)]
+                self.assertEqual(self.index.disease_names(self.index.diseases_with_all(symptoms)), expected)
+
+    def test_unknown_symptom_matches_nothing(self):
+        self.assertEqual(self.index.diseases_with_all(["homa", "haipo"]), 0)
+
+    def test_filter_and_related_symptoms(self):
+        fever = self.index.diseases_with_all(["homa"])
+        no_cough = self.index.filter_by_presence(fever, "kikohozi", present=False)
+        self.assertEqual(self.index.disease_names(no_cough), ["malaria", "typhoid"])
+        self.assertEqual(self.index.symptom_names(self.index.related_symptoms(no_cough)),
+                         ["baridi", "homa", "maumivu_ya_kichwa", "maumivu_ya_tumbo"])
+
+
+class QuestionTreeTests(SimpleTestCase):
+    def setUp(self):
+        self.index = small_index()
+        self.tree = QuestionTree.build(self.index)
+
+    def _expected(self, mask, known=()):
+        """Brute force: lowest expected entropy, ties to the alphabetically first symptom."""
+        n = bin(mask).count("1")
+        scored = []
+        for s in self.index.symptoms:
+            if s in known:
+                continue
+            n_yes = bin(mask & self.index.diseases_with_all([s])).count("1")
+            if 0 < n_yes < n:
+                scored.append((round(_entropy_after(n_yes, n - n_yes), 9), s))
+        return min(scored)[1] if scored else None
+
+    def test_every_node_asks_the_most_informative_symptom(self):
+        self.assertIn(self.index.all_diseases_mask, self.tree.nodes)
+        for mask in self.tree.nodes:
+            with self.subTest(candidates=self.index.disease_names(mask)):
+                self.assertEqual(self.tree.next_question(mask), self._expected(mask))
+
+    def test_known_symptoms_are_not_asked_again(self):
+        mask = self.index.all_diseases_mask
+        first = self.tree.next_question(mask)
+        second = self.tree.next_question(mask, known=[first])
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, self._expected(mask, known=[first]))
+
+    def test_stops_when_nothing_separates_the_candidates(self):
+        self.assertIsNone(self.tree.next_question(self.index.diseases_mask(["cholera"])))
+        self.assertIsNone(self.tree.next_question(0))
+
+    def test_round_trips_through_json(self):
+        loaded = QuestionTree.from_dict(self.index, self.tree.to_dict())
+        self.assertEqual(loaded.nodes, self.tree.nodes)
+        other = SymptomIndex(["x"], ["a"], [["a"]])
+        with self.assertRaises(ValueError):
+            QuestionTree.from_dict(other, self.tree.to_dict())
+
+
+class AliasMatcherTests(SimpleTestCase):
+    ALIASES = {
+        "fever": "homa", "high fever": "homa_kali", "homa kali": "homa_kali",
+        "chills": "baridi", "baridi": "baridi",
+        "headache": "maumivu_ya_kichwa", "kichwa kinauma": "maumivu_ya_kichwa",
+        "homa": "homa", "kuhara": "kuhara",
+    }
+
+    @staticmethod
+    def sorted_key_scan(aliases, text):
+        """The matcher it replaced: every alias found as a substring, longest first."""
+        lt = text.lower()
+        return {aliases[k] for k in sorted(aliases, key=len, reverse=True) if k in lt}
+
+    def test_matches_the_sorted_key_scan(self):
+        matcher = AliasMatcher(self.ALIASES)
+        for text in ("Nina fever na chills", "Headache tangu jana, pia kuhara", "kichwa kinauma sana",
+                     "BARIDI, homa.", "hakuna dalili", ""):
+            with self.subTest(text=text):
+                self.assertEqual(matcher.find(text), self.sorted_key_scan(self.ALIASES, text))
+
+    def test_longest_alias_wins_on_overlap(self):
+        matcher = AliasMatcher(self.ALIASES)
+        self.assertEqual(matcher.find("nina homa kali"), {"homa_kali"})
+        self.assertEqual(matcher.find("very high fever"), {"homa_kali"})
+
+    def test_aliases_must_sit_on_word_boundaries(self):
+        matcher = AliasMatcher(self.ALIASES)
+        self.assertEqual(matcher.find("mahoma"), set())
+        self.assertEqual(matcher.find("feverish"), set())
+
+
+class FuzzySymptomMatcherTests(SimpleTestCase):
+    COLUMNS = ["homa", "maumivu_ya_kichwa", "maumivu_ya_tumbo", "kikohozi", "kupumua_kwa_shida"]
+
+    def test_ngrams_join_like_the_columns(self):
+        self.assertEqual(ngrams(["maumivu", "ya", "kichwa"]), ["maumivu_ya", "ya_kichwa", "maumivu_ya_kichwa"])
+        self.assertEqual(ngrams(["homa"]), [])
+
+    def test_multi_word_symptom_matches_its_window_exactly(self):
+        matcher = FuzzySymptomMatcher(self.COLUMNS)
+        tokens = "nina maumivu ya kichwa".split()
+        ranked = matcher.rank(tokens + ngrams(tokens))
+        best = {matches[0] for matches in ranked if matches}
+        self.assertIn(("maumivu_ya_kichwa", 100.0), best)
+
+    def test_repeated_queries_come_from_the_cache(self):
+        matcher = FuzzySymptomMatcher(self.COLUMNS)
+        first = matcher.rank(["homa", "kikohozi"])
+        self.assertEqual(matcher.rank(["kikohozi", "homa"]), first[::-1])
+        self.assertEqual((matcher.hits, matcher.misses), (2, 2))
+
+
+class BundleLoadingTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, publish_small_bundle(tmp.name))
+
+    def test_loads_and_verifies(self):
+        bundle = load_bundle(self.path, verify=True)
+        self.assertEqual(bundle.diseases, ["cholera", "flu", "malaria", "typhoid"])
+
+    def test_corrupt_files_raise_bundle_error(self):
+        def truncate(name, size):
+            def corrupt(path):
+                with open(os.path.join(path, name), "r+b") as f:
+                    f.truncate(size)
+            return corrupt
+
+        def drop_manifest_field(path):
+            with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+                manifest = json.load(f)
+            del manifest["class_labels"]
+            with open(os.path.join(path, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+        cases = {
+            "manifest.json": truncate("manifest.json", 20),
+            "disease_symptom.npy": truncate("disease_symptom.npy", 60),
+            "forest array": truncate(os.path.join("forest", "left.npy"), 10),
+            "manifest field": drop_manifest_field,
+        }
+        for label, corrupt in cases.items():
+            with self.subTest(label), tempfile.TemporaryDirectory() as tmp:
+                copy = os.path.join(tmp, "copy")
+                shutil.copytree(self.path, copy)
+                corrupt(copy)
+                with self.assertRaises(BundleError):
+                    load_bundle(copy, mmap=False)
+
+
+class AdviceBookTests(SimpleTestCase):
+    COLUMNS = ["homa", "kikohozi", "kuhara"]
+
+    def setUp(self):
+        means = np.array([[0.9, 0.0, 0.0], [0.8, 0.6, 0.0], [0.0, 0.0, 0.7]])
+        self.auto = build_auto_advice(["malaria", "flu", "cholera"], self.COLUMNS, means)
+
+    def test_generated_entries_do_not_share_lists(self):
+        self.auto["malaria"]["vipimo"].append("edited")
+        self.auto["flu"]["dalili_za_kuangalia"].append("edited")
+        self.assertNotIn("edited", self.auto["cholera"]["vipimo"])
+        self.assertEqual(self.auto["cholera"]["dalili_za_kuangalia"], ["kuhara"])
+
+    def test_answers_are_copies(self):
+        book = AdviceBook({}, self.auto, default_advice={"tiba": ["muone daktari"]}, use_class_advice=True)
+        for name in ("flu", "unknown disease"):
+            with self.subTest(name):
+                book.auto_advice(name)["tiba"].append("edited")
+                self.assertNotIn("edited", book.auto_advice(name)["tiba"])
+        book.advice_for("ebola")["tiba"].append("edited")
+        self.assertEqual(book.advice_for("ebola")["tiba"], ["muone daktari"])
+        class_advice = {"flu": {"kinga": ["chanjo"]}}
+        book.advice_for("flu", class_advice)["kinga"].append("edited")
+        self.assertEqual(class_advice["flu"]["kinga"], ["chanjo"])
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        self.first = publish_small_bundle(self.root, seed=0)
+        self.registry = ModelRegistry(self.root, self._state(self.first), poll_interval=0)
+
+    def _state(self, version):
+        return ServingState.from_bundle(load_bundle(os.path.join(self.root, version)))
+
+    def test_check_swaps_to_the_new_current_version(self):
+        swaps = []
+        self.registry.add_listener(lambda old, new: swaps.append((old.version, new.version)))
+        before = self.registry.current()
+        second = publish_small_bundle(self.root, seed=1)
+
+        self.assertTrue(self.registry.check())
+        self.assertEqual(self.registry.current().version, second)
+        self.assertEqual(swaps, [(self.first, second)])
+        self.assertEqual(before.version, self.first)   # in-flight snapshots keep their model
+        self.assertFalse(self.registry.check())
+
+    def test_broken_version_keeps_the_current_state(self):
+        second = publish_small_bundle(self.root, seed=1)
+        os.remove(os.path.join(self.root, second, "disease_symptom.npy"))
+        with self.assertLogs("diagnosis.engine.model_registry", level="ERROR"):
+            self.assertFalse(self.registry.check())
+        self.assertEqual(self.registry.current().version, self.first)
+        self.assertFalse(self.registry.check())   # not retried until CURRENT changes
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        user = CustomUser.objects.create_user(
+            email="pager@example.com", password="secret", full_name="Pager", phone="0700000001", role="User",
+        )
+        for _ in range(7):
+            ChatSession.objects.create(user=user, device_id="device-p")
+        # ties on created_at must still be walked by id
+        same = ChatSession.objects.filter(user=user).order_by("id").first().created_at
+        ChatSession.objects.filter(user=user, id__in=list(
+            ChatSession.objects.filter(user=user).order_by("id").values_list("id", flat=True)[:4])
+        ).update(created_at=same)
+        self.qs = ChatSession.objects.filter(user=user)
+
+    def test_paged_walk_returns_every_row_once_in_order(self):
+        seen, cursor = [], None
+        for _ in range(10):
+            rows, cursor = keyset_page(self.qs, ("created_at", "id"), cursor=cursor, limit=3, descending=True)
+            seen.extend(r.id for r in rows)
+            if cursor is None:
+                break
+        expected = list(self.qs.order_by("-created_at", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
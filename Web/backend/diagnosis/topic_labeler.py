@@ -0,0 +1,85 @@
+"""
+Background topic labeling for new chat sessions.
+
+`create_session` stores a cheap provisional topic (the first words of the
+message) and hands the session to `TopicLabeler.submit`. A daemon thread
+per process collects up to `batch_size` queued sessions (waiting at most
+`max_wait_ms` once the first one arrives), parses their messages together
+with `nlp.pipe` and writes the topics back in one bulk UPDATE.
+
+Queued sessions live in process memory: a worker that exits before its
+batch ran leaves the provisional topic in place.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from django.db import close_old_connections
+
+from .engine.text import session_topics
+from .models import ChatSession
+
+logger = logging.getLogger(__name__)
+
+
+def label_sessions(items: List[Tuple[int, str]]) -> int:
+    """Compute topics for `(session pk, first message)` pairs and save them; returns rows written."""
+    if not items:
+        return 0
+    topics = session_topics([text for _, text in items])
+    sessions = [ChatSession(pk=pk, topic=topic[:255]) for (pk, _), topic in zip(items, topics)]
+    return ChatSession.objects.bulk_update(sessions, ["topic"]) or 0
+
+
+class TopicLabeler:
+    """Per-process queue + daemon thread labeling sessions in batches."""
+
+    def __init__(self, batch_size: int = 32, max_wait_ms: float = 500):
+        self.batch_size = max(1, int(batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[Tuple[int, str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+
+    def submit(self, session_pk: int, text: str):
+        self._ensure_started()
+        self._queue.put((session_pk, text))
+
+    def _ensure_started(self):
+        # the thread does not survive a fork, so every worker starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name="session-topic-labeler", daemon=True).start()
+
+    def _collect(self) -> List[Tuple[int, str]]:
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            # long-lived thread: drop connections past CONN_MAX_AGE or broken by a DB restart
+            close_old_connections()
+            try:
+                label_sessions(items)
+            except Exception:
+                logger.exception("Labeling %d session topics failed; provisional topics kept", len(items))
+            finally:
+                close_old_connections()
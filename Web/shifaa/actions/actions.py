@@ -1,7 +1,6 @@
 # 📦 Imports
-import pandas as pd
-import random
-import requests
+import os
+import sys
 
 from rasa_sdk import Action
 from rasa_sdk.events import SlotSet
@@ -9,100 +8,89 @@ from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.types import DomainDict
 from rasa_sdk import Tracker
 
-# 🗂️ Dataset path
-DATASET_PATH = "/home/masud/Desktop/SHIFAA_FYP/Web/malaria_dataset.csv"
+# 🗂️ The diagnosis engine lives in the Django backend but does not need Django
+BACKEND_DIR = os.environ.get(
+    "SHIFAA_BACKEND_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "backend"),
+)
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
 
-# 🧹 Helper to clean dalili
-def clean_symptom_list(symptom_string):
-    if isinstance(symptom_string, str):
-        return [s.strip().lower() for s in symptom_string.split(',') if s.strip()]
-    return []
+from diagnosis.engine import Conversation, get_engine  # noqa: E402
 
-# 🤖 Main Action
+
+def _conversation(tracker: Tracker) -> Conversation:
+    suggested = tracker.get_slot("suggested_symptom")
+    return Conversation(
+        symptoms=tracker.get_slot("symptoms") or [],
+        pending_questions=[suggested] if suggested else [],
+        meta=tracker.get_slot("diagnosis_meta") or {},
+    )
+
+
+def _slots(conv: Conversation):
+    return [
+        SlotSet("symptoms", conv.symptoms),
+        SlotSet("suggested_symptom", conv.pending_questions[0] if conv.pending_questions else None),
+        SlotSet("diagnosis_meta", conv.meta),
+    ]
+
+
+# 🤖 Main Action: same question flow as the web chat
 class ActionCollectSymptom(Action):
     def name(self):
         return "action_collect_symptom"
 
     def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: DomainDict):
-        current_symptoms = tracker.get_slot("symptoms") or []
-        suggested_symptom = tracker.get_slot("suggested_symptom")
-        user_input = tracker.latest_message.get("text", "").strip().lower()
-
-        affirm_words = ["ndio", "naam", "sahihi", "yap", "yeah"]
-        deny_words = ["hapana", "la", "sivyo", "hap", "si"]
-
-        if suggested_symptom:
-            if user_input in affirm_words and suggested_symptom not in current_symptoms:
-                current_symptoms.append(suggested_symptom)
-        else:
-            if user_input and user_input not in current_symptoms:
-                current_symptoms.append(user_input)
+        conv = _conversation(tracker)
+        user_input = tracker.latest_message.get("text", "").strip()
+        try:
+            result = get_engine().step(conv, user_input)
+        except Exception as e:
+            print(f"❌ Error in diagnosis engine: {e}")
+            dispatcher.utter_message(text="Tatizo la kuwasiliana na mfumo wa utambuzi wa ugonjwa.")
+            return [SlotSet("symptoms", conv.symptoms)]
 
-        if len(current_symptoms) >= 5:
-            return self._predict_and_respond(dispatcher, current_symptoms)
+        dispatcher.utter_message(text=result.payload["response"])
+        events = _slots(conv)
+        if result.final:
+            top = result.payload.get("possible_diseases") or []
+            events.append(SlotSet("disease_prediction", top[0]["disease"] if top else "Haijapatikana"))
+        return events
 
-        try:
-            df = pd.read_csv(DATASET_PATH)
-            df["Dalili"] = df["Dalili"].astype(str).str.lower()
-
-            possible_symptoms = set()
-            for _, row in df.iterrows():
-                disease_symptoms = clean_symptom_list(row["Dalili"])
-                if any(sym in disease_symptoms for sym in current_symptoms):
-                    for sym in disease_symptoms:
-                        if sym not in current_symptoms:
-                            possible_symptoms.add(sym)
-
-            if possible_symptoms:
-                next_symptom = random.choice(list(possible_symptoms))
-                dispatcher.utter_message(text=f"Je, unapata {next_symptom}?")
-                return [
-                    SlotSet("symptoms", current_symptoms),
-                    SlotSet("suggested_symptom", next_symptom)
-                ]
-            else:
-                dispatcher.utter_message(text="Ahsante. Tunaendelea na utambuzi...")
-                return [SlotSet("symptoms", current_symptoms)]
 
-        except Exception as e:
-            print(f"❌ Error reading dataset: {e}")
-            dispatcher.utter_message(text="Tatizo katika kusoma dataset ya dalili.")
-            return [SlotSet("symptoms", current_symptoms)]
+class ActionPredictDisease(Action):
+    def name(self):
+        return "action_predict_disease"
 
-    def _predict_and_respond(self, dispatcher: CollectingDispatcher, symptoms: list):
-        symptoms_text = ", ".join(symptoms)
+    def run(self, dispatcher: CollectingDispatcher, tracker: Tracker, domain: DomainDict):
+        symptoms = tracker.get_slot("symptoms") or []
         try:
-            response = requests.post(
-                "http://127.0.0.1:8000/api/diagnosis/",
-                json={"symptoms": symptoms_text}
-            )
-            if response.status_code == 200:
-                data = response.json()
-                prediction = data.get("prediction", "Haijapatikana")
-                vipimo = data.get("vipimo", "Hakuna")
-                tiba = data.get("tiba", "Hakuna")
-                kinga = data.get("kinga", "Hakuna")
-                ushauri = data.get("ushauri", "Hakuna")
-
-                message = (
-                    f"💡 *Ugonjwa:* {prediction}\n\n"
-                    f"🧪 *Vipimo:* {vipimo}\n"
-                    f"💊 *Tiba:* {tiba}\n"
-                    f"🛡️ *Kinga:* {kinga}\n"
-                    f"📌 *Ushauri:* {ushauri}"
-                )
-            else:
-                message = "Samahani, hatuwezi kupata majibu sasa."
-                prediction = "Haijapatikana"
-
+            engine = get_engine()
+            predictions, _ = engine.predict(symptoms, top_n=1)
+            prediction = predictions[0]["disease"] if predictions and symptoms else "Haijapatikana"
+            advice = engine.advice_for(prediction) if prediction != "Haijapatikana" else {}
         except Exception as e:
-            print(f"❌ Error during diagnosis API call: {e}")
-            message = "Tatizo la kuwasiliana na mfumo wa utambuzi wa ugonjwa."
-            prediction = "Haijapatikana"
-
+            print(f"❌ Error in diagnosis engine: {e}")
+            dispatcher.utter_message(text="Tatizo la kuwasiliana na mfumo wa utambuzi wa ugonjwa.")
+            return [SlotSet("disease_prediction", "Haijapatikana")]
+
+        def _join(key):
+            value = advice.get(key)
+            if isinstance(value, (list, tuple)):
+                value = "; ".join(value)
+            return value or "Hakuna"
+
+        message = (
+            f"💡 *Ugonjwa:* {prediction}\n\n"
+            f"🧪 *Vipimo:* {_join('vipimo')}\n"
+            f"💊 *Tiba:* {_join('tiba')}\n"
+            f"🛡️ *Kinga:* {_join('kinga')}\n"
+            f"📌 *Ushauri:* {_join('ushauri_wa_nyumbani')}"
+        )
         dispatcher.utter_message(text=message)
         return [
             SlotSet("symptoms", symptoms),
             SlotSet("suggested_symptom", None),
-            SlotSet("disease_prediction", prediction)
+            SlotSet("disease_prediction", prediction),
         ]